@@ -0,0 +1,39 @@
+"""Add follows table and denormalized follower counter on users
+
+Revision ID: 2566b6bea00e
+Revises: 63b9d9f2e95d
+Create Date: 2026-10-18 15:12:48.301764
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2566b6bea00e'
+down_revision = '63b9d9f2e95d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('follows',
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followee_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('follower_id', 'followee_id')
+    )
+    # the table is new and empty, no need to build it concurrently
+    op.create_index(
+        'ix_follows_followee_id_follower_id',
+        'follows',
+        ['followee_id', 'follower_id'],
+    )
+    op.add_column('users', sa.Column(
+        'follower_count', sa.Integer(), server_default='0', nullable=False
+    ))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'follower_count')
+    op.drop_index('ix_follows_followee_id_follower_id', table_name='follows')
+    op.drop_table('follows')
@@ -0,0 +1,87 @@
+"""Add full-text search vector on posts with a GIN index
+
+Revision ID: 38e756f7188e
+Revises: 2566b6bea00e
+Create Date: 2026-10-18 16:03:27.540219
+
+A trigger rather than a generated column: adding a stored generated
+column rewrites the whole table under an exclusive lock. The column is
+added empty, the trigger fills it for new and edited posts, existing
+posts are backfilled in batches, each committed on its own, and the index
+is built with CREATE INDEX CONCURRENTLY. The migration can run against a
+live database and be re-run if interrupted.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '38e756f7188e'
+down_revision = '2566b6bea00e'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    # IF NOT EXISTS and DROP first, for a re-run after a failed backfill
+    op.execute(
+        'ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector'
+    )
+    op.execute('DROP TRIGGER IF EXISTS posts_search_vector_update ON posts')
+    op.execute(
+        """
+        CREATE TRIGGER posts_search_vector_update
+        BEFORE INSERT OR UPDATE OF content ON posts
+        FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(
+            search_vector, 'pg_catalog.english', content
+        )
+        """
+    )
+
+    # CONCURRENTLY can not run inside a transaction block, and each batch
+    # commits so that its row locks are not held until the end
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_id = connection.execute(
+            sa.text('SELECT max(id) FROM posts')
+        ).scalar() or 0
+        for start in range(0, last_id, BATCH_SIZE):
+            connection.execute(
+                sa.text(
+                    """
+                    UPDATE posts
+                    SET search_vector = to_tsvector(
+                        'pg_catalog.english', coalesce(content, '')
+                    )
+                    WHERE id > :start AND id <= :end
+                      AND search_vector IS NULL
+                    """
+                ),
+                {'start': start, 'end': start + BATCH_SIZE},
+            )
+
+        # a failed concurrent build leaves an invalid index behind, drop
+        # it so that the migration can simply be re-run
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_posts_search_vector')
+        op.create_index(
+            'ix_posts_search_vector',
+            'posts',
+            ['search_vector'],
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_posts_search_vector',
+            table_name='posts',
+            postgresql_concurrently=True,
+        )
+    op.execute('DROP TRIGGER posts_search_vector_update ON posts')
+    op.drop_column('posts', 'search_vector')
@@ -0,0 +1,35 @@
+"""Add (user_id, id) index on posts for keyset pagination
+
+Revision ID: 5af9b4147ea2
+Revises: ab0f6a8e7db2
+Create Date: 2026-10-18 10:02:11.408135
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5af9b4147ea2'
+down_revision = 'ab0f6a8e7db2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY can not run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_posts_user_id_id',
+            'posts',
+            ['user_id', 'id'],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_posts_user_id_id',
+            table_name='posts',
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,66 @@
+"""Add indexes and uniqueness for likes, dislikes and users lookups
+
+Revision ID: 63b9d9f2e95d
+Revises: 709d77dcf49e
+Create Date: 2026-10-18 12:40:05.113946
+
+Indexes are built with CREATE INDEX CONCURRENTLY so the migration can run
+against a live database. posts.user_id is already covered by
+ix_posts_user_id_id and reactions by its (post_id, user_id) primary key.
+
+The unique users indexes fail if duplicate usernames or emails exist;
+resolve those by hand and re-run the migration.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '63b9d9f2e95d'
+down_revision = '709d77dcf49e'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_likes_post_id_user_id', 'likes', ['post_id', 'user_id']),
+    ('ix_dislikes_post_id_user_id', 'dislikes', ['post_id', 'user_id']),
+    ('ix_users_username', 'users', ['username']),
+    ('ix_users_email', 'users', ['email']),
+]
+
+
+def upgrade() -> None:
+    # keep the oldest row of each duplicated reaction
+    for table in ('likes', 'dislikes'):
+        op.execute(
+            f"""
+            DELETE FROM {table} AS newer
+            USING {table} AS older
+            WHERE newer.post_id = older.post_id
+              AND newer.user_id = older.user_id
+              AND newer.id > older.id
+            """
+        )
+
+    # CONCURRENTLY can not run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            # a failed concurrent build leaves an invalid index behind,
+            # drop it so that the migration can simply be re-run
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=True,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True
+            )
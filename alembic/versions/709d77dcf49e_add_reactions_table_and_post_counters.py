@@ -0,0 +1,69 @@
+"""Add reactions table and denormalized like/dislike counters on posts
+
+Revision ID: 709d77dcf49e
+Revises: 5af9b4147ea2
+Create Date: 2026-10-18 11:24:37.910552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '709d77dcf49e'
+down_revision = '5af9b4147ea2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('reactions',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.SmallInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('post_id', 'user_id')
+    )
+    op.add_column('posts', sa.Column(
+        'like_count', sa.Integer(), server_default='0', nullable=False
+    ))
+    op.add_column('posts', sa.Column(
+        'dislike_count', sa.Integer(), server_default='0', nullable=False
+    ))
+
+    # a user may have both a like and a dislike in the legacy tables,
+    # keep the like in that case
+    op.execute(
+        """
+        INSERT INTO reactions (post_id, user_id, value)
+        SELECT DISTINCT ON (post_id, user_id) post_id, user_id, value
+        FROM (
+            SELECT post_id, user_id, 1 AS value FROM likes
+            UNION ALL
+            SELECT post_id, user_id, -1 AS value FROM dislikes
+        ) AS legacy
+        WHERE user_id IS NOT NULL
+          AND post_id IN (SELECT id FROM posts)
+        ORDER BY post_id, user_id, value DESC
+        """
+    )
+    op.execute(
+        """
+        UPDATE posts
+        SET like_count = counts.likes,
+            dislike_count = counts.dislikes
+        FROM (
+            SELECT post_id,
+                   count(*) FILTER (WHERE value = 1) AS likes,
+                   count(*) FILTER (WHERE value = -1) AS dislikes
+            FROM reactions
+            GROUP BY post_id
+        ) AS counts
+        WHERE posts.id = counts.post_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'dislike_count')
+    op.drop_column('posts', 'like_count')
+    op.drop_table('reactions')
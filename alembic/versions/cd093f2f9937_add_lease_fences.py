@@ -0,0 +1,30 @@
+"""Add lease fences for the write-behind reaction flusher
+
+Revision ID: cd093f2f9937
+Revises: 38e756f7188e
+Create Date: 2026-10-18 17:21:09.662410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd093f2f9937'
+down_revision = '38e756f7188e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence('lease_fence_tokens')))
+    op.create_table('lease_fences',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('token', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('lease_fences')
+    op.execute(sa.schema.DropSequence(sa.Sequence('lease_fence_tokens')))
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
 from .endpoints.auth import router as auth_router
+from .endpoints.internal import router as internal_router
 from .endpoints.post import router as post_router
+from .endpoints.user import router as user_router
 
 
 api_router = APIRouter()
@@ -8,3 +10,10 @@ api_router = APIRouter()
 # example include router
 api_router.include_router(auth_router, prefix="/auth", tags=["auth"])
 api_router.include_router(post_router, prefix="/post", tags=["post"])
+api_router.include_router(user_router, prefix="/user", tags=["user"])
+api_router.include_router(
+    internal_router,
+    prefix="/internal",
+    tags=["internal"],
+    include_in_schema=False,
+)
@@ -17,7 +17,7 @@ async def signup(
 
 
 @router.post("/signin", response_model=AccessToken)
-async def signup(
+async def signin(
     login: LoginSchema,
     service: SignInService = Depends(SignInService),
 ):
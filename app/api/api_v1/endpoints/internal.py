@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import JSONResponse
+
+from app.api.deps import internal_token
+from app.db.cache import cache_bus, post_cache
+from app.db.pool import engine_pool_stats
+from app.db.redis import redis
+from app.db.replicas import replicas
+from app.db.session import async_engine
+from app.workers.counters import counter_auditor
+from app.workers.reactions import reaction_flusher
+
+router = APIRouter()
+
+# all but the readiness probe
+operators_only = [Depends(internal_token)]
+
+
+@router.get("/cache", dependencies=operators_only)
+async def cache_stats():
+    """Hit/miss counters of the caches, for sizing them."""
+    stats = {
+        name: cache.stats() for name, (cache, _) in cache_bus.caches.items()
+    }
+    stats["post_redis"] = post_cache.stats()
+    return stats
+
+
+@router.get("/replicas", dependencies=operators_only)
+async def replica_stats():
+    """Health, lag and checked out connections of the read replicas."""
+    return replicas.stats()
+
+
+@router.get("/pools", dependencies=operators_only)
+async def pool_stats():
+    """Live gauges of the connection pools of this worker, waiters and
+    long waits mean a pool is exhausted."""
+    return {
+        "db": {
+            "primary": engine_pool_stats(async_engine),
+            "replicas": [
+                engine_pool_stats(replica.engine)
+                for replica in replicas.replicas
+            ],
+        },
+        "redis": redis.redis.connection_pool.stats(),
+    }
+
+
+@router.get("/reactions", dependencies=operators_only)
+async def reaction_stats():
+    """Write-behind lag, reactions not yet in Postgres, and what the
+    flusher of this worker stored."""
+    return await reaction_flusher.stats()
+
+
+@router.get("/counters", dependencies=operators_only)
+async def counter_stats():
+    """Posts whose Redis reaction counters this worker audited, and how
+    many of them had drifted from Postgres and were repaired."""
+    return counter_auditor.stats()
+
+
+@router.get("/ready")
+async def readiness(request: Request):
+    """Succeeds once the worker started up and warmed its pools."""
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(
+            {"ready": False}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    return {"ready": True}
@@ -1,7 +1,19 @@
-from fastapi import APIRouter, Depends
+from typing import List, Optional
 
+from fastapi import APIRouter, Depends, Query
+
+from app.core.config import settings
 from app.db_models.user import UserModel
-from app.models.post import PostIn, Post, PostInUpdate, ResponseGetPost
+from app.models.post import (
+    PostIn,
+    Post,
+    PostInUpdate,
+    ResponseBatchGetPost,
+    ResponseGetPost,
+    ResponseListPosts,
+    ResponseSearchPosts,
+    ResponseTrendingPosts,
+)
 from app.services.post import (
     CreatePostService,
     UpdatePostService,
@@ -11,12 +23,79 @@ from app.services.post import (
     DisLikePostService,
     UnDisLikePostService,
     GetPostService,
+    ListPostsService,
+    BatchGetPostService,
+    TrendingPostsService,
+    TimelineService,
+    SearchPostsService,
 )
 from app.utils.user import get_current_user
 
 router = APIRouter()
 
 
+@router.get("", response_model=ResponseListPosts)
+async def list_posts(
+    cursor: Optional[int] = None,
+    limit: int = Query(
+        settings.POSTS_PAGE_SIZE, ge=1, le=settings.POSTS_MAX_PAGE_SIZE
+    ),
+    user_id: Optional[int] = None,
+    service: ListPostsService = Depends(ListPostsService),
+):
+    return await service.execute(limit, cursor=cursor, user_id=user_id)
+
+
+@router.get("/batch", response_model=ResponseBatchGetPost)
+async def get_posts_batch(
+    ids: List[int] = Query(
+        ..., min_items=1, max_items=settings.POSTS_BATCH_MAX_IDS
+    ),
+    service: BatchGetPostService = Depends(BatchGetPostService),
+):
+    return await service.execute(ids)
+
+
+# before /{post_id}, which would take "search", "trending" or "timeline"
+# for an id
+@router.get("/search", response_model=ResponseSearchPosts)
+async def search_posts(
+    q: str = Query(..., min_length=1, max_length=256),
+    cursor: Optional[str] = None,
+    limit: int = Query(
+        settings.POSTS_PAGE_SIZE, ge=1, le=settings.POSTS_MAX_PAGE_SIZE
+    ),
+    user_id: Optional[int] = None,
+    service: SearchPostsService = Depends(SearchPostsService),
+):
+    return await service.execute(q, limit, cursor=cursor, user_id=user_id)
+
+
+@router.get("/trending", response_model=ResponseTrendingPosts)
+async def trending_posts(
+    window: str = Query(
+        "day", regex=f"^({'|'.join(settings.TRENDING_HALF_LIVES)})$"
+    ),
+    limit: int = Query(
+        settings.POSTS_PAGE_SIZE, ge=1, le=settings.POSTS_MAX_PAGE_SIZE
+    ),
+    service: TrendingPostsService = Depends(TrendingPostsService),
+):
+    return await service.execute(window, limit)
+
+
+@router.get("/timeline", response_model=ResponseListPosts)
+async def timeline(
+    cursor: Optional[int] = None,
+    limit: int = Query(
+        settings.POSTS_PAGE_SIZE, ge=1, le=settings.POSTS_MAX_PAGE_SIZE
+    ),
+    current_user: UserModel = Depends(get_current_user),
+    service: TimelineService = Depends(TimelineService),
+):
+    return await service.execute(current_user.id, limit, cursor=cursor)
+
+
 @router.get("/{post_id}", response_model=ResponseGetPost)
 async def get_post(
     post_id: int,
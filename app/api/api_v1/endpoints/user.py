@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+
+from app.db_models.user import UserModel
+from app.services.user import FollowService, UnfollowService
+from app.utils.user import get_current_user
+
+router = APIRouter()
+
+
+@router.post("/{user_id}/follow")
+async def follow_user(
+    user_id: int,
+    current_user: UserModel = Depends(get_current_user),
+    service: FollowService = Depends(FollowService),
+):
+    return await service.execute(user_id, current_user)
+
+
+@router.delete("/{user_id}/unfollow")
+async def unfollow_user(
+    user_id: int,
+    current_user: UserModel = Depends(get_current_user),
+    service: UnfollowService = Depends(UnfollowService),
+):
+    return await service.execute(user_id, current_user)
@@ -1,14 +1,20 @@
-from fastapi import Request, HTTPException
+import hmac
+
+import jwt
+from fastapi import Header, Request, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+from app.core.config import settings
 from app.utils.jwt import decode_token
 
 
 class JWTBearer(HTTPBearer):
+    """Verifies the bearer token once and returns its claims."""
+
     def __init__(self, auto_error: bool = True):
         super(JWTBearer, self).__init__(auto_error=auto_error)
 
-    async def __call__(self, request: Request):
+    async def __call__(self, request: Request) -> dict:
         credentials: HTTPAuthorizationCredentials = await super(
             JWTBearer, self
         ).__call__(request)
@@ -17,27 +23,22 @@ class JWTBearer(HTTPBearer):
                 raise HTTPException(
                     status_code=403, detail="Invalid authentication scheme."
                 )
-            if not self.verify_jwt(credentials.credentials):
+            try:
+                return decode_token(credentials.credentials)
+            except jwt.PyJWTError:
                 raise HTTPException(
                     status_code=403, detail="Invalid token or expired token."
                 )
-            return credentials.credentials
         else:
             raise HTTPException(
                 status_code=403, detail="Invalid authorization code."
             )
-    @staticmethod
-    def verify_jwt(jwt_token: str) -> bool:
-        isTokenValid: bool = False
-
-        try:
-            payload = decode_token(jwt_token)
-        except Exception as e:
-            payload = None
-
-        if payload:
-            isTokenValid = True
-
-        return isTokenValid
 
 
+async def internal_token(x_internal_token: str = Header("")) -> None:
+    """Guards the operational endpoints, they expose the internals of the
+    worker and are not for API clients."""
+    if not settings.INTERNAL_API_TOKEN or not hmac.compare_digest(
+        x_internal_token, settings.INTERNAL_API_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="Invalid internal token.")
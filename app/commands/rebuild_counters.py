@@ -0,0 +1,74 @@
+"""Rebuilds the Redis reaction counters and member sets from Postgres.
+
+    python -m app.commands.rebuild_counters
+
+For after Redis lost its data, or to fix counters that drifted. Every post
+is rewritten in one pass over the reactions, the posts of a batch in one
+pipelined MULTI.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import List, Optional
+
+from app.db.redis import redis
+from app.db.session import AsyncSessionLocal, async_engine
+from app.workers.counters import rebuild_counters
+from app.workers.reactions import reaction_flusher
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.commands.rebuild_counters",
+        description=__doc__.split("\n")[0],
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="posts written to Redis per pipeline",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="rebuild even though write-behind reactions are not stored "
+        "in Postgres yet, they are lost from the counters",
+    )
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        lag = await reaction_flusher.lag()
+        if lag["entries"] and not args.force:
+            print(
+                f"{lag['entries']} write-behind reactions are not in "
+                "Postgres yet, wait for the flusher or use --force",
+                file=sys.stderr,
+            )
+            return 1
+
+        started_at = time.perf_counter()
+        async with AsyncSessionLocal() as session:
+            # one snapshot of all the reactions
+            await session.connection(
+                execution_options={"isolation_level": "REPEATABLE READ"}
+            )
+            posts = await rebuild_counters(session, args.batch_size)
+        print(
+            f"Rebuilt the counters of {posts} posts in "
+            f"{time.perf_counter() - started_at:.1f}s"
+        )
+        return 0
+    finally:
+        await async_engine.dispose()
+        await redis.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return asyncio.run(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,14 +16,33 @@ class Settings(BaseSettings):
 
     API_V1_PREFIX: str = "/api/v1"
     SECRET_KEY: str
+    # sent as X-Internal-Token to the /internal stats endpoints, which
+    # are refused while it is empty
+    INTERNAL_API_TOKEN: str = ""
 
     ACCESS_TOKEN_EXPIRES_IN: int = 60
     TOKEN_ALGORITHM = "HS256"
     ACCESS_TOKEN_JWT_SUBJECT = "access"
 
+    # new hashes use this scheme, others are upgraded on signin
+    PASSWORD_HASHER: str = "bcrypt"
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    # hashes computed at once, per worker
+    PASSWORD_HASH_WORKERS: int = 4
+
     EMAILHUNTER_API_KEY: str = ""
     CLEARBIT_API_KEY: str = ""
 
+    EMAIL_VERIFIER_URL: str = "https://api.hunter.io/v2/email-verifier"
+    # seconds, for each of connect, read, write and waiting for a slot
+    EMAIL_VERIFIER_TIMEOUT: float = 3.0
+    EMAIL_VERIFIER_MAX_CONNECTIONS: int = 10
+    EMAIL_VERIFIER_MAX_CONCURRENCY: int = 20
+    EMAIL_VERIFIER_FAILURE_THRESHOLD: int = 5
+    EMAIL_VERIFIER_RESET_TIMEOUT: int = 30
+    EMAIL_VERIFIER_CACHE_TTL: int = 7 * 24 * 60 * 60
+    EMAIL_VERIFIER_INVALID_CACHE_TTL: int = 60 * 60
+
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = [
         "http://localhost",
         "http://localhost:8000",
@@ -49,8 +68,106 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     DB_URI: Optional[PostgresDsn] = None
 
+    # per engine, so per worker and per replica
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    # seconds to wait for a connection before failing
+    DB_POOL_TIMEOUT: float = 30
+    # seconds before a connection is replaced, -1 to keep them
+    DB_POOL_RECYCLE: int = 1800
+    # ping on checkout; without it dead connections are only noticed by
+    # the failing query, lean on DB_POOL_RECYCLE then
+    DB_POOL_PRE_PING: bool = True
+    # connections opened at startup, up to DB_POOL_SIZE
+    DB_POOL_PREWARM: int = 5
+
+    # postgresql+asyncpg URIs, reads go to the primary when empty
+    DB_REPLICA_URIS: List[str] = []
+    # round_robin or least_connections
+    DB_REPLICA_BALANCING: str = "round_robin"
+    # seconds
+    DB_REPLICA_MAX_LAG: float = 5.0
+    DB_REPLICA_CHECK_INTERVAL: float = 1.0
+    # read-your-writes window, keep it above DB_REPLICA_MAX_LAG
+    DB_PRIMARY_PIN_TTL: int = 10
+
+    @validator("DB_REPLICA_URIS", pre=True)
+    def assemble_replica_uris(
+        cls, v: Union[str, List[str]]
+    ) -> Union[List[str], str]:
+        """Supports JSON list, actual list, comma-separated list."""
+
+        if isinstance(v, str) and not v.startswith("["):
+            return [i.strip() for i in v.split(",") if i.strip()]
+        return v
+
+    # count the SQL statements of every request, or of those sending the
+    # header set to INTERNAL_API_TOKEN; the count is sent back in the same
+    # header
+    QUERY_COUNTER_ENABLED: bool = False
+    QUERY_COUNTER_HEADER: str = "X-Query-Count"
+    # identical statements in a request reported as a likely N+1
+    QUERY_N_PLUS_ONE_THRESHOLD: int = 3
+
     REDIS_HOST: str
     REDIS_PORT: int
+    REDIS_MAX_CONNECTIONS: int = 50
+    # seconds to wait for a free connection once all are in use
+    REDIS_POOL_TIMEOUT: float = 5
+    REDIS_POOL_PREWARM: int = 5
+
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: int = 60
+    TOKEN_CACHE_SIZE: int = 10000
+
+    POST_CACHE_TTL: int = 300
+    POST_CACHE_MISSING_TTL: int = 30
+    # per worker, in front of the Redis post cache
+    POST_LOCAL_CACHE_SIZE: int = 10000
+    POST_LOCAL_CACHE_TTL: int = 5
+    POST_LOCAL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # likes and dislikes are applied to Redis and queued on a Redis stream,
+    # the flusher writes them to Postgres in batches. Redis must persist
+    # (AOF); keep it on until the lag is 0 before turning it off.
+    REACTIONS_WRITE_BEHIND: bool = False
+    REACTIONS_STREAM: str = "reactions:stream"
+    # seconds the flusher waits for new reactions before a partial batch
+    REACTIONS_FLUSH_INTERVAL: float = 0.5
+    REACTIONS_FLUSH_BATCH_SIZE: int = 1000
+    # seconds; one flusher at a time, another takes over once it expires
+    REACTIONS_FLUSHER_LEASE: float = 10
+    # one worker at a time compares the Redis reaction counters of a sample
+    # of posts with Postgres every interval (seconds) and repairs them
+    COUNTER_AUDIT_ENABLED: bool = False
+    COUNTER_AUDIT_INTERVAL: float = 60
+    COUNTER_AUDIT_SAMPLE_SIZE: int = 100
+
+    # seconds; a reaction counts half as much in the trending order of a
+    # window after its half-life, GET /post/trending?window=<name>
+    TRENDING_HALF_LIVES: Dict[str, float] = {
+        "hour": 60 * 60,
+        "day": 24 * 60 * 60,
+        "week": 7 * 24 * 60 * 60,
+    }
+    # posts kept per window, the rest is trimmed every interval (seconds)
+    TRENDING_MAX_POSTS: int = 10000
+    TRENDING_MAINTENANCE_INTERVAL: float = 60
+
+    POSTS_PAGE_SIZE: int = 20
+    POSTS_MAX_PAGE_SIZE: int = 100
+    POSTS_BATCH_MAX_IDS: int = 100
+
+    # new posts are fanned out on write to the Redis timeline of each
+    # follower, except those of authors with at least this many followers:
+    # their recent posts are merged into the timelines of followers on read
+    TIMELINE_CELEBRITY_THRESHOLD: int = 10000
+    # post ids kept per timeline and author, older pages come from Postgres
+    TIMELINE_MAX_POSTS: int = 800
+    # seconds a timeline is kept once no longer read, then rebuilt on read
+    TIMELINE_TTL: int = 7 * 24 * 60 * 60
+    # followers read and written to Redis at once by a fan-out
+    TIMELINE_FAN_OUT_BATCH_SIZE: int = 1000
 
     @validator("DB_URI", pre=True)
     def assemble_db_uri(
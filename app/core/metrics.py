@@ -0,0 +1,274 @@
+"""Per route request metrics, exported in the Prometheus text format.
+
+The middleware opens a `RequestStats` for every HTTP request in a context
+variable; the SQLAlchemy and Redis hooks add to the one of the request
+they run for. Everything is kept in process, per worker.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# seconds, as the Prometheus client defaults
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class RequestStats:
+    __slots__ = ("sql_count", "sql_time", "redis_count", "redis_time")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.redis_count = 0
+        self.redis_time = 0.0
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    return ",".join(
+        f'{name}="{escape(str(value))}"' for name, value in zip(names, values)
+    )
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} counter",
+        ]
+        for labels, value in self.values.items():
+            label_text = format_labels(self.labels, labels)
+            name = f"{self.name}{{{label_text}}}" if label_text else self.name
+            lines.append(f"{name} {value}")
+        return lines
+
+
+class Gauge:
+    """A value set from outside, such as a queue length."""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value: Optional[float] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} gauge",
+        ]
+        if self.value is not None:
+            lines.append(f"{self.name} {self.value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...],
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket, the last one for +Inf], sum
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0]
+
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, (counts, total) in self.series.items():
+            label_text = format_labels(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling requests.",
+    ("handler", "method"),
+)
+requests_total = Counter(
+    "http_requests_total",
+    "Requests handled.",
+    ("handler", "method", "status"),
+)
+db_statements = Counter(
+    "http_request_db_statements_total",
+    "SQL statements executed while handling requests.",
+    ("handler",),
+)
+db_time = Counter(
+    "http_request_db_seconds_total",
+    "Time spent in SQL statements while handling requests.",
+    ("handler",),
+)
+redis_commands = Counter(
+    "http_request_redis_commands_total",
+    "Redis round trips, commands or pipelines, while handling requests.",
+    ("handler",),
+)
+redis_time = Counter(
+    "http_request_redis_seconds_total",
+    "Time spent in Redis round trips while handling requests.",
+    ("handler",),
+)
+
+reactions_lag_entries = Gauge(
+    "reactions_write_behind_lag_entries",
+    "Reactions queued on the stream and not yet stored in Postgres.",
+)
+reactions_lag_seconds = Gauge(
+    "reactions_write_behind_lag_seconds",
+    "Age of the oldest reaction not yet stored in Postgres.",
+)
+reactions_flushed = Counter(
+    "reactions_write_behind_flushed_total",
+    "Queued reactions stored in Postgres by this worker.",
+    (),
+)
+reaction_counters_audited = Counter(
+    "reaction_counters_audited_total",
+    "Posts whose Redis reaction counters were compared with Postgres.",
+    (),
+)
+reaction_counters_drifted = Counter(
+    "reaction_counters_drifted_total",
+    "Audited posts whose Redis reaction counters were wrong and repaired.",
+    (),
+)
+reaction_counters_drift_rate = Gauge(
+    "reaction_counters_drift_rate",
+    "Share of the posts of the last audit whose counters had drifted.",
+)
+
+METRICS = (
+    request_duration,
+    requests_total,
+    db_statements,
+    db_time,
+    redis_commands,
+    redis_time,
+    reactions_lag_entries,
+    reactions_lag_seconds,
+    reactions_flushed,
+    reaction_counters_audited,
+    reaction_counters_drifted,
+    reaction_counters_drift_rate,
+)
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def record_redis(elapsed: float) -> None:
+    stats = request_stats.get()
+    if stats is not None:
+        stats.redis_count += 1
+        stats.redis_time += elapsed
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("query_started_at", []).append(perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    started_at = conn.info["query_started_at"].pop()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_time += perf_counter() - started_at
+
+
+class MetricsMiddleware:
+    """Records the latency and the DB and Redis work of every request,
+    labelled with the name of the endpoint function that handled it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status = 500
+        started_at = perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - started_at
+            request_stats.reset(token)
+
+            # the router stores the matched endpoint in the scope
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "unmatched")
+            method = scope["method"]
+
+            request_duration.observe((handler, method), elapsed)
+            requests_total.inc((handler, method, status))
+            db_statements.inc((handler,), stats.sql_count)
+            db_time.inc((handler,), stats.sql_time)
+            redis_commands.inc((handler,), stats.redis_count)
+            redis_time.inc((handler,), stats.redis_time)
@@ -1,3 +1,39 @@
+from sqlalchemy import insert, inspect, select, update
 from sqlalchemy.orm import declarative_base
 
-Base = declarative_base()
+
+class ReturningMixin:
+    """Writes that hand back the persisted row from the same statement."""
+
+    @classmethod
+    async def insert_returning(cls, session, **values):
+        query = insert(cls).values(**values).returning(*cls.__table__.c)
+        result = await session.execute(select(cls).from_statement(query))
+        return result.scalar_one()
+
+    async def update_returning(self, session, **values):
+        cls = type(self)
+        mapper = inspect(cls)
+        identity = mapper.primary_key_from_instance(self)
+
+        query = (
+            update(cls)
+            .where(
+                *(
+                    column == value
+                    for column, value in zip(mapper.primary_key, identity)
+                )
+            )
+            .values(**values)
+            .returning(*cls.__table__.c)
+        )
+        # refreshes this instance in place from the returned row
+        result = await session.execute(
+            select(cls)
+            .from_statement(query)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one()
+
+
+Base = declarative_base(cls=ReturningMixin)
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.cache import TieredCache, TTLCache
+from .redis import cancel, redis
+
+logger = logging.getLogger(__name__)
+
+
+class CacheInvalidationBus:
+    """Evicts entries from in-process caches on every worker.
+
+    Invalidations are applied locally right away and broadcast over Redis
+    pub/sub as `<cache name>:<key>`, every worker listens for them.
+    """
+
+    channel = "cache:invalidate"
+    reconnect_delay = 1.0
+
+    def __init__(self):
+        self.caches: Dict[str, Tuple[TTLCache, Callable]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    def register(
+        self, name: str, cache: TTLCache, key_type: Callable = str
+    ) -> TTLCache:
+        self.caches[name] = (cache, key_type)
+        return cache
+
+    async def invalidate(self, name: str, key: Hashable) -> None:
+        cache, _ = self.caches[name]
+        cache.invalidate(key)
+
+        await redis.redis.publish(self.channel, f"{name}:{key}")
+
+    def _evict(self, message: str) -> None:
+        name, _, key = message.partition(":")
+        if name in self.caches:
+            cache, key_type = self.caches[name]
+            cache.invalidate(key_type(key))
+
+    async def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            await cancel(self._listener)
+            self._listener = None
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = redis.redis.pubsub()
+                try:
+                    await pubsub.subscribe(self.channel)
+
+                    # anything published while unsubscribed was missed
+                    for cache, _ in self.caches.values():
+                        cache.clear()
+
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._evict(message["data"])
+                finally:
+                    await pubsub.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation listener failed")
+                await asyncio.sleep(self.reconnect_delay)
+
+
+cache_bus = CacheInvalidationBus()
+
+user_cache = cache_bus.register(
+    "user",
+    TieredCache(
+        maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL
+    ),
+    key_type=int,
+)
+
+# serialized post bodies, None for missing posts
+post_local_cache = cache_bus.register(
+    "post",
+    TieredCache(
+        maxsize=settings.POST_LOCAL_CACHE_SIZE,
+        ttl=settings.POST_LOCAL_CACHE_TTL,
+        max_bytes=settings.POST_LOCAL_CACHE_MAX_BYTES,
+    ),
+    key_type=int,
+)
+
+# verified JWT claims by token digest, entries expire with the token
+token_cache = cache_bus.register(
+    "token",
+    TTLCache(
+        maxsize=settings.TOKEN_CACHE_SIZE,
+        ttl=settings.ACCESS_TOKEN_EXPIRES_IN * 60,
+    ),
+)
+
+
+# KEYS: version, body
+# ARGV: version the body was read at, payload, ttl
+# Stores the body only if no write bumped the version since it was read.
+SET_IF_VERSION_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class PostCache:
+    """Read-through Redis cache of serialized posts.
+
+    Bodies are stored as `<version>:<json>`, with an empty json for posts
+    that do not exist. Every write bumps the post version and drops the
+    body atomically, and a body is only cached if the version did not
+    change while it was loaded, so a slow reader can not put back a body
+    that a write already replaced. Reaction counters are not part of the
+    body and are read live on every request.
+
+    Workers keep recently read bodies in `post_local_cache`, writers call
+    `invalidate` here first and then evict them through `cache_bus`.
+    """
+
+    # bump when the serialized Post schema changes
+    key_version = 1
+
+    def __init__(self, ttl: int, missing_ttl: int):
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def version_key(post_id: int) -> str:
+        return f"post:{post_id}:version"
+
+    def body_key(self, post_id: int) -> str:
+        return f"post:{post_id}:body:v{self.key_version}"
+
+    async def read(
+        self,
+        post_id: int,
+        load: Callable[[int], Awaitable[Optional[str]]],
+    ) -> Optional[str]:
+        """Returns the post body, or None if there is no such post.
+
+        `load` is called with the post id on a miss.
+        """
+        payload, version = await redis.redis.mget(
+            self.body_key(post_id), self.version_key(post_id)
+        )
+        version = version or "0"
+
+        if payload is not None:
+            cached_version, _, body = payload.partition(":")
+            if cached_version == version:
+                self.hits += 1
+                return body or None
+
+        self.misses += 1
+        body = await load(post_id)
+
+        await redis.script(SET_IF_VERSION_SCRIPT)(
+            keys=[self.version_key(post_id), self.body_key(post_id)],
+            args=[
+                version,
+                f"{version}:{body or ''}",
+                self.ttl if body else self.missing_ttl,
+            ],
+        )
+        return body
+
+    async def invalidate(self, post_id: int) -> None:
+        """Call after the write that changed the post has committed."""
+        pipe = redis.redis.pipeline(transaction=True)
+        pipe.incr(self.version_key(post_id))
+        pipe.delete(self.body_key(post_id))
+        await pipe.execute()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+post_cache = PostCache(
+    ttl=settings.POST_CACHE_TTL, missing_ttl=settings.POST_CACHE_MISSING_TTL
+)
@@ -0,0 +1,127 @@
+import asyncio
+from contextlib import contextmanager
+from time import monotonic
+
+import aioredis
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+
+
+class PoolMetrics:
+    """Counts callers waiting for a pooled connection and how long they
+    waited."""
+
+    def __init__(self):
+        self.waiters = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @contextmanager
+    def checkout(self, timeout_errors):
+        self.waiters += 1
+        started_at = monotonic()
+        try:
+            yield
+        except timeout_errors:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = monotonic() - started_at
+            self.waiters -= 1
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+    def stats(self) -> dict:
+        return {
+            "waiters": self.waiters,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_time": (
+                self.wait_time / self.checkouts if self.checkouts else 0.0
+            ),
+            "max_wait_time": self.max_wait_time,
+        }
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        with self.metrics.checkout(PoolTimeoutError):
+            return super()._do_get()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            **self.metrics.stats(),
+        }
+
+
+class InstrumentedBlockingConnectionPool(aioredis.BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    async def get_connection(self, command_name, *keys, **options):
+        with self.metrics.checkout(aioredis.ConnectionError):
+            return await super().get_connection(
+                command_name, *keys, **options
+            )
+
+    def stats(self) -> dict:
+        return {
+            "max_connections": self.max_connections,
+            "connections": len(self._connections),
+            "checked_out": self.max_connections - self.pool.qsize(),
+            **self.metrics.stats(),
+        }
+
+
+def engine_pool_options() -> dict:
+    """create_async_engine arguments for the configured pool."""
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def engine_pool_stats(engine: AsyncEngine) -> dict:
+    return engine.sync_engine.pool.stats()
+
+
+async def warm_up_engine(engine: AsyncEngine, connections: int) -> None:
+    """Opens and checks up to `connections` pooled connections, they stay
+    in the pool for the first requests."""
+    count = min(connections, engine.sync_engine.pool.size())
+    results = await asyncio.gather(
+        *(engine.connect().start() for _ in range(count)),
+        return_exceptions=True,
+    )
+    opened = [conn for conn in results if not isinstance(conn, Exception)]
+    try:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+        for conn in opened:
+            await conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            await conn.close()
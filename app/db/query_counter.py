@@ -0,0 +1,208 @@
+"""Counts the SQL statements of a request, for query budgets and to spot
+N+1 patterns.
+
+Off by default: it is turned on for every request by the
+QUERY_COUNTER_ENABLED setting, for single requests by sending the
+QUERY_COUNTER_HEADER header set to the INTERNAL_API_TOKEN, and around any
+block with `count_queries`.
+"""
+import asyncio
+import functools
+import hmac
+import logging
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = str(Path(__file__).resolve().parent.parent)
+
+# transaction plumbing, not queries of the code being measured
+IGNORED_PREFIXES = (
+    "SAVEPOINT",
+    "RELEASE SAVEPOINT",
+    "ROLLBACK TO SAVEPOINT",
+)
+
+
+def extract_stack() -> traceback.StackSummary:
+    """The stack of the coroutines of the current task, it leads to the
+    code that ran the statement. Outside of a task, the plain stack."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is None:
+        return traceback.extract_stack()
+
+    # SQLAlchemy runs the statements in a greenlet, whose frames do not
+    # lead back to the awaiting coroutines
+    return traceback.StackSummary.extract(
+        (frame, frame.f_lineno) for frame in task.get_stack(limit=None)
+    )
+
+
+class Query:
+    __slots__ = ("statement", "stack")
+
+    def __init__(self, statement: str, stack: traceback.StackSummary):
+        self.statement = statement
+        self.stack = stack
+
+    def format_stack(self) -> str:
+        # the frames of the app tell where the statement came from
+        frames = [
+            frame
+            for frame in self.stack
+            if frame.filename.startswith(APP_DIR)
+        ]
+        return "".join(traceback.format_list(frames or self.stack))
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries: List[Query] = []
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def record(self, statement: str) -> None:
+        if statement.lstrip().upper().startswith(IGNORED_PREFIXES):
+            return
+        self.queries.append(Query(statement, extract_stack()))
+
+    def repeated(self, threshold: int) -> Dict[str, List[Query]]:
+        """Statements run at least `threshold` times, likely an N+1 when
+        they only differ by their parameters."""
+        by_statement = defaultdict(list)
+        for query in self.queries:
+            by_statement[query.statement].append(query)
+
+        return {
+            statement: queries
+            for statement, queries in by_statement.items()
+            if len(queries) >= threshold
+        }
+
+    def report(self) -> str:
+        return "\n".join(
+            f"{index}. {query.statement}\n{query.format_stack()}"
+            for index, query in enumerate(self.queries, 1)
+        )
+
+
+query_log: ContextVar[Optional[QueryLog]] = ContextVar(
+    "query_log", default=None
+)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    log = query_log.get()
+    if log is not None:
+        log.record(statement)
+
+
+def warn_repeated(log: QueryLog, where: str) -> None:
+    threshold = settings.QUERY_N_PLUS_ONE_THRESHOLD
+    for statement, queries in log.repeated(threshold).items():
+        logger.warning(
+            "Possible N+1 in %s, statement ran %d times: %s\n%s",
+            where,
+            len(queries),
+            statement,
+            "\n".join(query.format_stack() for query in queries),
+        )
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryLog]:
+    """Collects the statements run in the block, those of the requests it
+    sends through an ASGI test client included."""
+    log = QueryLog()
+    token = query_log.set(log)
+    try:
+        yield log
+    finally:
+        query_log.reset(token)
+
+
+class assert_max_queries:
+    """Fails when the block or the decorated coroutine function runs more
+    than `limit` statements, and lists them.
+
+        with assert_max_queries(2):
+            await client.post(f"post/{post_id}/like")
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._counting = None
+
+    def __enter__(self) -> QueryLog:
+        self._counting = count_queries()
+        self.log = self._counting.__enter__()
+        return self.log
+
+    def __exit__(self, exc_type, exc, tb):
+        self._counting.__exit__(exc_type, exc, tb)
+        warn_repeated(self.log, "the measured block")
+        if exc_type is None and len(self.log) > self.limit:
+            raise AssertionError(
+                f"{len(self.log)} statements ran, at most {self.limit} "
+                f"expected:\n{self.log.report()}"
+            )
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with assert_max_queries(self.limit):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+
+class QueryCounterMiddleware:
+    """Counts the statements of requests when enabled, reports the count
+    in the response header and logs likely N+1 queries."""
+
+    def __init__(self, app):
+        self.app = app
+        self.header = settings.QUERY_COUNTER_HEADER.lower().encode()
+
+    def enabled(self, scope) -> bool:
+        if settings.QUERY_COUNTER_ENABLED:
+            return True
+        # capturing stacks is costly, only operators may ask for it
+        token = settings.INTERNAL_API_TOKEN.encode()
+        return bool(token) and any(
+            name == self.header and hmac.compare_digest(value, token)
+            for name, value in scope["headers"]
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled(scope):
+            return await self.app(scope, receive, send)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (self.header, str(len(log)).encode()),
+                ]
+            await send(message)
+
+        with count_queries() as log:
+            try:
+                await self.app(scope, receive, send_with_count)
+            finally:
+                warn_repeated(log, f"{scope['method']} {scope['path']}")
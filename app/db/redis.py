@@ -1,27 +1,342 @@
 import asyncio
+from time import perf_counter, time
+from typing import Dict, List, Optional, Tuple
+
 import aioredis
+from aioredis.client import Pipeline
+
+from app.core import metrics
 from app.core.config import settings
+from .pool import InstrumentedBlockingConnectionPool
+
+
+def likes_key(post_id: int) -> str:
+    return f"post:{post_id}:likes"
+
+
+def dislikes_key(post_id: int) -> str:
+    return f"post:{post_id}:dislikes"
+
+
+def like_users_key(post_id: int) -> str:
+    return f"post:{post_id}:likes:users"
+
+
+def dislike_users_key(post_id: int) -> str:
+    return f"post:{post_id}:dislikes:users"
+
+
+def trending_key(window: str) -> str:
+    return f"trending:{window}"
+
+
+def trending_epoch_key(window: str) -> str:
+    return f"trending:{window}:epoch"
+
+
+def timeline_key(user_id: int) -> str:
+    return f"timeline:{user_id}"
+
+
+def user_posts_key(user_id: int) -> str:
+    return f"user:{user_id}:posts"
+
+
+# member of every post list kept in Redis, below any post id, so that an
+# empty list is told apart from one that is not kept
+POST_LIST_SENTINEL = 0
+
+LIKE = "like"
+UNLIKE = "unlike"
+DISLIKE = "dislike"
+UNDISLIKE = "undislike"
+
+# A change is weighted by at most 2 ^ MAX_DECAY_HALF_LIVES: a window whose
+# epoch is older, when the trending worker stopped moving it, is rebased
+# by the reaction first, so that scores stay finite.
+MAX_DECAY_HALF_LIVES = 32
+
+# Lua rescaling the scores of a trending window to an epoch of `now`, and
+# dropping those that are not finite, written before scores were bounded.
+REBASE_WINDOW = f"""
+local max_decay = {MAX_DECAY_HALF_LIVES}
+
+local function rebase(scores, epoch_key, epoch, now, half_life)
+    local factor = 2 ^ ((epoch - now) / half_life)
+    local entries = redis.call('ZRANGE', scores, 0, -1, 'WITHSCORES')
+    for i = 1, #entries, 2 do
+        local score = tonumber(entries[i + 1])
+        if score and math.abs(score) < math.huge then
+            redis.call('ZADD', scores, score * factor, entries[i])
+        else
+            redis.call('ZREM', scores, entries[i])
+        end
+    end
+    redis.call('SET', epoch_key, now)
+end
+"""
+
+# Applies one reaction transition to both counters and both member sets
+# atomically. The member sets decide whether the transition is a no-op, so
+# repeated or concurrent requests never double count.
+#
+# A change also moves the post in the trending sorted set of each window by
+# how much the reaction of the user changed, a like replacing a dislike by
+# 2. Scores decay with the half-life of the window: a change is weighted by
+# 2 ^ ((now - epoch) / half-life), so that older changes count for less
+# without ever rewriting scores; the trending worker moves the epoch, or
+# the reaction once the epoch is MAX_DECAY_HALF_LIVES old.
+#
+# In write-behind mode a change is also appended to the reaction stream,
+# as the resulting reaction of the user: 1, -1 or 0 for none. Otherwise
+# Postgres applied the transition first, and the counters are set to the
+# ones it returned rather than counted, so that counters Redis lost are
+# not counted again from 0.
+#
+# KEYS: likes counter, dislikes counter, likes members, dislikes members,
+#       the sorted set and epoch of each trending window, optionally the
+#       reaction stream
+# ARGV: user id, transition, post id, now (seconds), likes and dislikes in
+#       Postgres or empty strings, the half-life of each window
+# Returns: {changed (0/1), likes, dislikes}
+REACTION_SCRIPT = REBASE_WINDOW + """
+local likes, dislikes, liked, disliked = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local user, transition, post = ARGV[1], ARGV[2], ARGV[3]
+local now = tonumber(ARGV[4])
+local windows = #ARGV - 6
+local stream = KEYS[5 + 2 * windows]
+local values = {like = 1, dislike = -1, unlike = 0, undislike = 0}
+local signs = {like = 1, dislike = -1, unlike = -1, undislike = 1}
+
+-- the per-command code before this script stored the last user as a plain
+-- string under the member keys; keep that user, as a set
+local function upgrade(members)
+    if redis.call('TYPE', members).ok == 'string' then
+        local user_id = redis.call('GET', members)
+        redis.call('DEL', members)
+        redis.call('SADD', members, user_id)
+    end
+end
+
+upgrade(liked)
+upgrade(disliked)
+
+local function decr(counter)
+    if redis.call('DECR', counter) < 0 then
+        redis.call('SET', counter, 0)
+    end
+end
+
+-- returns how many member sets changed
+local function add(counter, members, other_counter, other_members)
+    if redis.call('SADD', members, user) == 0 then
+        return 0
+    end
+    redis.call('INCR', counter)
+    if redis.call('SREM', other_members, user) == 1 then
+        decr(other_counter)
+        return 2
+    end
+    return 1
+end
+
+local function remove(counter, members)
+    if redis.call('SREM', members, user) == 0 then
+        return 0
+    end
+    decr(counter)
+    return 1
+end
+
+local changed
+if transition == 'like' then
+    changed = add(likes, liked, dislikes, disliked)
+elseif transition == 'dislike' then
+    changed = add(dislikes, disliked, likes, liked)
+elseif transition == 'unlike' then
+    changed = remove(likes, liked)
+elseif transition == 'undislike' then
+    changed = remove(dislikes, disliked)
+else
+    return redis.error_reply('unknown reaction transition ' .. transition)
+end
+
+if ARGV[5] ~= '' then
+    redis.call('SET', likes, ARGV[5])
+    redis.call('SET', dislikes, ARGV[6])
+end
+
+if changed > 0 then
+    for i = 1, windows do
+        local scores, epoch_key = KEYS[3 + 2 * i], KEYS[4 + 2 * i]
+        local half_life = tonumber(ARGV[6 + i])
+        local epoch = tonumber(redis.call('GET', epoch_key))
+        if not epoch then
+            epoch = now
+            redis.call('SET', epoch_key, now)
+        elseif (now - epoch) / half_life > max_decay then
+            rebase(scores, epoch_key, epoch, now, half_life)
+            epoch = now
+        end
+        local weight = 2 ^ ((now - epoch) / half_life)
+        redis.call(
+            'ZINCRBY', scores, signs[transition] * changed * weight, post
+        )
+    end
+
+    if stream then
+        redis.call(
+            'XADD', stream, '*',
+            'post_id', post, 'user_id', user, 'value', values[transition]
+        )
+    end
+end
+
+return {
+    math.min(changed, 1),
+    tonumber(redis.call('GET', likes) or 0),
+    tonumber(redis.call('GET', dislikes) or 0),
+}
+"""
+
+# Adds a post to the post lists in KEYS that are kept, timelines or the
+# recent posts of an author scored by post id, and trims each to the
+# ARGV[2] newest posts. Lists not kept are rebuilt from Postgres on read.
+#
+# KEYS: post lists
+# ARGV: post id, max posts
+PUSH_POST_SCRIPT = """
+local post, max_posts = ARGV[1], tonumber(ARGV[2])
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('ZADD', key, post, post)
+        -- the sentinel is rank 0, keep it
+        redis.call('ZREMRANGEBYRANK', key, 1, -max_posts - 1)
+    end
+end
+"""
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started_at = perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            metrics.record_redis(perf_counter() - started_at)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """Reports every round trip to the metrics of the current request."""
+
+    async def execute_command(self, *args, **options):
+        started_at = perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            metrics.record_redis(perf_counter() - started_at)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return InstrumentedPipeline(
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint,
+        )
+
+
+async def cancel(task: asyncio.Task) -> None:
+    """Cancels a task that uses Redis and waits for it to end.
+
+    aioredis turns a cancellation that lands while a pooled connection is
+    checked with a zero timeout into that timeout and carries on, so the
+    task is cancelled again until it ends.
+    """
+    while not task.done():
+        task.cancel()
+        await asyncio.wait([task], timeout=0.1)
+    if not task.cancelled() and task.exception() is not None:
+        raise task.exception()
 
 
 class RedisConnection:
+    """The Redis client of the worker.
+
+    Created on first use without awaiting anything, so that concurrent
+    first requests can not create a client each; connections are opened
+    by the pool as needed, or up front by `warm_up`.
+    """
+
     def __init__(self):
-        self.redis = None
+        self._redis = None
+        self.scripts = {}
+
+    @property
+    def redis(self) -> InstrumentedRedis:
+        if self._redis is None:
+            # callers wait for a free connection rather than opening more
+            pool = InstrumentedBlockingConnectionPool.from_url(
+                f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}",
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                encoding="utf-8",
+                decode_responses=True,
+            )
+            self._redis = InstrumentedRedis(connection_pool=pool)
+            self.scripts = {}
+        return self._redis
 
-    async def connect(self):
-        self.redis = await aioredis.from_url(
-            f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}",
-            encoding="utf-8",
-            decode_responses=True,
+    async def warm_up(self, connections: int) -> None:
+        """Opens and checks up to `connections` pooled connections."""
+        pool = self.redis.connection_pool
+        results = await asyncio.gather(
+            *(
+                pool.get_connection("PING")
+                for _ in range(min(connections, pool.max_connections))
+            ),
+            return_exceptions=True,
         )
+        opened = [
+            connection
+            for connection in results
+            if not isinstance(connection, Exception)
+        ]
+        try:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
 
-    def is_connected(self):
-        return True if self.redis else False
+            for connection in opened:
+                await connection.send_command("PING")
+                await connection.read_response()
+        finally:
+            for connection in opened:
+                await pool.release(connection)
+
+    async def close(self) -> None:
+        """Closes all connections, the next use creates a new client."""
+        if self._redis is not None:
+            client, self._redis = self._redis, None
+            await client.connection_pool.disconnect()
+
+    def script(self, source: str):
+        """Returns the script registered on the current client.
+
+        Scripts run through EVALSHA, the body is only sent again if the
+        server does not have it cached.
+        """
+        script = self.scripts.get(source)
+        if script is None:
+            script = self.scripts[source] = self.redis.register_script(source)
+        return script
 
     async def get(self, key):
         return await self.redis.get(key) or 0
 
-    async def get_set(self, key):
-        return await self.redis.get(key) or []
+    async def mget(self, keys):
+        if not keys:
+            return []
+        return [value or 0 for value in await self.redis.mget(keys)]
 
     async def set(self, key, value):
         return await self.redis.set(key, value)
@@ -29,11 +344,147 @@ class RedisConnection:
     async def incr(self, key):
         return await self.redis.incr(key)
 
-    async def decr(self, key):
-        if await self.redis.exists(key):
-            if int(await self.get(key)) >= 1:
-                return await self.redis.decr(key)
-            return
-
     async def srem(self, key, value):
         return await self.redis.srem(key, value)
+
+    async def read_counts(
+        self, post_ids: List[int]
+    ) -> Dict[int, Optional[Tuple[int, int]]]:
+        """(likes, dislikes) of many posts with a single MGET, None for
+        posts Redis has no counters of."""
+        keys = []
+        for post_id in post_ids:
+            keys.extend((likes_key(post_id), dislikes_key(post_id)))
+
+        values = await self.redis.mget(keys) if keys else []
+        counts = {}
+        for post_id, likes, dislikes in zip(
+            post_ids, values[::2], values[1::2]
+        ):
+            counts[post_id] = (
+                None
+                if likes is None and dislikes is None
+                else (int(likes or 0), int(dislikes or 0))
+            )
+        return counts
+
+    async def seed_counts(self, counts: Dict[int, Tuple[int, int]]) -> None:
+        """Stores counters of posts Redis has none of. SET NX leaves the
+        ones a reaction created meanwhile alone."""
+        pipe = self.redis.pipeline(transaction=False)
+        for post_id, (likes, dislikes) in counts.items():
+            pipe.set(likes_key(post_id), likes, nx=True)
+            pipe.set(dislikes_key(post_id), dislikes, nx=True)
+        await pipe.execute()
+
+    async def trending(self, window: str, limit: int) -> List[int]:
+        """Ids of the top posts of a trending window, best first."""
+        return [
+            int(post_id)
+            for post_id in await self.redis.zrevrange(
+                trending_key(window), 0, limit - 1
+            )
+        ]
+
+    async def forget_trending(self, post_id: int) -> None:
+        """Drops a deleted post from every trending window."""
+        pipe = self.redis.pipeline(transaction=False)
+        for window in settings.TRENDING_HALF_LIVES:
+            pipe.zrem(trending_key(window), post_id)
+        await pipe.execute()
+
+    async def push_post(self, post_id: int, keys: List[str]) -> None:
+        """Adds a post to those of the post lists `keys` that are kept."""
+        if keys:
+            await self.script(PUSH_POST_SCRIPT)(
+                keys=keys, args=[post_id, settings.TIMELINE_MAX_POSTS]
+            )
+
+    async def keep_post_list(self, key: str) -> None:
+        """Starts keeping a post list, empty until `store_post_list`."""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zadd(key, {POST_LIST_SENTINEL: POST_LIST_SENTINEL})
+        pipe.expire(key, settings.TIMELINE_TTL)
+        await pipe.execute()
+
+    async def store_post_list(self, key: str, post_ids: List[int]) -> None:
+        if post_ids:
+            await self.redis.zadd(
+                key, {post_id: post_id for post_id in post_ids}
+            )
+
+    async def read_post_lists(
+        self, keys: List[str], limit: int, before_id: Optional[int] = None
+    ) -> List[Optional[Tuple[List[int], bool]]]:
+        """Up to `limit` post ids older than `before_id` of each post list,
+        newest first, in one round trip; None for lists not kept.
+
+        Also tells whether a list is full, older posts may have been
+        trimmed from it then. Reading a list keeps it for another
+        TIMELINE_TTL.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.zrevrangebyscore(
+                key,
+                f"({before_id}" if before_id is not None else "+inf",
+                f"({POST_LIST_SENTINEL}",
+                start=0,
+                num=limit,
+            )
+            pipe.zcard(key)
+            pipe.expire(key, settings.TIMELINE_TTL)
+        results = await pipe.execute()
+
+        return [
+            None
+            if not size
+            else (
+                [int(post_id) for post_id in post_ids],
+                size > settings.TIMELINE_MAX_POSTS,
+            )
+            for post_ids, size in zip(results[::3], results[1::3])
+        ]
+
+    async def forget_post_list(self, key: str) -> None:
+        await self.redis.delete(key)
+
+    async def react(
+        self,
+        post_id: int,
+        user_id: int,
+        transition: str,
+        stream: Optional[str] = None,
+        now: Optional[float] = None,
+        counts: Optional[Tuple[int, int]] = None,
+    ):
+        """Applies a reaction transition in one round trip.
+
+        Returns whether anything changed and the resulting like and
+        dislike counts. A change moves the post in the trending windows as
+        of `now`, the current time by default. With `stream`, a change is
+        appended to it in the same step, for the write-behind flusher.
+        With `counts`, the likes and dislikes Postgres has after the
+        transition, the counters are set to them.
+        """
+        keys = [
+            likes_key(post_id),
+            dislikes_key(post_id),
+            like_users_key(post_id),
+            dislike_users_key(post_id),
+        ]
+        args = [user_id, transition, post_id, now or time()]
+        args.extend(counts if counts is not None else ("", ""))
+        for window, half_life in settings.TRENDING_HALF_LIVES.items():
+            keys.extend((trending_key(window), trending_epoch_key(window)))
+            args.append(half_life)
+        if stream is not None:
+            keys.append(stream)
+
+        changed, likes, dislikes = await self.script(REACTION_SCRIPT)(
+            keys=keys, args=args
+        )
+        return bool(changed), likes, dislikes
+
+
+redis = RedisConnection()
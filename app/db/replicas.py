@@ -0,0 +1,197 @@
+import asyncio
+import itertools
+import logging
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from .pool import engine_pool_options, engine_pool_stats, warm_up_engine
+from .redis import redis
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = "round_robin"
+LEAST_CONNECTIONS = "least_connections"
+
+# seconds the replica is behind, 0 when it replayed everything it received
+# or is not replicating at all
+LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+          OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+    """
+)
+
+
+def pin_key(scope: str) -> str:
+    return f"db:pin:{scope}"
+
+
+class Replica:
+    def __init__(self, uri: str):
+        self.uri = uri
+        self.engine = create_async_engine(
+            uri,
+            echo=settings.ECHO_SQL_STATEMENTS,
+            future=True,
+            **engine_pool_options(),
+        )
+        # replicas only serve plain reads
+        self.sessionmaker = sessionmaker(
+            self.engine.execution_options(isolation_level="AUTOCOMMIT"),
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autoflush=False,
+            future=True,
+        )
+        self.healthy = True
+        self.lag: Optional[float] = None
+
+    @property
+    def connections(self) -> int:
+        return self.engine.sync_engine.pool.checkedout()
+
+    async def check(self, max_lag: float) -> None:
+        try:
+            async with self.engine.connect() as conn:
+                self.lag = float((await conn.execute(LAG_QUERY)).scalar())
+        except Exception:
+            logger.exception("Replica lag check failed")
+            self.lag = None
+            self.healthy = False
+            return
+
+        self.healthy = self.lag <= max_lag
+
+    async def warm_up(self, connections: int) -> None:
+        try:
+            await warm_up_engine(self.engine, connections)
+        except Exception:
+            # a replica being down must not keep the worker from starting
+            logger.exception("Replica warm up failed")
+            self.healthy = False
+
+    def stats(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "lag": self.lag,
+            "connections": self.connections,
+            "pool": engine_pool_stats(self.engine),
+        }
+
+
+class ReplicaSet:
+    """Read replicas of the primary database.
+
+    Reads are balanced over the healthy replicas; replicas that lag more
+    than `max_lag` seconds or fail the periodic check leave the rotation
+    until they catch up. Scopes such as a user written to within the last
+    `pin_ttl` seconds are pinned to the primary, so that their reads see
+    their writes.
+    """
+
+    def __init__(
+        self,
+        uris: Iterable[str],
+        balancing: str = ROUND_ROBIN,
+        max_lag: float = 5.0,
+        check_interval: float = 1.0,
+        pin_ttl: int = 10,
+    ):
+        if balancing not in (ROUND_ROBIN, LEAST_CONNECTIONS):
+            raise ValueError(f"Unknown replica balancing {balancing!r}")
+
+        self.replicas: List[Replica] = [Replica(uri) for uri in uris]
+        self.balancing = balancing
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.pin_ttl = pin_ttl
+        self._turns = itertools.count()
+        self._checker: Optional[asyncio.Task] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def choose(self) -> Optional[Replica]:
+        """Returns the replica for the next read, None if none is healthy."""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+
+        if self.balancing == LEAST_CONNECTIONS:
+            return min(healthy, key=lambda replica: replica.connections)
+        return healthy[next(self._turns) % len(healthy)]
+
+    async def pin(self, scopes: Iterable[str]) -> None:
+        """Sends reads of the scopes to the primary for a while, call once
+        their write committed."""
+        scopes = list(scopes)
+        if not self.replicas or not scopes:
+            return
+
+        pipe = redis.redis.pipeline(transaction=False)
+        for scope in scopes:
+            pipe.set(pin_key(scope), 1, ex=self.pin_ttl)
+        await pipe.execute()
+
+    async def is_pinned(self, scopes: Iterable[str]) -> bool:
+        keys = [pin_key(scope) for scope in scopes]
+        if not keys:
+            return False
+
+        return await redis.redis.exists(*keys) > 0
+
+    async def check(self) -> None:
+        await asyncio.gather(
+            *(replica.check(self.max_lag) for replica in self.replicas)
+        )
+
+    async def warm_up(self, connections: int) -> None:
+        await asyncio.gather(
+            *(replica.warm_up(connections) for replica in self.replicas)
+        )
+
+    async def start(self) -> None:
+        if self.replicas and self._checker is None:
+            self._checker = asyncio.create_task(self._check_periodically())
+
+    async def stop(self) -> None:
+        if self._checker is not None:
+            self._checker.cancel()
+            try:
+                await self._checker
+            except asyncio.CancelledError:
+                pass
+            self._checker = None
+
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    async def _check_periodically(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    def stats(self) -> List[dict]:
+        return [
+            {"replica": index, **replica.stats()}
+            for index, replica in enumerate(self.replicas)
+        ]
+
+
+replicas = ReplicaSet(
+    settings.DB_REPLICA_URIS,
+    balancing=settings.DB_REPLICA_BALANCING,
+    max_lag=settings.DB_REPLICA_MAX_LAG,
+    check_interval=settings.DB_REPLICA_CHECK_INTERVAL,
+    pin_ttl=settings.DB_PRIMARY_PIN_TTL,
+)
@@ -1,18 +1,21 @@
-from typing import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
 
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from sqlalchemy.exc import SQLAlchemyError
+from .pool import engine_pool_options
 from .redis import RedisConnection
+from .replicas import ReplicaSet, replicas
 
 from app.core.config import settings
 
 async_engine = create_async_engine(
     settings.DB_URI,
-    pool_pre_ping=True,
     echo=settings.ECHO_SQL_STATEMENTS,
     future=True,
+    **engine_pool_options(),
 )
 AsyncSessionLocal = sessionmaker(
     async_engine,
@@ -21,10 +24,114 @@ AsyncSessionLocal = sessionmaker(
     autoflush=False,
     future=True,
 )
+# same pool, but no BEGIN/COMMIT round trips around plain reads
+ReadSessionLocal = sessionmaker(
+    async_engine.execution_options(isolation_level="AUTOCOMMIT"),
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False,
+    future=True,
+)
+
+
+class RequestSession:
+    """The database unit of work of a request.
+
+    Shared by the auth dependency and the services of a request. Sessions
+    are only created on first use, and the connection goes back to the
+    pool as soon as a `begin` or `read` block ends.
+
+    `scopes` name what the request acts for, such as its user. Reads of a
+    scope written to recently go to the primary, other reads are spread
+    over the replicas.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker = AsyncSessionLocal,
+        read_session_factory: sessionmaker = ReadSessionLocal,
+        replica_set: ReplicaSet = replicas,
+    ):
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.replicas = replica_set
+        self.scopes: Set[str] = set()
+        self._session: Optional[AsyncSession] = None
+        self._read_sessions: Dict[sessionmaker, AsyncSession] = {}
+
+    @property
+    def session(self) -> AsyncSession:
+        """Transactional session on the primary, work done through it is
+        committed by the next `begin` block."""
+        if self._session is None:
+            self._session = self.session_factory()
+        return self._session
+
+    @staticmethod
+    @asynccontextmanager
+    async def _scope(session: AsyncSession) -> AsyncIterator[AsyncSession]:
+        try:
+            yield session
+        except BaseException:
+            await session.rollback()
+            raise
+        else:
+            await session.commit()
+
+    @asynccontextmanager
+    async def begin(self, *scopes: str) -> AsyncIterator[AsyncSession]:
+        """Commits `session` when the block ends, rolls it back on errors.
+
+        Joins the transaction started by earlier reads through `session`.
+        The request scopes and `scopes` are pinned to the primary once the
+        commit succeeded.
+        """
+        async with self._scope(self.session) as session:
+            yield session
+
+        await self.replicas.pin(self.scopes.union(scopes))
+
+    async def pin(self, *scopes: str) -> None:
+        """Pins scopes only known once the write committed, such as one
+        named after the id of a new row."""
+        await self.replicas.pin(scopes)
+
+    @asynccontextmanager
+    async def read(self, *scopes: str) -> AsyncIterator[AsyncSession]:
+        """For reads only, runs outside of a transaction, on a replica
+        unless the request scopes or `scopes` are pinned to the primary."""
+        factory = await self._route(scopes)
+
+        session = self._read_sessions.get(factory)
+        if session is None:
+            session = self._read_sessions[factory] = factory()
+
+        async with self._scope(session):
+            yield session
+
+    async def _route(self, scopes) -> sessionmaker:
+        if self.replicas and not await self.replicas.is_pinned(
+            self.scopes.union(scopes)
+        ):
+            replica = self.replicas.choose()
+            if replica is not None:
+                return replica.sessionmaker
+
+        return self.read_session_factory
+
+    async def close(self) -> None:
+        for session in (self._session, *self._read_sessions.values()):
+            if session is not None:
+                await session.close()
+        self._session = None
+        self._read_sessions = {}
 
 
-async def get_session() -> AsyncIterator[sessionmaker]:
+async def get_session() -> AsyncIterator[RequestSession]:
+    request_session = RequestSession()
     try:
-        yield AsyncSessionLocal
+        yield request_session
     except SQLAlchemyError as e:
         pass
+    finally:
+        await request_session.close()
@@ -1,2 +1,3 @@
-from .user import UserModel
-from .post import PostModel, LikeModel, DislikeModel
\ No newline at end of file
+from .user import UserModel, FollowModel
+from .post import PostModel, ReactionModel, LikeModel, DislikeModel
+from .lease import LeaseFenceModel
\ No newline at end of file
@@ -0,0 +1,48 @@
+from sqlalchemy import BigInteger, Column, Sequence, String, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.base_class import Base
+
+# tokens handed to lease holders, higher for each new holder
+FENCE_TOKENS = Sequence("lease_fence_tokens", metadata=Base.metadata)
+
+# Moves the fence of a lease up to the token, unless a newer holder
+# already moved it past; the row stays locked until the transaction ends.
+ADVANCE_FENCE = text(
+    """
+    INSERT INTO lease_fences (name, token)
+    VALUES (:name, :token)
+    ON CONFLICT (name) DO UPDATE
+    SET token = EXCLUDED.token
+    WHERE lease_fences.token <= EXCLUDED.token
+    RETURNING token
+    """
+)
+
+
+class LeaseFenceModel(Base):
+    """The highest fencing token of a Redis lease seen by Postgres.
+
+    A holder that stalled past its lease still believes it holds it; its
+    writes check its token against the fence in the same transaction, so
+    that they can not land after those of the next holder.
+    """
+
+    __tablename__ = "lease_fences"
+
+    name = Column(String, primary_key=True)
+    token = Column(BigInteger, nullable=False)
+
+    @classmethod
+    async def next_token(cls, session: AsyncSession) -> int:
+        return await session.scalar(FENCE_TOKENS.next_value())
+
+    @classmethod
+    async def advance(
+        cls, session: AsyncSession, name: str, token: int
+    ) -> bool:
+        """Whether `token` is still the newest, in which case the fence is
+        held until the transaction ends."""
+        params = {"name": name, "token": token}
+        result = await session.execute(ADVANCE_FENCE, params)
+        return result.first() is not None
@@ -1,20 +1,58 @@
 from __future__ import annotations, annotations
 
-from typing import Optional, AsyncIterator
-
-from sqlalchemy import Column, Integer, String, select
+from typing import Dict, Optional, AsyncIterator, List, Tuple
+
+from sqlalchemy import (
+    DDL,
+    Column,
+    Index,
+    Integer,
+    SmallInteger,
+    String,
+    any_,
+    bindparam,
+    event,
+    literal_column,
+    or_,
+    select,
+    text,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql.functions import func
 
 from app.db.base_class import Base
+from .user import FollowModel
+
+
+# text search configuration of posts.search_vector, queries must use it too
+SEARCH_CONFIG = "english"
 
 
 class PostModel(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        # the per-author listing, newest first; the global listing is
+        # served by the primary key, this index can not order by id alone
+        Index("ix_posts_user_id_id", "user_id", "id"),
+        Index(
+            "ix_posts_search_vector", "search_vector", postgresql_using="gin"
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
     content = Column(String)
+    # maintained by ReactionModel transitions in the same statement
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    dislike_count = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    # the words of `content`, maintained by a trigger; only search reads it
+    search_vector = deferred(Column(TSVECTOR))
 
     @classmethod
     async def read_by_id(
@@ -26,6 +64,30 @@ class PostModel(Base):
 
         return None if not post else post.PostModel
 
+    @classmethod
+    async def read_by_ids(
+        cls, session: AsyncSession, post_ids: List[int]
+    ) -> List[PostModel]:
+        # a single array parameter keeps one prepared statement for any
+        # number of ids, unlike an expanded IN (...) list
+        ids = bindparam("post_ids", post_ids, type_=ARRAY(Integer))
+        query = select(cls).where(cls.id == any_(ids))
+        return (await session.execute(query)).scalars().all()
+
+    @classmethod
+    async def read_counts(
+        cls, session: AsyncSession, post_ids: List[int]
+    ) -> Dict[int, Tuple[int, int]]:
+        """(like_count, dislike_count) of the posts that exist."""
+        ids = bindparam("post_ids", post_ids, type_=ARRAY(Integer))
+        query = select(cls.id, cls.like_count, cls.dislike_count).where(
+            cls.id == any_(ids)
+        )
+        return {
+            post_id: (likes, dislikes)
+            for post_id, likes, dislikes in await session.execute(query)
+        }
+
     @classmethod
     async def read_all(cls, session: AsyncSession) -> AsyncIterator[PostModel]:
         stream = await session.stream(select(cls).order_by(cls.id))
@@ -33,30 +95,105 @@ class PostModel(Base):
             yield row.PostModel
 
     @classmethod
-    async def create(
+    async def read_page(
+        cls,
+        session: AsyncSession,
+        limit: int,
+        before_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+    ) -> List[PostModel]:
+        """Reads up to `limit` posts older than `before_id`, newest first.
+
+        Keyset pagination on the primary key: the cost of a page does not
+        depend on how deep the cursor is, unlike OFFSET.
+        """
+        query = select(cls).order_by(cls.id.desc()).limit(limit)
+
+        if before_id is not None:
+            query = query.where(cls.id < before_id)
+
+        if user_id is not None:
+            query = query.where(cls.user_id == user_id)
+
+        return (await session.execute(query)).scalars().all()
+
+    @classmethod
+    async def read_timeline_ids(
         cls,
         session: AsyncSession,
         user_id: int,
-        content: str,
-    ) -> PostModel:
-        post = PostModel(user_id=user_id, content=content)
-        session.add(post)
-        await session.flush()
+        limit: int,
+        before_id: Optional[int] = None,
+    ) -> List[int]:
+        """Ids of up to `limit` posts of the user and of the users it
+        follows older than `before_id`, newest first."""
+        followees = select(FollowModel.followee_id).where(
+            FollowModel.follower_id == user_id
+        )
+        query = (
+            select(cls.id)
+            .where(or_(cls.user_id == user_id, cls.user_id.in_(followees)))
+            .order_by(cls.id.desc())
+            .limit(limit)
+        )
 
-        # To fetch user
-        new = await cls.read_by_id(session, post.id)
+        if before_id is not None:
+            query = query.where(cls.id < before_id)
 
-        if not new:
-            raise RuntimeError()
+        return (await session.execute(query)).scalars().all()
 
-        return new
+    @classmethod
+    async def search(
+        cls,
+        session: AsyncSession,
+        query: str,
+        limit: int,
+        after: Optional[Tuple[float, int]] = None,
+        user_id: Optional[int] = None,
+    ) -> List[Tuple[PostModel, float]]:
+        """Reads up to `limit` posts matching the web search style `query`
+        with their rank, best first, ranked after the (rank, id) `after`.
+
+        Keyset pagination on (rank, id), ids break ties. The GIN index
+        finds the matches, only those are ranked.
+        """
+        ts_query = func.websearch_to_tsquery(
+            literal_column(f"'{SEARCH_CONFIG}'::regconfig"), query
+        )
+        rank = func.ts_rank(cls.search_vector, ts_query)
+        statement = (
+            select(cls, rank)
+            .where(cls.search_vector.op("@@")(ts_query))
+            .order_by(rank.desc(), cls.id.desc())
+            .limit(limit)
+        )
+
+        if after is not None:
+            statement = statement.where(tuple_(rank, cls.id) < tuple_(*after))
+
+        if user_id is not None:
+            statement = statement.where(cls.user_id == user_id)
+
+        return (await session.execute(statement)).all()
+
+    @classmethod
+    async def create(
+        cls,
+        session: AsyncSession,
+        user_id: int,
+        content: str,
+    ) -> PostModel:
+        # the INSERT hands back the stored row, no read after write
+        return await cls.insert_returning(
+            session, user_id=user_id, content=content
+        )
 
     async def update(
         self, session: AsyncSession, user_id: int, content: str
-    ) -> None:
-        self.user_id = user_id
-        self.content = content
-        await session.flush()
+    ) -> PostModel:
+        return await self.update_returning(
+            session, user_id=user_id, content=content
+        )
 
     @classmethod
     async def delete(cls, session: AsyncSession, post: PostModel) -> None:
@@ -64,8 +201,220 @@ class PostModel(Base):
         await session.flush()
 
 
+# keeps search_vector in step with content, for tables created from the
+# models; the migrations create it for the others
+event.listen(
+    PostModel.__table__,
+    "after_create",
+    DDL(
+        f"""
+        CREATE TRIGGER posts_search_vector_update
+        BEFORE INSERT OR UPDATE OF content ON posts
+        FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(
+            search_vector, 'pg_catalog.{SEARCH_CONFIG}', content
+        )
+        """
+    ),
+)
+
+
+# Reads the post and applies the counter deltas of whatever the upsert
+# actually changed. `xmax = 0` tells a fresh insert apart from an update,
+# and an update can only flip the opposite reaction since values are +-1.
+SET_REACTION = text(
+    """
+    WITH target AS (
+        SELECT id, user_id, like_count, dislike_count
+        FROM posts
+        WHERE id = :post_id
+    ),
+    upsert AS (
+        INSERT INTO reactions (post_id, user_id, value)
+        SELECT id, :user_id, CAST(:value AS SMALLINT)
+        FROM target
+        WHERE user_id IS DISTINCT FROM :user_id
+        ON CONFLICT (post_id, user_id) DO UPDATE
+        SET value = EXCLUDED.value
+        WHERE reactions.value <> EXCLUDED.value
+        RETURNING xmax = 0 AS inserted
+    ),
+    counters AS (
+        UPDATE posts
+        SET like_count = like_count + CASE
+                WHEN CAST(:value AS SMALLINT) = 1 THEN 1
+                WHEN upsert.inserted THEN 0
+                ELSE -1
+            END,
+            dislike_count = dislike_count + CASE
+                WHEN CAST(:value AS SMALLINT) = -1 THEN 1
+                WHEN upsert.inserted THEN 0
+                ELSE -1
+            END
+        FROM upsert
+        WHERE posts.id = :post_id
+        RETURNING posts.like_count, posts.dislike_count
+    )
+    SELECT target.user_id AS owner_id,
+           counters.like_count IS NOT NULL AS changed,
+           coalesce(counters.like_count, target.like_count) AS like_count,
+           coalesce(counters.dislike_count, target.dislike_count)
+               AS dislike_count
+    FROM target
+    LEFT JOIN counters ON true
+    """
+)
+
+UNSET_REACTION = text(
+    """
+    WITH target AS (
+        SELECT id, user_id, like_count, dislike_count
+        FROM posts
+        WHERE id = :post_id
+    ),
+    removed AS (
+        DELETE FROM reactions
+        WHERE post_id = :post_id
+          AND user_id = :user_id
+          AND value = CAST(:value AS SMALLINT)
+        RETURNING value
+    ),
+    counters AS (
+        UPDATE posts
+        SET like_count = like_count
+                - CASE WHEN removed.value = 1 THEN 1 ELSE 0 END,
+            dislike_count = dislike_count
+                - CASE WHEN removed.value = -1 THEN 1 ELSE 0 END
+        FROM removed
+        WHERE posts.id = :post_id
+        RETURNING posts.like_count, posts.dislike_count
+    )
+    SELECT target.user_id AS owner_id,
+           counters.like_count IS NOT NULL AS changed,
+           coalesce(counters.like_count, target.like_count) AS like_count,
+           coalesce(counters.dislike_count, target.dislike_count)
+               AS dislike_count
+    FROM target
+    LEFT JOIN counters ON true
+    """
+)
+
+
+# The final reaction of each (post, user) pair of a write-behind batch, 0
+# for none. Setting a state rather than applying a change keeps replays
+# harmless; pairs of deleted posts are dropped.
+APPLY_REACTIONS = text(
+    """
+    WITH batch AS (
+        SELECT *
+        FROM unnest(
+            CAST(:post_ids AS INTEGER[]),
+            CAST(:user_ids AS INTEGER[]),
+            CAST(:values AS SMALLINT[])
+        ) AS batch(post_id, user_id, value)
+    ),
+    removed AS (
+        DELETE FROM reactions
+        USING batch
+        WHERE reactions.post_id = batch.post_id
+          AND reactions.user_id = batch.user_id
+          AND batch.value = 0
+    )
+    INSERT INTO reactions (post_id, user_id, value)
+    SELECT batch.post_id, batch.user_id, batch.value
+    FROM batch
+    JOIN posts ON posts.id = batch.post_id
+    WHERE batch.value <> 0
+    ON CONFLICT (post_id, user_id) DO UPDATE
+    SET value = EXCLUDED.value
+    WHERE reactions.value <> EXCLUDED.value
+    """
+)
+
+# Counts rather than deltas, for the same reason; once per post and batch
+# however many reactions it got.
+RECOUNT_REACTIONS = text(
+    """
+    UPDATE posts
+    SET like_count = counts.likes, dislike_count = counts.dislikes
+    FROM (
+        SELECT post_ids.id,
+               count(*) FILTER (WHERE reactions.value = 1) AS likes,
+               count(*) FILTER (WHERE reactions.value = -1) AS dislikes
+        FROM unnest(CAST(:post_ids AS INTEGER[])) AS post_ids(id)
+        LEFT JOIN reactions ON reactions.post_id = post_ids.id
+        GROUP BY post_ids.id
+    ) AS counts
+    WHERE posts.id = counts.id
+    """
+)
+
+
+class ReactionModel(Base):
+    """A user's like (1) or dislike (-1) of a post, at most one per pair."""
+
+    __tablename__ = "reactions"
+
+    LIKE = 1
+    DISLIKE = -1
+
+    post_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    value = Column(SmallInteger, nullable=False)
+
+    @classmethod
+    async def set(
+        cls, session: AsyncSession, post_id: int, user_id: int, value: int
+    ) -> Optional[Row]:
+        """Sets the user's reaction and the post counters in one statement.
+
+        Returns None if the post does not exist, otherwise a row with the
+        post `owner_id`, whether anything `changed` and the resulting
+        `like_count` and `dislike_count`. Reacting to an own post never
+        changes anything.
+        """
+        params = {"post_id": post_id, "user_id": user_id, "value": value}
+        return (await session.execute(SET_REACTION, params)).first()
+
+    @classmethod
+    async def unset(
+        cls, session: AsyncSession, post_id: int, user_id: int, value: int
+    ) -> Optional[Row]:
+        """Removes the user's reaction if it is `value`, see `set`."""
+        params = {"post_id": post_id, "user_id": user_id, "value": value}
+        return (await session.execute(UNSET_REACTION, params)).first()
+
+    @classmethod
+    async def apply_batch(
+        cls, session: AsyncSession, reactions: Dict[Tuple[int, int], int]
+    ) -> None:
+        """Stores the reaction of each (post id, user id), 0 for none, and
+        recounts the counters of the posts; replaying a batch is a no-op.
+        """
+        if not reactions:
+            return
+
+        pairs = list(reactions)
+        await session.execute(
+            APPLY_REACTIONS,
+            {
+                "post_ids": [post_id for post_id, _ in pairs],
+                "user_ids": [user_id for _, user_id in pairs],
+                "values": list(reactions.values()),
+            },
+        )
+        await session.execute(
+            RECOUNT_REACTIONS,
+            {"post_ids": sorted({post_id for post_id, _ in pairs})},
+        )
+
+
 class LikeModel(Base):
+    """Legacy likes, superseded by ReactionModel and kept for rollback."""
+
     __tablename__ = "likes"
+    __table_args__ = (
+        Index("ix_likes_post_id_user_id", "post_id", "user_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     post_id = Column(Integer)
@@ -118,17 +467,9 @@ class LikeModel(Base):
         user_id: int,
         post_id: int,
     ) -> LikeModel:
-        like = LikeModel(user_id=user_id, post_id=post_id)
-        session.add(like)
-        await session.flush()
-
-        # To fetch user
-        new = await cls.read_by_id(session, like.id)
-
-        if not new:
-            raise RuntimeError()
-
-        return new
+        return await cls.insert_returning(
+            session, user_id=user_id, post_id=post_id
+        )
 
     @classmethod
     async def delete(cls, session: AsyncSession, like: LikeModel) -> None:
@@ -137,7 +478,14 @@ class LikeModel(Base):
 
 
 class DislikeModel(Base):
+    """Legacy dislikes, superseded by ReactionModel and kept for rollback."""
+
     __tablename__ = "dislikes"
+    __table_args__ = (
+        Index(
+            "ix_dislikes_post_id_user_id", "post_id", "user_id", unique=True
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     post_id = Column(Integer)
@@ -169,16 +517,9 @@ class DislikeModel(Base):
         user_id: int,
         post_id: int,
     ) -> DislikeModel:
-        dislike = DislikeModel(user_id=user_id, post_id=post_id)
-        session.add(dislike)
-        await session.flush()
-
-        new = await cls.read_by_id(session, dislike.id)
-
-        if not new:
-            raise RuntimeError()
-
-        return new
+        return await cls.insert_returning(
+            session, user_id=user_id, post_id=post_id
+        )
 
     @classmethod
     async def delete(
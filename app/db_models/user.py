@@ -1,23 +1,39 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import List, Optional
 
-from sqlalchemy import Column, Integer, String, select
+from sqlalchemy import (
+    Column,
+    Index,
+    Integer,
+    String,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.base_class import Base
 
 
 class UserModel(Base):
+    """Writes leave the user caches alone, callers run `invalidate_user`
+    once the transaction committed."""
+
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True)
-    username = Column(String)
+    username = Column(String, index=True, unique=True)
     password = Column(String)
     fullname = Column(String)
-    email = Column(String)
+    email = Column(String, index=True, unique=True)
     location = Column(String)
     company = Column(String)
+    # maintained by FollowModel transitions in the same statement
+    follower_count = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
 
     @classmethod
     async def read_by_id(
@@ -38,7 +54,9 @@ class UserModel(Base):
         company: str = None,
         location: str = None,
     ) -> UserModel:
-        user = UserModel(
+        # the INSERT hands back the stored row, no read after write
+        return await cls.insert_returning(
+            session,
             username=username,
             email=email,
             password=password,
@@ -46,23 +64,166 @@ class UserModel(Base):
             company=company,
             location=location,
         )
-        session.add(user)
-        await session.flush()
-
-        # To fetch user
-        new = await cls.read_by_id(session, user.id)
-        if not new:
-            raise RuntimeError()
-        return new
 
     async def update(
         self, session: AsyncSession, username: int, password: str
-    ) -> None:
-        self.username = username
-        self.password = password
-        await session.flush()
+    ) -> UserModel:
+        return await self.update_returning(
+            session, username=username, password=password
+        )
+
+    @classmethod
+    async def replace_password_hash(
+        cls,
+        session: AsyncSession,
+        user_id: int,
+        old_hash: str,
+        new_hash: str,
+    ) -> bool:
+        """Swaps the stored hash only if it still is `old_hash`, so that a
+        password changed in the meantime is kept."""
+        result = await session.execute(
+            update(cls)
+            .where(cls.id == user_id, cls.password == old_hash)
+            .values(password=new_hash)
+        )
+        return result.rowcount == 1
 
     @classmethod
     async def delete(cls, session: AsyncSession, user: UserModel) -> None:
         await session.delete(user)
         await session.flush()
+
+
+# Like the reaction statements: the followed user, whether the follow
+# changed anything and the resulting follower count, in one statement.
+FOLLOW = text(
+    """
+    WITH target AS (
+        SELECT id, follower_count
+        FROM users
+        WHERE id = :followee_id
+    ),
+    inserted AS (
+        INSERT INTO follows (follower_id, followee_id)
+        SELECT :follower_id, id
+        FROM target
+        ON CONFLICT (follower_id, followee_id) DO NOTHING
+        RETURNING followee_id
+    ),
+    counter AS (
+        UPDATE users
+        SET follower_count = follower_count + 1
+        FROM inserted
+        WHERE users.id = inserted.followee_id
+        RETURNING users.follower_count
+    )
+    SELECT counter.follower_count IS NOT NULL AS changed,
+           coalesce(counter.follower_count, target.follower_count)
+               AS follower_count
+    FROM target
+    LEFT JOIN counter ON true
+    """
+)
+
+UNFOLLOW = text(
+    """
+    WITH target AS (
+        SELECT id, follower_count
+        FROM users
+        WHERE id = :followee_id
+    ),
+    removed AS (
+        DELETE FROM follows
+        WHERE follower_id = :follower_id AND followee_id = :followee_id
+        RETURNING followee_id
+    ),
+    counter AS (
+        UPDATE users
+        SET follower_count = follower_count - 1
+        FROM removed
+        WHERE users.id = removed.followee_id
+        RETURNING users.follower_count
+    )
+    SELECT counter.follower_count IS NOT NULL AS changed,
+           coalesce(counter.follower_count, target.follower_count)
+               AS follower_count
+    FROM target
+    LEFT JOIN counter ON true
+    """
+)
+
+
+class FollowModel(Base):
+    """`follower_id` follows `followee_id`."""
+
+    __tablename__ = "follows"
+    __table_args__ = (
+        # the followers of a user, for fan-out
+        Index(
+            "ix_follows_followee_id_follower_id", "followee_id", "follower_id"
+        ),
+    )
+
+    follower_id = Column(Integer, primary_key=True)
+    followee_id = Column(Integer, primary_key=True)
+
+    @classmethod
+    async def follow(
+        cls, session: AsyncSession, follower_id: int, followee_id: int
+    ) -> Optional[Row]:
+        """Follows a user and counts the follower in one statement.
+
+        Returns None if the followee does not exist, otherwise a row with
+        whether anything `changed` and the resulting `follower_count`.
+        """
+        params = {"follower_id": follower_id, "followee_id": followee_id}
+        return (await session.execute(FOLLOW, params)).first()
+
+    @classmethod
+    async def unfollow(
+        cls, session: AsyncSession, follower_id: int, followee_id: int
+    ) -> Optional[Row]:
+        """Stops following a user, see `follow`."""
+        params = {"follower_id": follower_id, "followee_id": followee_id}
+        return (await session.execute(UNFOLLOW, params)).first()
+
+    @classmethod
+    async def read_follower_ids(
+        cls,
+        session: AsyncSession,
+        followee_id: int,
+        limit: int,
+        after_id: Optional[int] = None,
+    ) -> List[int]:
+        """Up to `limit` followers of a user with an id above `after_id`,
+        in id order; keyset pagination on the followee index."""
+        query = (
+            select(cls.follower_id)
+            .where(cls.followee_id == followee_id)
+            .order_by(cls.follower_id)
+            .limit(limit)
+        )
+
+        if after_id is not None:
+            query = query.where(cls.follower_id > after_id)
+
+        return (await session.execute(query)).scalars().all()
+
+    @classmethod
+    async def read_followee_ids(
+        cls,
+        session: AsyncSession,
+        follower_id: int,
+        min_followers: int = 0,
+    ) -> List[int]:
+        """The users followed, only those with at least `min_followers`."""
+        query = (
+            select(cls.followee_id)
+            .join(UserModel, UserModel.id == cls.followee_id)
+            .where(
+                cls.follower_id == follower_id,
+                UserModel.follower_count >= min_followers,
+            )
+        )
+        return (await session.execute(query)).scalars().all()
@@ -1,9 +1,23 @@
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.api_v1.api import api_router
+from app.core import metrics
 from app.core.config import settings
+from app.db.cache import cache_bus
+from app.db.pool import warm_up_engine
+from app.db.query_counter import QueryCounterMiddleware
+from app.db.redis import redis
+from app.db.replicas import replicas
+from app.db.session import async_engine
+from app.utils.email_verifier import email_verifier
+from app.workers.counters import counter_auditor
+from app.workers.reactions import reaction_flusher
+from app.workers.trending import trending_maintainer
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 app = FastAPI(
@@ -25,8 +39,61 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+app.add_middleware(QueryCounterMiddleware)
+
+# outermost, so that the time spent in the other middleware counts too
+app.add_middleware(metrics.MetricsMiddleware)
+
 
 app.include_router(api_router, prefix=settings.API_V1_PREFIX)
 
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Request metrics of this worker, in the Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.on_event("startup")
+async def startup():
+    # open pooled connections now rather than on the first requests, a
+    # primary or Redis that can not be reached fails the startup
+    await asyncio.gather(
+        warm_up_engine(async_engine, settings.DB_POOL_PREWARM),
+        redis.warm_up(settings.REDIS_POOL_PREWARM),
+        replicas.warm_up(settings.DB_POOL_PREWARM),
+    )
+
+    # keep in-process caches in sync with the other workers
+    await cache_bus.start()
+    await replicas.start()
+    await trending_maintainer.start()
+    if settings.REACTIONS_WRITE_BEHIND:
+        await reaction_flusher.start()
+    if settings.COUNTER_AUDIT_ENABLED:
+        await counter_auditor.start()
+
+    app.state.ready = True
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # uvicorn runs this once the requests in flight are done, so the
+    # pools can be closed right away
+    app.state.ready = False
+
+    # background tasks in the reverse order of startup
+    await counter_auditor.stop()
+    await reaction_flusher.stop()
+    await trending_maintainer.stop()
+    await replicas.stop()
+    await cache_bus.stop()
+    await email_verifier.close()
+    await async_engine.dispose()
+    await redis.close()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
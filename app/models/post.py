@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
@@ -30,6 +32,31 @@ class ResponseGetPost(BaseModel):
     dislikes: int = 0
 
 
+class ResponseListPosts(BaseModel):
+    posts: List[ResponseGetPost]
+    # pass back as `cursor` to fetch the next page, null on the last page
+    next_cursor: Optional[int] = None
+
+
+class ResponseSearchPosts(BaseModel):
+    # best match first
+    posts: List[ResponseGetPost]
+    # pass back as `cursor` to fetch the next page, null on the last page
+    next_cursor: Optional[str] = None
+
+
+class ResponseTrendingPosts(BaseModel):
+    window: str
+    # best first
+    posts: List[ResponseGetPost]
+
+
+class ResponseBatchGetPost(BaseModel):
+    # one entry per requested id in request order, null if it does not exist
+    posts: List[Optional[ResponseGetPost]]
+    missing: List[int] = []
+
+
 class Like(BaseModel):
     id: int
     post_id: int
@@ -1,28 +1,69 @@
-from fastapi import HTTPException
+from fastapi import BackgroundTasks, Depends, HTTPException
 
+from app.db.session import RequestSession, get_session
+from app.db_models.user import UserModel
 from app.models.user import User, LoginSchema
 from app.selectors.user import get_user_by_username
+from app.services.user import invalidate_user
 from app.utils.jwt import create_access_token
-from app.utils.password import verify_password
+from app.utils.password import (
+    get_password_hash,
+    needs_rehash,
+    verify_password,
+)
 from ..base import BaseService
 
 
 class SignInService(BaseService):
+    def __init__(
+        self,
+        background_tasks: BackgroundTasks,
+        session: RequestSession = Depends(get_session),
+    ):
+        super().__init__(session)
+        self.background_tasks = background_tasks
+
     async def execute(self, login: LoginSchema):
-        async with self.async_session.begin() as session:
+        # signin right after signup must find the user
+        scope = f"username:{login.username}"
+
+        async with self.async_session.read(scope) as session:
             db_user = await get_user_by_username(login.username, session)
 
-            if not db_user:
-                raise HTTPException(
-                    status_code=400, detail="User does not exists"
-                )
+        if not db_user:
+            raise HTTPException(
+                status_code=400, detail="User does not exists"
+            )
+
+        # hashing may wait for a worker, do not hold a connection meanwhile
+        if not await verify_password(login.password, db_user.password):
+            raise HTTPException(
+                status_code=400, detail="Incorrect username or password"
+            )
 
-            if not verify_password(login.password, db_user.password):
-                raise HTTPException(
-                    status_code=400, detail="Incorrect username or password"
-                )
+        if needs_rehash(db_user.password):
+            # after the response is sent, signin does not wait for it
+            self.background_tasks.add_task(
+                self.upgrade_password_hash,
+                db_user.id,
+                login.password,
+                db_user.password,
+            )
 
-            # generate access token for the newly created user
-            access_token = create_access_token(data={"user_id": db_user.id})
+        # generate access token for the newly created user
+        access_token = create_access_token(data={"user_id": db_user.id})
+
+        return {"access_token": access_token}
+
+    async def upgrade_password_hash(
+        self, user_id: int, password: str, old_hash: str
+    ) -> None:
+        new_hash = await get_password_hash(password)
+
+        async with self.async_session.begin() as session:
+            replaced = await UserModel.replace_password_hash(
+                session, user_id, old_hash, new_hash
+            )
 
-            return {"access_token": access_token}
+        if replaced:
+            await invalidate_user(user_id)
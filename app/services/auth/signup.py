@@ -1,41 +1,58 @@
-import requests
 from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
 
-from app.core.config import settings
 from app.models.user import User
 from app.selectors.user import get_user_by_username
 from app.services.user import UserService
+from app.utils.email_verifier import VerifierUnavailable, email_verifier
 from app.utils.password import get_password_hash
 from ..base import BaseService
 
 
 class SignupService(BaseService):
     async def execute(self, user: User):
-        async with self.async_session.begin() as session:
-            db_user = await get_user_by_username(user.username, session)
+        # Verify the email address using Email-hunter, before taking a
+        # connection for the transaction
+        try:
+            email_verified = await email_verifier.verify(user.email)
+        except VerifierUnavailable:
+            raise HTTPException(
+                status_code=503,
+                detail="Email verification is unavailable, try again later",
+            )
 
-            if db_user:
-                raise HTTPException(
-                    status_code=400, detail="Username already registered"
-                )
+        if not email_verified:
+            raise HTTPException(
+                status_code=400, detail="Error verifying email address"
+            )
 
-            # Verify the email address using Email-hunter
-            url = f"https://api.hunter.io/v2/email-verifier?email={user.email}&api_key={settings.EMAILHUNTER_API_KEY}"
-            emailhunter_response = requests.get(url)
+        scope = f"username:{user.username}"
 
-            if emailhunter_response.status_code != 200:
-                raise HTTPException(
-                    status_code=400, detail="Error verifying email address"
-                )
+        async with self.async_session.read(scope) as session:
+            db_user = await get_user_by_username(user.username, session)
+
+        if db_user:
+            raise HTTPException(
+                status_code=400, detail="Username already registered"
+            )
 
-            # hash the user password
-            hashed_password = get_password_hash(user.password)
+        # hash the user password, outside of the transaction as it may
+        # wait for a hashing worker
+        hashed_password = await get_password_hash(user.password)
+
+        async with self.async_session.begin(scope) as session:
             user = User(
                 username=user.username,
                 password=hashed_password,
                 email=user.email,
             )
 
-            # create new user
-            await UserService().create(user=user, session=session)
+            # create new user, the unique indexes catch concurrent signups
+            try:
+                await UserService().create(user=user, session=session)
+            except IntegrityError:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Username or email already registered",
+                )
             return True
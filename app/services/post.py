@@ -1,52 +1,406 @@
-from fastapi import Depends, HTTPException
-from sqlalchemy.orm import sessionmaker
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import BackgroundTasks, Depends, HTTPException
 
 from app.api.api_v1.mixins import PostAuthorizeMixin
-from app.db.session import get_session
-from app.db.redis import RedisConnection
-from app.db_models.post import PostModel, LikeModel, DislikeModel
-from app.db_models.user import UserModel
-from app.models.post import PostIn, Post, PostInUpdate, ResponseGetPost
+from app.core.config import settings
+from app.db.cache import cache_bus, post_cache, post_local_cache
+from app.db.redis import (
+    DISLIKE,
+    LIKE,
+    UNDISLIKE,
+    UNLIKE,
+    redis,
+    timeline_key,
+    user_posts_key,
+)
+from app.db.session import RequestSession, get_session
+from app.db_models.post import PostModel, ReactionModel
+from app.db_models.user import FollowModel, UserModel
+from app.models.post import (
+    PostIn,
+    Post,
+    PostInUpdate,
+    ResponseBatchGetPost,
+    ResponseGetPost,
+    ResponseListPosts,
+    ResponseSearchPosts,
+    ResponseTrendingPosts,
+)
+from .base import BaseService
+
+
+async def read_reactions_counts(
+    posts: List[PostModel],
+) -> Dict[int, Tuple[int, int]]:
+    """(likes, dislikes) of posts loaded with their counter columns.
+
+    The columns are exact, unless reactions are written behind: Redis is
+    ahead of Postgres then, and the columns only fill in for the posts
+    Redis lost the counters of.
+    """
+    stored = {post.id: (post.like_count, post.dislike_count) for post in posts}
+    if not settings.REACTIONS_WRITE_BEHIND:
+        return stored
+
+    live = await redis.read_counts(list(stored))
+    missing = {
+        post_id: counts
+        for post_id, counts in stored.items()
+        if live[post_id] is None
+    }
+    if missing:
+        await redis.seed_counts(missing)
+    return {
+        post_id: live[post_id] or stored[post_id] for post_id in stored
+    }
+
+
+async def invalidate_post(post_id: int) -> None:
+    """Drops a post from every cache tier once its write has committed."""
+    # Redis first, so that no worker can refill its local copy from there
+    await post_cache.invalidate(post_id)
+    await cache_bus.invalidate("post", post_id)
+
+
+def build_post_response(
+    post: PostModel, counts: Dict[int, Tuple[int, int]]
+) -> ResponseGetPost:
+    likes, dislikes = counts[post.id]
+    return ResponseGetPost(
+        post=Post.from_orm(post), likes=likes, dislikes=dislikes
+    )
+
+
+class PostBodyMixin:
+    async def read(self, post_id: int) -> Optional[str]:
+        return await post_cache.read(post_id, self.load)
+
+    async def load(self, post_id: int) -> Optional[str]:
+        # a stale replica read would be cached for the whole cache ttl
+        async with self.async_session.read(f"post:{post_id}") as session:
+            post = await PostModel.read_by_id(session, post_id)
 
-# from app.main import redis
-redis = RedisConnection()
+        return Post.from_orm(post).json() if post else None
 
 
-class BaseService:
-    def __init__(self, session: sessionmaker = Depends(get_session)):
-        self.async_session = session
+class GetPostService(PostBodyMixin, BaseService):
+    async def read_counts(self, post_id: int) -> Tuple[int, int]:
+        counts = (await redis.read_counts([post_id]))[post_id]
+        if counts is not None:
+            return counts
 
+        # none yet, or Redis lost them: the columns, kept for next time
+        async with self.async_session.read(f"post:{post_id}") as session:
+            stored = await PostModel.read_counts(session, [post_id])
+        if post_id not in stored:
+            return 0, 0
+        await redis.seed_counts(stored)
+        return stored[post_id]
 
-class GetPostService(BaseService):
     async def execute(self, post_id) -> ResponseGetPost:
-        async with self.async_session.begin() as session:
-            post = await PostModel.read_by_id(session, post_id)
+        # worker memory, then Redis, then Postgres; counters are live
+        body = await post_local_cache.get_or_load(post_id, self.read)
+
+        if body is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+
+        likes, dislikes = await self.read_counts(post_id)
+        return ResponseGetPost(
+            post=Post.parse_raw(body), likes=likes, dislikes=dislikes
+        )
+
+
+class ListPostsService(BaseService):
+    async def execute(
+        self,
+        limit: int,
+        cursor: Optional[int] = None,
+        user_id: Optional[int] = None,
+    ) -> ResponseListPosts:
+        async with self.async_session.read() as session:
+            # one extra row tells whether there is a next page
+            posts = await PostModel.read_page(
+                session, limit + 1, before_id=cursor, user_id=user_id
+            )
+
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            next_cursor = posts[-1].id
 
-            like_key = f"post:{post_id}:likes"
-            dislike_key = f"post:{post_id}:dislikes"
+        counts = await read_reactions_counts(posts)
 
-            if not redis.is_connected():
-                # connect to redis host
-                await redis.connect()
+        return ResponseListPosts(
+            posts=[build_post_response(post, counts) for post in posts],
+            next_cursor=next_cursor,
+        )
 
-            likes = await redis.get(like_key)
-            dislikes = await redis.get(dislike_key)
 
-            return ResponseGetPost(
-                post=Post.from_orm(post), likes=likes, dislikes=dislikes
+class BatchGetPostService(BaseService):
+    async def execute(self, post_ids: List[int]) -> ResponseBatchGetPost:
+        unique_ids = list(dict.fromkeys(post_ids))
+
+        async with self.async_session.read() as session:
+            posts = {
+                post.id: post
+                for post in await PostModel.read_by_ids(session, unique_ids)
+            }
+
+        counts = await read_reactions_counts(list(posts.values()))
+
+        return ResponseBatchGetPost(
+            posts=[
+                build_post_response(posts[post_id], counts)
+                if post_id in posts
+                else None
+                for post_id in post_ids
+            ],
+            missing=[
+                post_id for post_id in unique_ids if post_id not in posts
+            ],
+        )
+
+
+class SearchPostsService(BaseService):
+    @staticmethod
+    def parse_cursor(cursor: str) -> Tuple[float, int]:
+        # "<rank>:<post id>" of the last post of the previous page
+        rank, _, post_id = cursor.partition(":")
+        try:
+            return float(rank), int(post_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    async def execute(
+        self,
+        query: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        user_id: Optional[int] = None,
+    ) -> ResponseSearchPosts:
+        after = self.parse_cursor(cursor) if cursor is not None else None
+
+        async with self.async_session.read() as session:
+            # one extra row tells whether there is a next page
+            rows = await PostModel.search(
+                session, query, limit + 1, after=after, user_id=user_id
             )
 
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            post, rank = rows[-1]
+            next_cursor = f"{rank}:{post.id}"
+
+        posts = [post for post, _ in rows]
+        counts = await read_reactions_counts(posts)
+
+        return ResponseSearchPosts(
+            posts=[build_post_response(post, counts) for post in posts],
+            next_cursor=next_cursor,
+        )
+
+
+class TrendingPostsService(BaseService):
+    async def execute(self, window: str, limit: int) -> ResponseTrendingPosts:
+        post_ids = await redis.trending(window, limit)
+
+        # one query for the page, whatever its size
+        async with self.async_session.read() as session:
+            posts = {
+                post.id: post
+                for post in await PostModel.read_by_ids(session, post_ids)
+            }
+
+        counts = await read_reactions_counts(list(posts.values()))
+
+        return ResponseTrendingPosts(
+            window=window,
+            posts=[
+                build_post_response(posts[post_id], counts)
+                for post_id in post_ids
+                if post_id in posts
+            ],
+        )
+
+
+class TimelineService(BaseService):
+    """The home timeline of a user: its posts and those of the users it
+    follows, newest first.
+
+    Posts of most authors are fanned out on write to the Redis timeline of
+    each follower. Those of celebrities, authors with too many followers to
+    write to all of them, are merged in on read from the recent posts of
+    each followed celebrity, read in the same round trip. Lists not kept in
+    Redis are rebuilt from Postgres, pages older than the lists hold come
+    from Postgres.
+    """
+
+    async def execute(
+        self, user_id: int, limit: int, cursor: Optional[int] = None
+    ) -> ResponseListPosts:
+        async with self.async_session.read() as session:
+            celebrities = await FollowModel.read_followee_ids(
+                session,
+                user_id,
+                min_followers=settings.TIMELINE_CELEBRITY_THRESHOLD,
+            )
+
+        keys = [timeline_key(user_id)]
+        keys.extend(user_posts_key(author_id) for author_id in celebrities)
+        # one extra post tells whether there is a next page
+        lists = await redis.read_post_lists(keys, limit + 1, before_id=cursor)
+
+        post_ids = set()
+        # the merge holds every post from `bound` on: a full list may have
+        # had older posts trimmed, it only holds them down to its last id
+        bound = None
+        for key, author_id, post_list in zip(
+            keys, [None, *celebrities], lists
+        ):
+            if post_list is None:
+                post_list = await self.rebuild(
+                    key, user_id, author_id, limit + 1, cursor
+                )
+            ids, full = post_list
+            post_ids.update(ids)
+            if full:
+                list_bound = ids[-1] if ids else cursor
+                bound = list_bound if bound is None else max(bound, list_bound)
+
+        if bound is not None:
+            post_ids = {post_id for post_id in post_ids if post_id >= bound}
+        post_ids = sorted(post_ids, reverse=True)[: limit + 1]
+        if len(post_ids) <= limit and bound is not None:
+            # past the end of what Redis keeps
+            async with self.async_session.read() as session:
+                post_ids.extend(
+                    await PostModel.read_timeline_ids(
+                        session,
+                        user_id,
+                        limit + 1 - len(post_ids),
+                        before_id=bound,
+                    )
+                )
+
+        next_cursor = None
+        if len(post_ids) > limit:
+            post_ids = post_ids[:limit]
+            next_cursor = post_ids[-1]
+
+        async with self.async_session.read() as session:
+            posts = {
+                post.id: post
+                for post in await PostModel.read_by_ids(session, post_ids)
+            }
+
+        counts = await read_reactions_counts(list(posts.values()))
+
+        return ResponseListPosts(
+            # deleted posts stay in timelines until trimmed, skip them
+            posts=[
+                build_post_response(posts[post_id], counts)
+                for post_id in post_ids
+                if post_id in posts
+            ],
+            next_cursor=next_cursor,
+        )
+
+    async def rebuild(
+        self,
+        key: str,
+        user_id: int,
+        author_id: Optional[int],
+        limit: int,
+        before_id: Optional[int],
+    ) -> Tuple[List[int], bool]:
+        """Stores the post list `key` from Postgres, the timeline of
+        `user_id` or the recent posts of `author_id`; returns a page of it
+        as `read_post_lists` does."""
+        # kept before Postgres is read: a post committed after the read is
+        # fanned out after the list is kept, and lands in it
+        await redis.keep_post_list(key)
+
+        async with self.async_session.read() as session:
+            if author_id is None:
+                post_ids = await PostModel.read_timeline_ids(
+                    session, user_id, settings.TIMELINE_MAX_POSTS
+                )
+            else:
+                post_ids = [
+                    post.id
+                    for post in await PostModel.read_page(
+                        session,
+                        settings.TIMELINE_MAX_POSTS,
+                        user_id=author_id,
+                    )
+                ]
+        await redis.store_post_list(key, post_ids)
+
+        page = [
+            post_id
+            for post_id in post_ids
+            if before_id is None or post_id < before_id
+        ]
+        return page[:limit], len(post_ids) >= settings.TIMELINE_MAX_POSTS
+
 
 class CreatePostService(BaseService):
+    def __init__(
+        self,
+        background_tasks: BackgroundTasks,
+        session: RequestSession = Depends(get_session),
+    ):
+        super().__init__(session)
+        self.background_tasks = background_tasks
+
     async def execute(self, post: PostIn, user_id: int) -> Post:
         async with self.async_session.begin() as session:
             post = await PostModel.create(session, user_id, post.content)
-            return Post.from_orm(post)
+
+        # anyone may read the post right away, replicas may not have it yet
+        await self.async_session.pin(f"post:{post.id}")
+        # a read of the id before it existed may be cached as missing
+        await invalidate_post(post.id)
+        # after the response is sent, the author does not wait for it
+        self.background_tasks.add_task(self.fan_out, post.id, user_id)
+        return Post.from_orm(post)
+
+    async def fan_out(self, post_id: int, user_id: int) -> None:
+        """Adds a new post to the timelines of the author and of its
+        followers, unless the author is a celebrity, and to the recent
+        posts of the author."""
+        await redis.push_post(
+            post_id, [user_posts_key(user_id), timeline_key(user_id)]
+        )
+
+        async with self.async_session.read() as session:
+            author = await UserModel.read_by_id(session, user_id)
+        if author.follower_count >= settings.TIMELINE_CELEBRITY_THRESHOLD:
+            return
+
+        batch_size = settings.TIMELINE_FAN_OUT_BATCH_SIZE
+        after_id = None
+        while True:
+            # a connection per batch, not for the whole fan-out
+            async with self.async_session.read() as session:
+                follower_ids = await FollowModel.read_follower_ids(
+                    session, user_id, batch_size, after_id=after_id
+                )
+            await redis.push_post(
+                post_id, [timeline_key(follower) for follower in follower_ids]
+            )
+            if len(follower_ids) < batch_size:
+                return
+            after_id = follower_ids[-1]
 
 
 class UpdatePostService(PostAuthorizeMixin, BaseService):
     async def execute(self, post: PostInUpdate, user: UserModel) -> Post:
-        async with self.async_session.begin() as session:
+        scope = f"post:{post.post_id}"
+
+        async with self.async_session.begin(scope) as session:
             post_db = await PostModel.read_by_id(session, post.post_id)
 
             if not post_db:
@@ -55,16 +409,18 @@ class UpdatePostService(PostAuthorizeMixin, BaseService):
             # check if current user permission to update such object
             self.auth(post_db, user)
 
-            await post_db.update(
+            # UPDATE ... RETURNING refreshes post_db, no refresh() needed
+            post_db = await post_db.update(
                 session, user_id=user.id, content=post.content
             )
-            await session.refresh(post_db)
-            return Post.from_orm(post_db)
+
+        await invalidate_post(post_db.id)
+        return Post.from_orm(post_db)
 
 
 class DeletePostService(PostAuthorizeMixin, BaseService):
     async def execute(self, post_id: int, user: UserModel) -> dict:
-        async with self.async_session.begin() as session:
+        async with self.async_session.begin(f"post:{post_id}") as session:
             post = await PostModel.read_by_id(session, post_id)
 
             if not post:
@@ -74,224 +430,141 @@ class DeletePostService(PostAuthorizeMixin, BaseService):
             self.auth(post, user)
 
             await PostModel.delete(session, post)
-            return {}
-
-
-class LikePostService(BaseService):
-    async def execute(self, post_id: int, current_user: UserModel) -> dict:
-        async with self.async_session.begin() as session:
-            # Check if the post exists
-            post = await PostModel.read_by_id(session, post_id)
-
-            if not post:
-                raise HTTPException(status_code=404, detail="Post not found")
 
-            # Check if the user has owns the post
-            if post.user_id == current_user.id:
-                raise HTTPException(
-                    status_code=400, detail="User can not like his own post"
-                )
-
-            # Check if the user has already liked the post
-            existing_like = await LikeModel.existing_like(
-                session, post_id, current_user.id
-            )
+        await invalidate_post(post_id)
+        await redis.forget_trending(post_id)
+        return {}
 
-            if existing_like:
-                raise HTTPException(
-                    status_code=400, detail="You have already liked this post"
-                )
 
-            # delete dislike if exists
-            dislike = await DislikeModel.existing_dislike(
-                session, post_id, current_user.id
-            )
+class ReactionServiceMixin(PostBodyMixin):
+    own_post_detail: str
+    detail: str
+    message: str
 
-            if dislike:
-                await DislikeModel.delete(session, dislike)
+    def check_transition(self, result, current_user: UserModel) -> None:
+        """Maps the outcome of a ReactionModel transition to HTTP errors."""
+        if not result:
+            raise HTTPException(status_code=404, detail="Post not found")
 
-            await self.update_cache(post_id, current_user)
+        if result.owner_id == current_user.id:
+            raise HTTPException(status_code=400, detail=self.own_post_detail)
 
-            await LikeModel.create(
-                session, post_id=post_id, user_id=current_user.id
-            )
-            return {"message": "Post liked successfully"}
+        if not result.changed:
+            raise HTTPException(status_code=400, detail=self.detail)
 
     @staticmethod
-    async def update_cache(post_id: int, current_user):
-        if not redis.is_connected():
-            await redis.connect()
-
-        key = f"post:{post_id}:likes"
-        post_users_likes_key = f"post:{post_id}:likes:users"
-
-        dislike_key = f"post:{post_id}:dislikes"
-        post_users_dislikes_key = f"post:{post_id}:dislikes:users"
-
-        # Increment the number of likes for the post
-        await redis.incr(key)
-
-        # add user to likes set
-        await redis.set(post_users_likes_key, current_user.id)
-
-        # check if user disliked this post
-        if current_user.id in await redis.get_set(post_users_dislikes_key):
+    async def update_cache(
+        post_id: int, current_user, transition: str, result
+    ) -> None:
+        # one atomic round trip for both counters and both member sets;
+        # the counters Postgres returned are exact, even after a flush
+        await redis.react(
+            post_id,
+            current_user.id,
+            transition,
+            counts=(result.like_count, result.dislike_count),
+        )
+
+    async def write_behind(
+        self, post_id: int, current_user: UserModel, transition: str
+    ) -> None:
+        """Applies the transition to Redis only and queues it for the
+        flusher. The post comes from the post cache, the Redis member sets
+        decide whether anything changes."""
+        body = await post_local_cache.get_or_load(post_id, self.read)
+        if body is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+
+        if Post.parse_raw(body).user_id == current_user.id:
+            raise HTTPException(status_code=400, detail=self.own_post_detail)
+
+        changed, _, _ = await redis.react(
+            post_id,
+            current_user.id,
+            transition,
+            stream=settings.REACTIONS_STREAM,
+        )
+        if not changed:
+            raise HTTPException(status_code=400, detail=self.detail)
+
+
+class LikePostService(ReactionServiceMixin, BaseService):
+    own_post_detail = "User can not like his own post"
+    detail = "You have already liked this post"
+    message = "Post liked successfully"
 
-            # decrement the dislikes for this post
-            await redis.decr(dislike_key)
-
-            # remove user from dislikes set
-            await redis.srem(post_users_dislikes_key, current_user.id)
-
-
-class UnLikePostService(BaseService):
     async def execute(self, post_id: int, current_user: UserModel) -> dict:
-        async with self.async_session.begin() as session:
-            # Check if the post exists
-            post = await PostModel.read_by_id(session, post_id)
-
-            if not post:
-                raise HTTPException(status_code=404, detail="Post not found")
-
-            # Check if the user has owns the post
-            if post.user_id == current_user.id:
-                raise HTTPException(
-                    status_code=400, detail="User can not unlike his own post"
-                )
+        if settings.REACTIONS_WRITE_BEHIND:
+            await self.write_behind(post_id, current_user, LIKE)
+            return {"message": self.message}
 
-            # Check if the user has already liked the post
-            existing_like = await LikeModel.existing_like(
-                session, post_id, current_user.id
+        async with self.async_session.begin() as session:
+            # like and drop a previous dislike in a single statement
+            result = await ReactionModel.set(
+                session, post_id, current_user.id, ReactionModel.LIKE
             )
+            self.check_transition(result, current_user)
 
-            if not existing_like:
-                raise HTTPException(
-                    status_code=400, detail="Post should be liked first"
-                )
-
-            key = f"post:{post_id}:likes"
-            post_users_likes_key = f"post:{post_id}:likes:users"
+        await self.update_cache(post_id, current_user, LIKE, result)
+        return {"message": self.message}
 
-            await redis.decr(key)
-            await redis.srem(post_users_likes_key, current_user.id)
 
-            await LikeModel.delete(session, existing_like)
-            return {"message": "Post unliked successfully"}
+class UnLikePostService(ReactionServiceMixin, BaseService):
+    own_post_detail = "User can not unlike his own post"
+    detail = "Post should be liked first"
+    message = "Post unliked successfully"
 
-
-class DisLikePostService(BaseService):
     async def execute(self, post_id: int, current_user: UserModel) -> dict:
-        async with self.async_session.begin() as session:
-            # Check if the post exists
-            post = await PostModel.read_by_id(session, post_id)
-
-            if not post:
-                raise HTTPException(status_code=404, detail="Post not found")
-
-            # Check if the user has owns the post
-            if post.user_id == current_user.id:
-                raise HTTPException(
-                    status_code=400, detail="User can not dislike his own post"
-                )
-
-            # Check if the user has already disliked the post
-            existing_dislike = await DislikeModel.existing_dislike(
-                session, post_id, current_user.id
-            )
-
-            if existing_dislike:
-                raise HTTPException(
-                    status_code=400,
-                    detail="You have already disliked this post",
-                )
+        if settings.REACTIONS_WRITE_BEHIND:
+            await self.write_behind(post_id, current_user, UNLIKE)
+            return {"message": self.message}
 
-            # delete like if exists
-            like = await DislikeModel.existing_dislike(
-                session, post_id, current_user.id
+        async with self.async_session.begin() as session:
+            result = await ReactionModel.unset(
+                session, post_id, current_user.id, ReactionModel.LIKE
             )
+            self.check_transition(result, current_user)
 
-            if like:
-                await LikeModel.delete(session, like)
-
-            if not redis.is_connected():
-                # connect to redis host
-                await redis.connect()
+        await self.update_cache(post_id, current_user, UNLIKE, result)
+        return {"message": self.message}
 
-            key = f"post:{post_id}:dislikes"
-            like_key = f"post:{post_id}:likes"
 
-            # Increment the number of dislikes for the post
-            await redis.incr(key)
+class DisLikePostService(ReactionServiceMixin, BaseService):
+    own_post_detail = "User can not dislike his own post"
+    detail = "You have already disliked this post"
+    message = "Post disliked successfully"
 
-            # Remove the post from the likes set, if it exists
-            await redis.decr(like_key)
+    async def execute(self, post_id: int, current_user: UserModel) -> dict:
+        if settings.REACTIONS_WRITE_BEHIND:
+            await self.write_behind(post_id, current_user, DISLIKE)
+            return {"message": self.message}
 
-            await DislikeModel.create(
-                session, post_id=post_id, user_id=current_user.id
+        async with self.async_session.begin() as session:
+            # dislike and drop a previous like in a single statement
+            result = await ReactionModel.set(
+                session, post_id, current_user.id, ReactionModel.DISLIKE
             )
-            return {"message": "Post disliked successfully"}
-
-    @staticmethod
-    async def update_cache(post_id: int, current_user):
-        if not redis.is_connected():
-            await redis.connect()
+            self.check_transition(result, current_user)
 
-        key = f"post:{post_id}:dislikes"
-        post_users_dislikes_key = f"post:{post_id}:dislikes:users"
+        await self.update_cache(post_id, current_user, DISLIKE, result)
+        return {"message": self.message}
 
-        like_key = f"post:{post_id}:likes"
-        post_users_likes_key = f"post:{post_id}:likes:users"
 
-        # Increment the number of dislikes for the post
-        await redis.incr(key)
+class UnDisLikePostService(ReactionServiceMixin, BaseService):
+    own_post_detail = "User can not undislike his own post"
+    detail = "Post should be disliked first"
+    message = "Post undisliked successfully"
 
-        # add user to dislikes set
-        await redis.set(post_users_dislikes_key, current_user.id)
-
-        # check if user disliked this post
-        if current_user.id in await redis.get_set(post_users_likes_key):
-            # decrement the likes for this post
-            await redis.decr(like_key)
-
-            # remove user from likes set
-            await redis.srem(post_users_likes_key, current_user.id)
-
-
-class UnDisLikePostService(BaseService):
     async def execute(self, post_id: int, current_user: UserModel) -> dict:
-        async with self.async_session.begin() as session:
-            # Check if the post exists
-            post = await PostModel.read_by_id(session, post_id)
-
-            if not post:
-                raise HTTPException(status_code=404, detail="Post not found")
+        if settings.REACTIONS_WRITE_BEHIND:
+            await self.write_behind(post_id, current_user, UNDISLIKE)
+            return {"message": self.message}
 
-            # Check if the user has owns the post
-            if post.user_id == current_user.id:
-                raise HTTPException(
-                    status_code=400,
-                    detail="User can not undislike his own post",
-                )
-
-            # Check if the user has already disliked the post
-            existing_dislike = await DislikeModel.existing_dislike(
-                session, post_id, current_user.id
+        async with self.async_session.begin() as session:
+            result = await ReactionModel.unset(
+                session, post_id, current_user.id, ReactionModel.DISLIKE
             )
+            self.check_transition(result, current_user)
 
-            if not existing_dislike:
-                raise HTTPException(
-                    status_code=400, detail="Post should be disliked first"
-                )
-
-            if not redis.is_connected():
-                # connect to redis host
-                await redis.connect()
-
-            key = f"post:{post_id}:dislikes"
-            post_users_dislikes_key = f"post:{post_id}:dislikes:users"
-
-            await redis.decr(key)
-            await redis.srem(post_users_dislikes_key, current_user.id)
-
-            await DislikeModel.delete(session, existing_dislike)
-            return {"message": "Post undisliked successfully"}
+        await self.update_cache(post_id, current_user, UNDISLIKE, result)
+        return {"message": self.message}
@@ -1,10 +1,19 @@
-from fastapi import Depends
+from fastapi import Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
+from app.db.cache import cache_bus
+from app.db.redis import redis, timeline_key
 from app.db.session import get_session
-from app.db_models.user import UserModel
+from app.db_models.user import FollowModel, UserModel
 from app.models.user import User
+from .base import BaseService
+
+
+async def invalidate_user(user_id: int) -> None:
+    """Drops a user from the caches of every worker once its write has
+    committed, earlier another request could cache the old row again."""
+    await cache_bus.invalidate("user", user_id)
 
 
 class UserService:
@@ -15,3 +24,61 @@ class UserService:
     async def create(*, user: User, session) -> UserModel:
         new_user = await UserModel.create(session, **user.dict())
         return new_user
+
+
+class FollowServiceMixin:
+    own_user_detail: str
+    detail: str
+    message: str
+
+    def check_transition(self, result) -> None:
+        """Maps the outcome of a FollowModel transition to HTTP errors."""
+        if not result:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        if not result.changed:
+            raise HTTPException(status_code=400, detail=self.detail)
+
+    async def after_commit(self, user_id: int, current_user) -> None:
+        # the cached user has the former follower count
+        await invalidate_user(user_id)
+        # the posts of the timeline changed, rebuilt on the next read
+        await redis.forget_post_list(timeline_key(current_user.id))
+
+
+class FollowService(FollowServiceMixin, BaseService):
+    own_user_detail = "User can not follow himself"
+    detail = "You already follow this user"
+    message = "User followed successfully"
+
+    async def execute(self, user_id: int, current_user: UserModel) -> dict:
+        if user_id == current_user.id:
+            raise HTTPException(status_code=400, detail=self.own_user_detail)
+
+        async with self.async_session.begin() as session:
+            result = await FollowModel.follow(
+                session, current_user.id, user_id
+            )
+            self.check_transition(result)
+
+        await self.after_commit(user_id, current_user)
+        return {"message": self.message}
+
+
+class UnfollowService(FollowServiceMixin, BaseService):
+    own_user_detail = "User can not unfollow himself"
+    detail = "User should be followed first"
+    message = "User unfollowed successfully"
+
+    async def execute(self, user_id: int, current_user: UserModel) -> dict:
+        if user_id == current_user.id:
+            raise HTTPException(status_code=400, detail=self.own_user_detail)
+
+        async with self.async_session.begin() as session:
+            result = await FollowModel.unfollow(
+                session, current_user.id, user_id
+            )
+            self.check_transition(result)
+
+        await self.after_commit(user_id, current_user)
+        return {"message": self.message}
@@ -0,0 +1,147 @@
+import asyncio
+import sys
+from collections import OrderedDict
+from functools import partial
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded in-process cache with per-entry expiry and LRU eviction.
+
+    Bounded by entry count and, if `max_bytes` is set, by the sum of the
+    sizes given to `set`. Meant to be used from the event loop only, so it
+    does no locking.
+    """
+
+    def __init__(
+        self, maxsize: int, ttl: float, max_bytes: Optional[int] = None
+    ):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (expires_at, value, size), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value, _ = entry
+        if expires_at <= monotonic():
+            self.invalidate(key)
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        size: int = 0,
+    ):
+        self.invalidate(key)
+
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (monotonic() + ttl, value, size)
+        self.bytes += size
+
+        while len(self._entries) > self.maxsize or (
+            self.max_bytes is not None and self.bytes > self.max_bytes
+        ):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TieredCache(TTLCache):
+    """TTLCache in front of a slower tier such as Redis or Postgres.
+
+    Values come from the `load` coroutine passed to `get_or_load`, and are
+    weighed with `sizeof` against `max_bytes`. Concurrent misses for a key
+    share a single load, so an expiring hot entry sends one request to the
+    next tier rather than one per caller.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+    ):
+        super().__init__(maxsize, ttl, max_bytes)
+        self.sizeof = sizeof
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+
+    async def get_or_load(
+        self, key: Hashable, load: Callable[[Hashable], Awaitable[Any]]
+    ) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(load(key))
+            self._loading[key] = task
+            task.add_done_callback(partial(self._loaded, key))
+
+        # a caller going away must not cancel the load for the others
+        return await asyncio.shield(task)
+
+    def _loaded(self, key: Hashable, task: asyncio.Future) -> None:
+        # invalidated while loading, the value may predate the write
+        if self._loading.get(key) is not task:
+            return
+
+        del self._loading[key]
+        if not task.cancelled() and task.exception() is None:
+            value = task.result()
+            self.set(key, value, size=self.sizeof(value))
+
+    def invalidate(self, key: Hashable) -> None:
+        super().invalidate(key)
+        self._loading.pop(key, None)
+
+    def clear(self) -> None:
+        super().clear()
+        self._loading.clear()
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+from app.db.redis import redis
+
+logger = logging.getLogger(__name__)
+
+
+class VerifierUnavailable(Exception):
+    """The verifier could not give an answer, nothing is known about the
+    address."""
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while.
+
+    Opens after `failure_threshold` consecutive failures. Once
+    `reset_timeout` seconds passed a single trial call is let through,
+    which closes the breaker on success and opens it again on failure.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+
+        if self.trial or monotonic() - self.opened_at < self.reset_timeout:
+            return False
+
+        self.trial = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial = False
+
+        if self.opened_at is not None or (
+            self.failures >= self.failure_threshold
+        ):
+            self.opened_at = monotonic()
+
+    def abandon_trial(self) -> None:
+        """The trial call ended without an outcome, such as when it was
+        cancelled; the next call may try again."""
+        self.trial = False
+
+    def reset(self) -> None:
+        self.record_success()
+
+
+class EmailVerifier:
+    """Async client of the Email-hunter email verifier.
+
+    Calls share one pooled HTTP client, are bounded in time and number,
+    and are skipped while the circuit breaker is open. Verdicts are cached
+    in Redis by address, failures to get one are not.
+    """
+
+    # responses that say nothing about the address itself
+    unavailable_statuses = {401, 403, 429}
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        timeout: float,
+        max_connections: int,
+        max_concurrency: int,
+        breaker: CircuitBreaker,
+        cache_ttl: int,
+        invalid_cache_ttl: int,
+    ):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker
+        self.cache_ttl = cache_ttl
+        self.invalid_cache_ttl = invalid_cache_ttl
+        self.client: Optional[httpx.AsyncClient] = None
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    @staticmethod
+    def cache_key(email: str) -> str:
+        return f"email:verified:{email}"
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self.client
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def verify(self, email: str) -> bool:
+        """Returns whether the address was accepted.
+
+        Raises VerifierUnavailable if the verifier could not be reached in
+        time, failed, or is short-circuited.
+        """
+        key = self.cache_key(email)
+        cached = await redis.get(key)
+        if cached:
+            return cached == "1"
+
+        valid = await self.request(email)
+
+        await redis.redis.set(
+            key,
+            "1" if valid else "0",
+            ex=self.cache_ttl if valid else self.invalid_cache_ttl,
+        )
+        return valid
+
+    async def request(self, email: str) -> bool:
+        if not self.breaker.allow():
+            raise VerifierUnavailable("circuit breaker is open")
+
+        # while open, allow() only lets the trial call through
+        trial = self.breaker.trial
+        try:
+            return await self.call(email)
+        except BaseException:
+            # outcomes clear it already, anything else must not keep the
+            # breaker open for good
+            if trial:
+                self.breaker.abandon_trial()
+            raise
+
+    async def call(self, email: str) -> bool:
+        try:
+            # waiting for a free slot counts against the same deadline
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            # our own saturation, says nothing about the verifier
+            raise VerifierUnavailable("too many verifications in flight")
+
+        try:
+            response = await self.get_client().get(
+                self.url, params={"email": email, "api_key": self.api_key}
+            )
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            logger.warning("Email verification failed: %r", e)
+            raise VerifierUnavailable(str(e)) from e
+        finally:
+            self.semaphore.release()
+
+        if (
+            response.status_code in self.unavailable_statuses
+            or response.status_code >= 500
+        ):
+            self.breaker.record_failure()
+            raise VerifierUnavailable(
+                f"verifier responded with {response.status_code}"
+            )
+
+        self.breaker.record_success()
+        return response.status_code == 200
+
+
+email_verifier = EmailVerifier(
+    url=settings.EMAIL_VERIFIER_URL,
+    api_key=settings.EMAILHUNTER_API_KEY,
+    timeout=settings.EMAIL_VERIFIER_TIMEOUT,
+    max_connections=settings.EMAIL_VERIFIER_MAX_CONNECTIONS,
+    max_concurrency=settings.EMAIL_VERIFIER_MAX_CONCURRENCY,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.EMAIL_VERIFIER_FAILURE_THRESHOLD,
+        reset_timeout=settings.EMAIL_VERIFIER_RESET_TIMEOUT,
+    ),
+    cache_ttl=settings.EMAIL_VERIFIER_CACHE_TTL,
+    invalid_cache_ttl=settings.EMAIL_VERIFIER_INVALID_CACHE_TTL,
+)
@@ -1,9 +1,10 @@
+import hashlib
 from datetime import datetime, timedelta
 
 import jwt
-from fastapi import HTTPException
 
 from app.core.config import settings
+from app.db.cache import token_cache
 import time
 
 
@@ -23,14 +24,24 @@ def create_access_token(*, data: dict, expires_delta: timedelta = None):
 
 
 def decode_token(token: str) -> dict:
-    try:
-        decoded_token = jwt.decode(
-            token,
-            settings.SECRET_KEY,
-            algorithms=[settings.TOKEN_ALGORITHM],
-        )
-        return (
-            decoded_token if decoded_token["exp"] >= time.time() else None
-        )
-    except (jwt.exceptions.PyJWTError, KeyError):
-        raise HTTPException(status_code=401, detail="Invalid Token")
+    """Verifies the token and returns its claims.
+
+    Verified claims are cached by token digest until the token expires, so
+    a token seen before skips signature verification.
+
+    Raises jwt.PyJWTError for invalid, expired or exp-less tokens.
+    """
+    digest = hashlib.sha256(token.encode()).hexdigest()
+
+    claims = token_cache.get(digest)
+    if claims is not None:
+        return claims
+
+    claims = jwt.decode(
+        token,
+        settings.SECRET_KEY,
+        algorithms=[settings.TOKEN_ALGORITHM],
+        options={"require": ["exp"]},
+    )
+    token_cache.set(digest, claims, ttl=claims["exp"] - time.time())
+    return claims
@@ -1,27 +1,138 @@
+import asyncio
 import hashlib
 import hmac
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
 
-from pydantic import SecretStr
+import bcrypt
 
 from app.core.config import settings
 
 
-def verify_password(plain_password: str, hashed_password: SecretStr):
-    """Verifies a password by re-hashing it and comparing the result to the hashed password."""
-    return (
-        hmac.new(
+class PasswordHasher(ABC):
+    """A password hashing scheme, recognized by the prefix of its hashes."""
+
+    prefix: str
+
+    def identify(self, hashed_password: str) -> bool:
+        return hashed_password.startswith(self.prefix)
+
+    @abstractmethod
+    def hash(self, password: str) -> str:
+        ...
+
+    @abstractmethod
+    def verify(self, password: str, hashed_password: str) -> bool:
+        ...
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Whether the hash was made with weaker than current settings."""
+        return False
+
+
+class HMACHasher(PasswordHasher):
+    """Legacy HMAC-SHA256 keyed with the secret key, stored as bare hex."""
+
+    prefix = ""
+
+    def identify(self, hashed_password: str) -> bool:
+        return len(hashed_password) == 64 and all(
+            char in "0123456789abcdef" for char in hashed_password
+        )
+
+    def hash(self, password: str) -> str:
+        return hmac.new(
             settings.SECRET_KEY.encode(),
-            plain_password.encode(),
+            password.encode(),
             digestmod=hashlib.sha256,
         ).hexdigest()
-        == hashed_password
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return hmac.compare_digest(self.hash(password), hashed_password)
+
+
+class BcryptHasher(PasswordHasher):
+    prefix = "$2b$"
+    # written by other bcrypt implementations, verified the same way
+    prefixes = ("$2a$", "$2b$", "$2y$")
+
+    def __init__(self, rounds: int):
+        self.rounds = rounds
+
+    def identify(self, hashed_password: str) -> bool:
+        return hashed_password.startswith(self.prefixes)
+
+    def hash(self, password: str) -> str:
+        return bcrypt.hashpw(
+            password.encode(), bcrypt.gensalt(self.rounds)
+        ).decode()
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        try:
+            return bcrypt.checkpw(
+                password.encode(), hashed_password.encode()
+            )
+        except ValueError:
+            # a malformed hash matches no password
+            return False
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        # $2b$<rounds>$<salt and hash>
+        rounds = hashed_password.split("$")[2]
+        return not rounds.isdigit() or int(rounds) < self.rounds
+
+
+hashers: Dict[str, PasswordHasher] = {
+    "bcrypt": BcryptHasher(rounds=settings.PASSWORD_BCRYPT_ROUNDS),
+    "hmac": HMACHasher(),
+}
+
+# hashing is CPU bound, it runs here so that the event loop keeps serving
+# requests; bcrypt releases the GIL. Calls over the limit wait in line.
+executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash",
+)
+
+
+def get_hasher(hashed_password: str) -> PasswordHasher:
+    for hasher in hashers.values():
+        if hasher.identify(hashed_password):
+            return hasher
+    raise ValueError("Unknown password hash scheme")
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether the hash should be replaced by one of the current scheme."""
+    try:
+        hasher = get_hasher(hashed_password)
+    except ValueError:
+        return True
+    current = hashers[settings.PASSWORD_HASHER]
+    return hasher is not current or hasher.needs_rehash(hashed_password)
+
+
+async def run_in_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, func, *args
     )
 
 
-def get_password_hash(password: str):
-    """Hashes a password using HMAC and the secret key."""
-    return hmac.new(
-        settings.SECRET_KEY.encode(),
-        password.encode(),
-        digestmod=hashlib.sha256,
-    ).hexdigest()
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verifies a password against a hash of any registered scheme, no
+    password matches a hash of an unknown scheme."""
+    try:
+        hasher = get_hasher(hashed_password)
+    except ValueError:
+        return False
+    return await run_in_executor(
+        hasher.verify, plain_password, hashed_password
+    )
+
+
+async def get_password_hash(password: str) -> str:
+    """Hashes a password with the current scheme."""
+    return await run_in_executor(
+        hashers[settings.PASSWORD_HASHER].hash, password
+    )
@@ -1,16 +1,14 @@
 from fastapi import Depends, HTTPException, status
-from jose import JWTError
-from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import JWTBearer
-from app.db.session import get_session
+from app.db.cache import user_cache
+from app.db.session import RequestSession, get_session
 from app.selectors.user import get_user_by_id
-from app.utils.jwt import decode_token
 
 
 async def get_current_user(
-    token: str = Depends(JWTBearer()),
-    session: AsyncSession = Depends(get_session),
+    claims: dict = Depends(JWTBearer()),
+    session: RequestSession = Depends(get_session),
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -18,18 +16,27 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = decode_token(token)
-        user_id: int = payload.get("user_id")
+    # the bearer dependency already verified the token
+    user_id: int = claims.get("user_id")
 
-        if user_id is None:
-            raise credentials_exception
-
-    except JWTError:
+    if user_id is None:
         raise credentials_exception
 
-    async with session.begin() as session:
-        user = await get_user_by_id(user_id, session=session)
+    # reads right after this user's writes go to the primary
+    session.scopes.add(f"user:{user_id}")
+
+    async def load(user_id: int):
+        # outside of a transaction, the connection goes back to the pool
+        # right away rather than idling in one until the request ends
+        async with session.read() as read_session:
+            user = await get_user_by_id(user_id, session=read_session)
+            if user is not None:
+                # detached, the loaded attributes stay readable across
+                # requests
+                read_session.expunge(user)
+        return user
+
+    user = await user_cache.get_or_load(user_id, load)
 
     if user is None:
         raise credentials_exception
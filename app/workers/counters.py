@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core import metrics
+from app.core.config import settings
+from app.db.redis import (
+    cancel,
+    dislike_users_key,
+    dislikes_key,
+    like_users_key,
+    likes_key,
+    redis,
+)
+from app.db.session import ReadSessionLocal
+from app.db_models.post import PostModel, ReactionModel
+from .reactions import LEASE_SCRIPT, RELEASE_SCRIPT, reaction_flusher
+
+logger = logging.getLogger(__name__)
+
+# users that like and dislike each post
+Members = Dict[int, Tuple[List[int], List[int]]]
+# likes and dislikes of each post
+Counts = Dict[int, Tuple[int, int]]
+
+# members per SADD, so that a hot post does not make one huge command
+SADD_CHUNK_SIZE = 1000
+
+# every post with its reactions, posts without any included, in post order
+# so that the rows of a post come one after the other
+REACTIONS_BY_POST = (
+    select(PostModel.id, ReactionModel.user_id, ReactionModel.value)
+    .outerjoin(ReactionModel, ReactionModel.post_id == PostModel.id)
+    .order_by(PostModel.id)
+)
+
+
+async def store_members(members: Members) -> None:
+    """Replaces the Redis counters and member sets of the posts, in one
+    MULTI so that readers never see a post half written."""
+    pipe = redis.redis.pipeline(transaction=True)
+    for post_id, (liked, disliked) in members.items():
+        pipe.delete(
+            likes_key(post_id),
+            dislikes_key(post_id),
+            like_users_key(post_id),
+            dislike_users_key(post_id),
+        )
+        pipe.set(likes_key(post_id), len(liked))
+        pipe.set(dislikes_key(post_id), len(disliked))
+        for key, users in (
+            (like_users_key(post_id), liked),
+            (dislike_users_key(post_id), disliked),
+        ):
+            for start in range(0, len(users), SADD_CHUNK_SIZE):
+                pipe.sadd(key, *users[start : start + SADD_CHUNK_SIZE])
+    await pipe.execute()
+
+
+def add_reaction(members: Members, post_id, user_id, value) -> None:
+    liked, disliked = members.setdefault(post_id, ([], []))
+    if value == ReactionModel.LIKE:
+        liked.append(user_id)
+    elif value == ReactionModel.DISLIKE:
+        disliked.append(user_id)
+
+
+async def rebuild_counters(session: AsyncSession, batch_size: int) -> int:
+    """Rewrites the counters and member sets of every post from Postgres,
+    in one pass over the reactions; returns the number of posts.
+
+    Reads one snapshot when `session` is REPEATABLE READ. Reactions made
+    meanwhile may be overwritten with their former state; run it while
+    reactions are paused, or let the auditor repair them.
+    """
+    stream = await session.stream(
+        REACTIONS_BY_POST.execution_options(yield_per=10000)
+    )
+    members: Members = {}
+    posts = 0
+    async for post_id, user_id, value in stream:
+        # the previous posts are complete once a new one starts
+        if post_id not in members and len(members) >= batch_size:
+            await store_members(members)
+            posts += len(members)
+            members = {}
+        add_reaction(members, post_id, user_id, value)
+
+    if members:
+        await store_members(members)
+        posts += len(members)
+    return posts
+
+
+async def read_members(
+    session: AsyncSession, post_ids: List[int]
+) -> Members:
+    members: Members = {post_id: ([], []) for post_id in post_ids}
+    rows = await session.execute(
+        select(
+            ReactionModel.post_id, ReactionModel.user_id, ReactionModel.value
+        ).where(ReactionModel.post_id.in_(post_ids))
+    )
+    for post_id, user_id, value in rows:
+        add_reaction(members, post_id, user_id, value)
+    return members
+
+
+async def read_counts(
+    session: AsyncSession, where, limit: Optional[int] = None
+) -> Counts:
+    """(likes, dislikes) in Postgres of the posts matching `where`."""
+    rows = await session.execute(
+        select(PostModel.id, PostModel.like_count, PostModel.dislike_count)
+        .where(where)
+        .order_by(PostModel.id)
+        .limit(limit)
+    )
+    return {post_id: (likes, dislikes) for post_id, likes, dislikes in rows}
+
+
+async def read_redis_counts(
+    post_ids: Iterable[int],
+) -> Dict[int, Tuple[int, int, int, int]]:
+    """(likes, dislikes, likers, dislikers) of each post in Redis, -1
+    for keys of the wrong type, such as member keys stored as strings by
+    old versions."""
+    post_ids = list(post_ids)
+    pipe = redis.redis.pipeline(transaction=False)
+    for post_id in post_ids:
+        pipe.get(likes_key(post_id))
+        pipe.get(dislikes_key(post_id))
+        pipe.scard(like_users_key(post_id))
+        pipe.scard(dislike_users_key(post_id))
+    values = [
+        -1 if isinstance(value, Exception) else value
+        for value in await pipe.execute(raise_on_error=False)
+    ]
+    return {
+        post_id: tuple(int(value or 0) for value in values[i : i + 4])
+        for post_id, i in zip(post_ids, range(0, len(values), 4))
+    }
+
+
+class CounterAuditor:
+    """Compares the Redis reaction counters of sampled posts with the ones
+    in Postgres and repairs those that drifted.
+
+    A sample is a random run of consecutive post ids, an index range scan
+    however large the table. Posts that differ are read again before they
+    are repaired, so that a reaction landing between the two reads is not
+    taken for drift. Audits are skipped while write-behind reactions wait
+    to be flushed, Redis is ahead of Postgres then.
+
+    Reads go to the primary, replicas lagging behind would look like drift.
+    Every worker runs one, only the one holding the lease audits.
+    """
+
+    lease_key = "reactions:counters:auditor"
+
+    def __init__(
+        self,
+        sample_size: int,
+        interval: float,
+        session_factory: sessionmaker = ReadSessionLocal,
+    ):
+        self.sample_size = sample_size
+        self.interval = interval
+        self.session_factory = session_factory
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex}"
+        self.audited = 0
+        self.drifted = 0
+        self.skipped = 0
+        self.last_drift_rate: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def acquire(self) -> bool:
+        # held across the sleep between audits, lost if a cycle is missed
+        return bool(
+            await redis.script(LEASE_SCRIPT)(
+                keys=[self.lease_key],
+                args=[self.consumer, int(self.interval * 2000)],
+            )
+        )
+
+    async def release(self) -> None:
+        await redis.script(RELEASE_SCRIPT)(
+            keys=[self.lease_key], args=[self.consumer]
+        )
+
+    async def sample(
+        self, session: AsyncSession, start: Optional[int] = None
+    ) -> Counts:
+        """Likes and dislikes in Postgres of a run of posts from `start`,
+        a random post id if None."""
+        if start is None:
+            low, high = (
+                await session.execute(
+                    select(func.min(PostModel.id), func.max(PostModel.id))
+                )
+            ).one()
+            if low is None:
+                return {}
+            start = random.randint(low, high)
+
+        return await read_counts(
+            session, PostModel.id >= start, limit=self.sample_size
+        )
+
+    @staticmethod
+    def drifted_posts(sql_counts: Counts, redis_counts) -> List[int]:
+        # a member set for each reaction counted
+        return [
+            post_id
+            for post_id, (likes, dislikes) in sql_counts.items()
+            if redis_counts[post_id] != (likes, dislikes, likes, dislikes)
+        ]
+
+    async def audit(self, start: Optional[int] = None) -> Optional[List[int]]:
+        """Audits one sample, returns the repaired posts, None if skipped."""
+        if (await reaction_flusher.lag())["entries"]:
+            self.skipped += 1
+            return None
+
+        async with self.session_factory() as session:
+            sql_counts = await self.sample(session, start)
+            drifted = self.drifted_posts(
+                sql_counts, await read_redis_counts(sql_counts)
+            )
+
+            if drifted:
+                # confirm on a fresh read of both sides
+                confirmed = await read_counts(
+                    session, PostModel.id.in_(drifted)
+                )
+                drifted = self.drifted_posts(
+                    confirmed, await read_redis_counts(confirmed)
+                )
+
+            if drifted:
+                await store_members(await read_members(session, drifted))
+
+        self.audited += len(sql_counts)
+        self.drifted += len(drifted)
+        if sql_counts:
+            self.last_drift_rate = len(drifted) / len(sql_counts)
+            metrics.reaction_counters_drift_rate.set(self.last_drift_rate)
+        metrics.reaction_counters_audited.inc((), len(sql_counts))
+        metrics.reaction_counters_drifted.inc((), len(drifted))
+
+        if drifted:
+            logger.warning(
+                "Repaired drifted reaction counters of posts %s", drifted
+            )
+        return drifted
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            await cancel(self._task)
+            self._task = None
+            await self.release()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await self.acquire():
+                    await self.audit()
+            except Exception:
+                logger.exception("Auditing reaction counters failed")
+
+    def stats(self) -> dict:
+        return {
+            "audited": self.audited,
+            "drifted": self.drifted,
+            "skipped": self.skipped,
+            "drift_rate": self.drifted / self.audited if self.audited else 0.0,
+            "last_drift_rate": self.last_drift_rate,
+        }
+
+
+counter_auditor = CounterAuditor(
+    sample_size=settings.COUNTER_AUDIT_SAMPLE_SIZE,
+    interval=settings.COUNTER_AUDIT_INTERVAL,
+)
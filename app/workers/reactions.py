@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import aioredis
+from sqlalchemy.orm import sessionmaker
+
+from app.core import metrics
+from app.core.config import settings
+from app.db.redis import cancel, redis
+from app.db.session import AsyncSessionLocal
+from app.db_models.lease import LeaseFenceModel
+from app.db_models.post import ReactionModel
+
+logger = logging.getLogger(__name__)
+
+GROUP = "reaction-flushers"
+
+# Takes or renews the lease of the flusher named ARGV[1] for ARGV[2] ms.
+# Returns 1 when it renewed the lease, 2 when it took it, 0 if another
+# holder has it.
+LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 2
+end
+return 0
+"""
+TAKEN = 2
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+Entry = Tuple[str, Dict[str, str]]
+
+
+class LeaseLost(Exception):
+    """A newer holder of the lease stored batches meanwhile."""
+
+
+def collapse(entries: List[Entry]) -> Dict[Tuple[int, int], int]:
+    """The last reaction of each (post id, user id) pair, in stream order."""
+    reactions = {}
+    for _, fields in entries:
+        pair = int(fields["post_id"]), int(fields["user_id"])
+        reactions[pair] = int(fields["value"])
+    return reactions
+
+
+class ReactionFlusher:
+    """Drains the write-behind reaction stream into Postgres.
+
+    Every worker runs one, the one holding the lease reads the stream
+    through a consumer group, so that the reactions of a user are stored
+    in the order they happened. A batch is acknowledged and deleted from
+    the stream only once its transaction committed; batches that failed,
+    or were read by a flusher that died, are claimed again first. Entries
+    may thus be stored twice, which the batch statements make harmless.
+
+    Each new lease holder draws a fencing token from Postgres, and batch
+    transactions only commit while no newer token stored one: a flusher
+    that stalled past its lease can not overwrite the newer reactions
+    stored by the next holder with an old batch.
+    """
+
+    def __init__(
+        self,
+        stream: str,
+        batch_size: int,
+        interval: float,
+        lease: float,
+        session_factory: sessionmaker = AsyncSessionLocal,
+    ):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self.session_factory = session_factory
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex}"
+        self.token: Optional[int] = None
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_flush_time: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def lease_key(self) -> str:
+        return f"{self.stream}:flusher"
+
+    async def create_group(self) -> None:
+        try:
+            await redis.redis.xgroup_create(
+                self.stream, GROUP, id="0", mkstream=True
+            )
+        except aioredis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def acquire(self) -> bool:
+        held = await redis.script(LEASE_SCRIPT)(
+            keys=[self.lease_key],
+            args=[self.consumer, int(self.lease * 1000)],
+        )
+        if held == TAKEN or (held and self.token is None):
+            async with self.session_factory() as session:
+                self.token = await LeaseFenceModel.next_token(session)
+        return bool(held)
+
+    async def release(self) -> None:
+        await redis.script(RELEASE_SCRIPT)(
+            keys=[self.lease_key], args=[self.consumer]
+        )
+
+    async def claim(self) -> List[Entry]:
+        """Pending entries of earlier batches, oldest first. Only the lease
+        holder reads, so whatever is pending was left behind."""
+        _, entries, *_ = await redis.redis.execute_command(
+            "XAUTOCLAIM",
+            self.stream,
+            GROUP,
+            self.consumer,
+            0,
+            "0-0",
+            "COUNT",
+            self.batch_size,
+        )
+        # entries deleted meanwhile come back as None
+        return [
+            (entry_id, dict(zip(fields[::2], fields[1::2])))
+            for entry_id, fields in entries
+            if fields
+        ]
+
+    async def read(self) -> List[Entry]:
+        response = await redis.redis.xreadgroup(
+            GROUP,
+            self.consumer,
+            {self.stream: ">"},
+            count=self.batch_size,
+            block=int(self.interval * 1000),
+        )
+        return response[0][1] if response else []
+
+    async def flush(self, entries: List[Entry]) -> None:
+        started_at = time.perf_counter()
+        async with self.session_factory() as session:
+            async with session.begin():
+                if not await LeaseFenceModel.advance(
+                    session, self.lease_key, self.token
+                ):
+                    raise LeaseLost(self.lease_key)
+                await ReactionModel.apply_batch(session, collapse(entries))
+
+        ids = [entry_id for entry_id, _ in entries]
+        pipe = redis.redis.pipeline(transaction=True)
+        pipe.xack(self.stream, GROUP, *ids)
+        pipe.xdel(self.stream, *ids)
+        await pipe.execute()
+
+        self.flushed += len(entries)
+        self.batches += 1
+        self.last_flush_time = time.perf_counter() - started_at
+        metrics.reactions_flushed.inc((), len(entries))
+
+    async def run_once(self) -> Optional[int]:
+        """Stores one batch and returns its size, None if another flusher
+        holds the lease."""
+        if not await self.acquire():
+            return None
+
+        entries = await self.claim() or await self.read()
+        if entries:
+            try:
+                await self.flush(entries)
+            except LeaseLost:
+                # rolled back; the entries stay pending for the new holder
+                logger.warning("Reaction flusher lease lost, batch dropped")
+                self.token = None
+                return None
+        return len(entries)
+
+    async def lag(self) -> dict:
+        """Reactions not stored yet and the age of the oldest, stored ones
+        are deleted from the stream."""
+        pipe = redis.redis.pipeline(transaction=False)
+        pipe.xlen(self.stream)
+        pipe.xrange(self.stream, count=1)
+        length, oldest = await pipe.execute()
+
+        seconds = 0.0
+        if oldest:
+            # entry ids start with their creation time in ms
+            created_at = int(oldest[0][0].split("-")[0]) / 1000
+            seconds = max(time.time() - created_at, 0.0)
+        return {"entries": length, "seconds": seconds}
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self.create_group()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # a batch cut short is rolled back and claimed again later
+            await cancel(self._task)
+            self._task = None
+            await self.release()
+            self.token = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await self.run_once() is None:
+                    await asyncio.sleep(self.interval)
+
+                lag = await self.lag()
+                metrics.reactions_lag_entries.set(lag["entries"])
+                metrics.reactions_lag_seconds.set(lag["seconds"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failures += 1
+                logger.exception("Flushing reactions failed")
+                await asyncio.sleep(self.interval)
+
+    async def stats(self) -> dict:
+        return {
+            "lag": await self.lag(),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "last_flush_time": self.last_flush_time,
+        }
+
+
+reaction_flusher = ReactionFlusher(
+    settings.REACTIONS_STREAM,
+    batch_size=settings.REACTIONS_FLUSH_BATCH_SIZE,
+    interval=settings.REACTIONS_FLUSH_INTERVAL,
+    lease=settings.REACTIONS_FLUSHER_LEASE,
+)
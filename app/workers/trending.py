@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from time import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.db.redis import (
+    REBASE_WINDOW,
+    cancel,
+    redis,
+    trending_epoch_key,
+    trending_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# Keeps the sorted set of a trending window small and its scores in range.
+#
+# Drops scores that are not finite, written before scores were bounded,
+# and all but the ARGV[3] best posts. Then, once the epoch is a half-life
+# old, rescales the scores to an epoch of now, and drops the posts scoring
+# below ARGV[4] reactions as of now, decayed or disliked on balance.
+# Atomic and a no-op when repeated, so every worker may run it.
+#
+# KEYS: sorted set, epoch
+# ARGV: now (seconds), half-life, max posts, min score
+# Returns: the number of posts left
+MAINTENANCE_SCRIPT = REBASE_WINDOW + """
+local scores, epoch_key = KEYS[1], KEYS[2]
+local now, half_life = tonumber(ARGV[1]), tonumber(ARGV[2])
+
+redis.call('ZREMRANGEBYSCORE', scores, '+inf', '+inf')
+redis.call('ZREMRANGEBYSCORE', scores, '-inf', '-inf')
+redis.call('ZREMRANGEBYRANK', scores, 0, -tonumber(ARGV[3]) - 1)
+
+local epoch = tonumber(redis.call('GET', epoch_key))
+if not epoch then
+    return redis.call('ZCARD', scores)
+end
+
+if now - epoch >= half_life then
+    rebase(scores, epoch_key, epoch, now, half_life)
+    epoch = now
+end
+
+local min_score = tonumber(ARGV[4]) * 2 ^ ((now - epoch) / half_life)
+redis.call('ZREMRANGEBYSCORE', scores, '-inf', '(' .. min_score)
+return redis.call('ZCARD', scores)
+"""
+
+
+class TrendingMaintainer:
+    """Trims and rebases the trending windows every `interval` seconds."""
+
+    def __init__(
+        self,
+        half_lives: Dict[str, float],
+        max_posts: int,
+        interval: float,
+        min_score: float = 0.01,
+    ):
+        self.half_lives = half_lives
+        self.max_posts = max_posts
+        self.interval = interval
+        self.min_score = min_score
+        self._task: Optional[asyncio.Task] = None
+
+    async def maintain(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Returns the number of posts left in each window."""
+        now = now or time()
+        return {
+            window: await redis.script(MAINTENANCE_SCRIPT)(
+                keys=[trending_key(window), trending_epoch_key(window)],
+                args=[now, half_life, self.max_posts, self.min_score],
+            )
+            for window, half_life in self.half_lives.items()
+        }
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            await cancel(self._task)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.maintain()
+            except Exception:
+                logger.exception("Maintaining the trending posts failed")
+
+
+trending_maintainer = TrendingMaintainer(
+    settings.TRENDING_HALF_LIVES,
+    max_posts=settings.TRENDING_MAX_POSTS,
+    interval=settings.TRENDING_MAINTENANCE_INTERVAL,
+)
@@ -0,0 +1,464 @@
+"""End-to-end load benchmark of the API.
+
+Seeds users and posts, then runs a closed loop of concurrent virtual
+clients, each picking its next request from a weighted mix. Posts are
+picked from a Zipf distribution, so a few hot posts take most of the reads
+and of the like and dislike storms. The report is JSON, to compare runs
+across commits:
+
+    python -m benchmarks.load --duration 30 --output before.json
+    python -m benchmarks.load --duration 30 --baseline before.json
+
+Without --url the app runs in process, behind the httpx ASGI transport;
+with it, requests go to a running server, see docker-compose.bench.yml.
+Seeding always goes through the database of the current settings, so they
+must point at the one the server uses.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.db.base import Base
+from app.db.session import AsyncSessionLocal, async_engine
+from app.db_models.post import PostModel
+from app.db_models.user import UserModel
+from app.main import app
+from app.utils.jwt import create_access_token
+from app.utils.password import get_password_hash
+
+PASSWORD = "benchmark"
+SEED_BATCH_SIZE = 1000
+
+DEFAULT_MIX = {
+    "signin": 2,
+    "create_post": 8,
+    "get_post": 60,
+    "like": 15,
+    "dislike": 15,
+}
+
+
+class Zipf:
+    """Picks ranks 0..n-1, rank k with a weight of 1 / (k + 1) ** s."""
+
+    def __init__(self, n: int, s: float):
+        self.cumulative = list(
+            itertools.accumulate(1 / (k + 1) ** s for k in range(n))
+        )
+
+    def sample(self, rng: random.Random) -> int:
+        point = rng.random() * self.cumulative[-1]
+        return bisect.bisect_left(self.cumulative, point)
+
+
+@dataclass
+class Workload:
+    usernames: List[str]
+    tokens: List[str]
+    post_ids: List[int]
+    hot_posts: Zipf
+    rng: random.Random = field(default_factory=random.Random)
+
+    def user(self) -> int:
+        return self.rng.randrange(len(self.usernames))
+
+    def post_id(self) -> int:
+        return self.post_ids[self.hot_posts.sample(self.rng)]
+
+    def auth(self, user: int) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[user]}"}
+
+
+Operation = Callable[[httpx.AsyncClient, Workload], Awaitable[httpx.Response]]
+
+
+async def signin(client: httpx.AsyncClient, workload: Workload):
+    username = workload.usernames[workload.user()]
+    return await client.post(
+        "auth/signin", json={"username": username, "password": PASSWORD}
+    )
+
+
+async def create_post(client: httpx.AsyncClient, workload: Workload):
+    return await client.post(
+        "post",
+        json={"content": f"benchmark post {workload.rng.random()}"},
+        headers=workload.auth(workload.user()),
+    )
+
+
+async def get_post(client: httpx.AsyncClient, workload: Workload):
+    return await client.get(f"post/{workload.post_id()}")
+
+
+async def like(client: httpx.AsyncClient, workload: Workload):
+    return await client.post(
+        f"post/{workload.post_id()}/like",
+        headers=workload.auth(workload.user()),
+    )
+
+
+async def dislike(client: httpx.AsyncClient, workload: Workload):
+    return await client.post(
+        f"post/{workload.post_id()}/dislike",
+        headers=workload.auth(workload.user()),
+    )
+
+
+OPERATIONS: Dict[str, Operation] = {
+    "signin": signin,
+    "create_post": create_post,
+    "get_post": get_post,
+    "like": like,
+    "dislike": dislike,
+}
+
+
+async def seed(
+    users: int, posts: int, zipf: float, create_tables: bool
+) -> Workload:
+    """Inserts `users` users sharing one password and `posts` posts spread
+    over them, named after the run so that runs can share a database."""
+    if create_tables:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    run = f"{int(time.time())}{random.randrange(1000)}"
+    password = await get_password_hash(PASSWORD)
+    user_ids: List[int] = []
+    usernames: List[str] = []
+    post_ids: List[int] = []
+
+    async with AsyncSessionLocal() as session:
+        for start in range(0, users, SEED_BATCH_SIZE):
+            stop = min(start + SEED_BATCH_SIZE, users)
+            result = await session.execute(
+                insert(UserModel)
+                .values(
+                    [
+                        {
+                            "username": f"bench{run}_{i}",
+                            "email": f"bench{run}_{i}@example.com",
+                            "password": password,
+                        }
+                        for i in range(start, stop)
+                    ]
+                )
+                .returning(UserModel.id, UserModel.username)
+            )
+            for user_id, username in result.all():
+                user_ids.append(user_id)
+                usernames.append(username)
+
+        for start in range(0, posts, SEED_BATCH_SIZE):
+            stop = min(start + SEED_BATCH_SIZE, posts)
+            result = await session.execute(
+                insert(PostModel)
+                .values(
+                    [
+                        {
+                            "user_id": user_ids[i % users],
+                            "content": f"benchmark post {i}",
+                        }
+                        for i in range(start, stop)
+                    ]
+                )
+                .returning(PostModel.id)
+            )
+            post_ids.extend(result.scalars().all())
+
+        await session.commit()
+
+    return Workload(
+        usernames=usernames,
+        tokens=[
+            create_access_token(data={"user_id": user_id})
+            for user_id in user_ids
+        ],
+        post_ids=post_ids,
+        hot_posts=Zipf(len(post_ids), zipf),
+    )
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Counter = Counter()
+
+    def record(
+        self, name: str, elapsed: float, status: Optional[int]
+    ) -> None:
+        self.latencies[name].append(elapsed)
+        if status is None:
+            self.errors[name] += 1
+            return
+
+        self.statuses[name][status] += 1
+        if status >= 500:
+            self.errors[name] += 1
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(values)) - 1, 0)
+    return values[rank]
+
+
+def summarize(latencies: List[float], errors: int, duration: float) -> dict:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "throughput": round(count / duration, 2),
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        # milliseconds
+        "p50": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def build_report(recorder: Recorder, duration: float, config: dict) -> dict:
+    operations = {}
+    for name, latencies in sorted(recorder.latencies.items()):
+        operations[name] = {
+            **summarize(latencies, recorder.errors[name], duration),
+            # 4xx are expected in storms, such as liking a liked post
+            "statuses": {
+                str(status): count
+                for status, count in sorted(recorder.statuses[name].items())
+            },
+        }
+
+    return {
+        "commit": current_commit(),
+        "started_at": config.pop("started_at"),
+        "python": platform.python_version(),
+        "config": config,
+        "total": summarize(
+            list(itertools.chain(*recorder.latencies.values())),
+            sum(recorder.errors.values()),
+            duration,
+        ),
+        "operations": operations,
+    }
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """Regressions of `report` against `baseline`: throughput lower or
+    p95 latency higher by more than `threshold`, or errors that were not
+    there before."""
+    regressions = []
+    total, base_total = report["total"], baseline["total"]
+    if total["throughput"] < base_total["throughput"] * (1 - threshold):
+        regressions.append(
+            f"throughput {total['throughput']:.1f} req/s, was "
+            f"{base_total['throughput']:.1f}"
+        )
+
+    for name, stats in report["operations"].items():
+        base = baseline["operations"].get(name)
+        if base is None:
+            continue
+        if stats["p95"] > base["p95"] * (1 + threshold):
+            regressions.append(
+                f"{name} p95 {stats['p95']:.1f} ms, was {base['p95']:.1f}"
+            )
+        if stats["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(
+                f"{name} error rate {stats['error_rate']:.2%}, was "
+                f"{base['error_rate']:.2%}"
+            )
+    return regressions
+
+
+async def client_loop(
+    client: httpx.AsyncClient,
+    workload: Workload,
+    mix: Dict[str, int],
+    recorder: Optional[Recorder],
+    deadline: float,
+) -> None:
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = workload.rng.choices(names, weights)[0]
+        started_at = time.perf_counter()
+        try:
+            status = (await OPERATIONS[name](client, workload)).status_code
+        except httpx.HTTPError:
+            status = None
+        if recorder is not None:
+            recorder.record(name, time.perf_counter() - started_at, status)
+
+
+async def run_phase(
+    client: httpx.AsyncClient,
+    workload: Workload,
+    mix: Dict[str, int],
+    concurrency: int,
+    duration: float,
+    recorder: Optional[Recorder] = None,
+) -> None:
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(
+        *(
+            client_loop(client, workload, mix, recorder, deadline)
+            for _ in range(concurrency)
+        )
+    )
+
+
+def open_client(url: Optional[str], concurrency: int) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=concurrency)
+    timeout = httpx.Timeout(30.0)
+    if url is None:
+        # app errors come back as 500 responses, as from a server
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app, raise_app_exceptions=False),
+            base_url=f"http://benchmark{settings.API_V1_PREFIX}/",
+            timeout=timeout,
+        )
+    return httpx.AsyncClient(
+        base_url=f"{url.rstrip('/')}{settings.API_V1_PREFIX}/",
+        limits=limits,
+        timeout=timeout,
+    )
+
+
+async def run(args: argparse.Namespace) -> dict:
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    workload = await seed(
+        args.users, args.posts, args.zipf, args.create_tables
+    )
+    workload.rng.seed(args.seed)
+
+    if args.url is None:
+        await app.router.startup()
+
+    recorder = Recorder()
+    try:
+        async with open_client(args.url, args.concurrency) as client:
+            await run_phase(
+                client, workload, args.mix, args.concurrency, args.warmup
+            )
+            await run_phase(
+                client,
+                workload,
+                args.mix,
+                args.concurrency,
+                args.duration,
+                recorder,
+            )
+    finally:
+        if args.url is None:
+            await app.router.shutdown()
+
+    config = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("output", "baseline")
+    }
+    return build_report(
+        recorder, args.duration, {**config, "started_at": started_at}
+    )
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}")
+        mix[name] = int(weight)
+    return mix
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument("--url", help="server to load, in process if unset")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument(
+        "--zipf", type=float, default=1.1, help="skew of the post picks"
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="weights, such as get_post=60,like=20,dislike=20",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--create-tables",
+        action="store_true",
+        help="create missing tables, for databases without migrations",
+    )
+    parser.add_argument("--output", help="write the JSON report there")
+    parser.add_argument(
+        "--baseline", help="JSON report to compare with, fails on regressions"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="tolerated throughput or p95 change against the baseline",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(report, json.load(baseline), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
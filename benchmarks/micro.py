@@ -0,0 +1,520 @@
+"""Microbenchmarks of the hot paths: tokens, password checks, response
+models, the Redis wrappers and the model queries.
+
+The queries run against a database seeded with --reactions reactions, on
+posts with REACTIONS_PER_POST reactions each. Seeding empties the users,
+posts and reaction tables, so point the settings at a database kept for
+benchmarks; a database already seeded at the same size is reused.
+
+    python -m benchmarks.micro --reactions 100000
+    python -m benchmarks.micro --reactions 100000 --update-baselines
+
+Timings are the best per call time over --repeat rounds. They are
+compared with those in baselines.json for the same size, and the run
+fails when one got slower by more than --threshold. Baselines only hold
+on the machine they were recorded on, record new ones after moving.
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import math
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.base import Base
+from app.db.cache import token_cache
+from app.db.redis import (
+    LIKE,
+    UNLIKE,
+    dislike_users_key,
+    dislikes_key,
+    like_users_key,
+    likes_key,
+    redis,
+)
+from app.db.session import AsyncSessionLocal, async_engine
+from app.db_models.post import (
+    DislikeModel,
+    LikeModel,
+    PostModel,
+    ReactionModel,
+)
+from app.models.post import Post, ResponseGetPost
+from app.utils.jwt import create_access_token, decode_token
+from app.utils.password import hashers, verify_password
+
+BASELINES = Path(__file__).resolve().parent / "baselines.json"
+
+# redis.react runs on post -1, no seeded post has it
+REDIS_KEYS = (
+    "bench:micro:counter",
+    "bench:micro:members",
+    likes_key(-1),
+    dislikes_key(-1),
+    like_users_key(-1),
+    dislike_users_key(-1),
+)
+
+REACTIONS_PER_POST = 1000
+SEEDED_TABLES = ("users", "posts", "reactions", "likes", "dislikes")
+
+# ids are sequential after seeding, one user per reaction of a post
+SEED_STATEMENTS = (
+    "TRUNCATE users, posts, reactions, likes, dislikes RESTART IDENTITY",
+    """
+    INSERT INTO users (username, email, password)
+    SELECT 'micro' || i, 'micro' || i || '@example.com', :password
+    FROM generate_series(1, :users) AS i
+    """,
+    """
+    INSERT INTO posts (user_id, content)
+    SELECT 1 + i % :users, 'benchmark post ' || i
+    FROM generate_series(1, :posts) AS i
+    """,
+    """
+    INSERT INTO reactions (post_id, user_id, value)
+    SELECT 1 + i / :users, 1 + i % :users,
+           CASE WHEN i % 3 = 0 THEN -1 ELSE 1 END
+    FROM generate_series(0, :reactions - 1) AS i
+    """,
+    """
+    INSERT INTO likes (post_id, user_id)
+    SELECT post_id, user_id FROM reactions WHERE value = 1
+    """,
+    """
+    INSERT INTO dislikes (post_id, user_id)
+    SELECT post_id, user_id FROM reactions WHERE value = -1
+    """,
+    """
+    UPDATE posts
+    SET like_count = counts.likes, dislike_count = counts.dislikes
+    FROM (
+        SELECT post_id,
+               count(*) FILTER (WHERE value = 1) AS likes,
+               count(*) FILTER (WHERE value = -1) AS dislikes
+        FROM reactions
+        GROUP BY post_id
+    ) AS counts
+    WHERE posts.id = counts.post_id
+    """,
+    "ANALYZE",
+)
+
+
+@dataclass
+class Context:
+    # in a transaction that is rolled back after the run
+    session: AsyncSession
+    users: int
+    posts: int
+
+
+Benchmark = Callable[[Context], Awaitable[Callable[[], Any]]]
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str):
+    """Registers a setup coroutine, it returns the callable to time."""
+
+    def register(setup: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+async def in_savepoint(session: AsyncSession, func, *args) -> None:
+    # writes are rolled back, the timing includes the savepoint round trips
+    savepoint = await session.begin_nested()
+    try:
+        await func(session, *args)
+    finally:
+        await savepoint.rollback()
+
+
+async def consume(iterator) -> None:
+    async for _ in iterator:
+        pass
+
+
+@benchmark("jwt.create_access_token")
+async def bench_create_access_token(ctx: Context):
+    return functools.partial(create_access_token, data={"user_id": 1})
+
+
+@benchmark("jwt.decode_token")
+async def bench_decode_token(ctx: Context):
+    token = create_access_token(data={"user_id": 1})
+    return functools.partial(decode_token, token)
+
+
+@benchmark("jwt.decode_token.uncached")
+async def bench_decode_token_uncached(ctx: Context):
+    token = create_access_token(data={"user_id": 1})
+
+    def decode():
+        token_cache.clear()
+        return decode_token(token)
+
+    return decode
+
+
+@benchmark("password.verify_password.bcrypt")
+async def bench_verify_bcrypt(ctx: Context):
+    hashed = hashers["bcrypt"].hash("password")
+    return functools.partial(verify_password, "password", hashed)
+
+
+@benchmark("password.verify_password.hmac")
+async def bench_verify_hmac(ctx: Context):
+    hashed = hashers["hmac"].hash("password")
+    return functools.partial(verify_password, "password", hashed)
+
+
+@benchmark("models.ResponseGetPost")
+async def bench_response_get_post(ctx: Context):
+    post = await PostModel.read_by_id(ctx.session, 1)
+
+    def serialize():
+        # what FastAPI does with the return value of get_post
+        response = ResponseGetPost(
+            post=Post.from_orm(post),
+            likes=post.like_count,
+            dislikes=post.dislike_count,
+        )
+        return jsonable_encoder(ResponseGetPost.validate(response))
+
+    return serialize
+
+
+@benchmark("redis.get")
+async def bench_redis_get(ctx: Context):
+    await redis.set("bench:micro:counter", 1)
+    return functools.partial(redis.get, "bench:micro:counter")
+
+
+@benchmark("redis.mget")
+async def bench_redis_mget(ctx: Context):
+    keys = [f"bench:micro:counter:{i}" for i in range(20)]
+    return functools.partial(redis.mget, keys)
+
+
+@benchmark("redis.set")
+async def bench_redis_set(ctx: Context):
+    return functools.partial(redis.set, "bench:micro:counter", 1)
+
+
+@benchmark("redis.incr")
+async def bench_redis_incr(ctx: Context):
+    return functools.partial(redis.incr, "bench:micro:counter")
+
+
+@benchmark("redis.srem")
+async def bench_redis_srem(ctx: Context):
+    return functools.partial(redis.srem, "bench:micro:members", 1)
+
+
+@benchmark("redis.react")
+async def bench_redis_react(ctx: Context):
+    # alternates, so that every call changes something
+    transitions = itertools.cycle((LIKE, UNLIKE))
+
+    async def react():
+        return await redis.react(-1, 1, next(transitions))
+
+    return react
+
+
+@benchmark("PostModel.read_by_id")
+async def bench_post_read_by_id(ctx: Context):
+    return functools.partial(PostModel.read_by_id, ctx.session, 1)
+
+
+@benchmark("PostModel.read_by_ids")
+async def bench_post_read_by_ids(ctx: Context):
+    ids = list(range(1, min(ctx.posts, 100) + 1))
+    return functools.partial(PostModel.read_by_ids, ctx.session, ids)
+
+
+@benchmark("PostModel.read_page")
+async def bench_post_read_page(ctx: Context):
+    return functools.partial(
+        PostModel.read_page, ctx.session, 20, before_id=ctx.posts // 2
+    )
+
+
+@benchmark("PostModel.read_page.user")
+async def bench_post_read_page_user(ctx: Context):
+    return functools.partial(PostModel.read_page, ctx.session, 20, user_id=1)
+
+
+@benchmark("PostModel.read_all")
+async def bench_post_read_all(ctx: Context):
+    return lambda: consume(PostModel.read_all(ctx.session))
+
+
+@benchmark("PostModel.create")
+async def bench_post_create(ctx: Context):
+    return functools.partial(
+        in_savepoint, ctx.session, PostModel.create, 1, "benchmark post"
+    )
+
+
+@benchmark("PostModel.update")
+async def bench_post_update(ctx: Context):
+    post = await PostModel.read_by_id(ctx.session, 1)
+
+    async def update(session):
+        await post.update(session, post.user_id, "edited benchmark post")
+
+    return functools.partial(in_savepoint, ctx.session, update)
+
+
+@benchmark("PostModel.delete")
+async def bench_post_delete(ctx: Context):
+    post = await PostModel.read_by_id(ctx.session, ctx.posts)
+    return functools.partial(in_savepoint, ctx.session, PostModel.delete, post)
+
+
+@benchmark("ReactionModel.set")
+async def bench_reaction_set(ctx: Context):
+    # flips a seeded like to a dislike, post 1 belongs to user 2
+    return functools.partial(
+        in_savepoint,
+        ctx.session,
+        ReactionModel.set,
+        1,
+        3,
+        ReactionModel.DISLIKE,
+    )
+
+
+@benchmark("ReactionModel.unset")
+async def bench_reaction_unset(ctx: Context):
+    return functools.partial(
+        in_savepoint,
+        ctx.session,
+        ReactionModel.unset,
+        1,
+        3,
+        ReactionModel.LIKE,
+    )
+
+
+@benchmark("LikeModel.read_by_id")
+async def bench_like_read_by_id(ctx: Context):
+    return functools.partial(LikeModel.read_by_id, ctx.session, 1)
+
+
+@benchmark("LikeModel.read_all")
+async def bench_like_read_all(ctx: Context):
+    return lambda: consume(LikeModel.read_all(ctx.session, 1))
+
+
+@benchmark("LikeModel.count_likes_for_post")
+async def bench_like_count(ctx: Context):
+    return functools.partial(LikeModel.count_likes_for_post, ctx.session, 1)
+
+
+@benchmark("LikeModel.existing_like")
+async def bench_like_existing(ctx: Context):
+    return functools.partial(LikeModel.existing_like, ctx.session, 1, 2)
+
+
+@benchmark("LikeModel.create")
+async def bench_like_create(ctx: Context):
+    # a user without reactions, to not hit the unique index
+    return functools.partial(
+        in_savepoint, ctx.session, LikeModel.create, ctx.users + 1, 1
+    )
+
+
+@benchmark("LikeModel.delete")
+async def bench_like_delete(ctx: Context):
+    like = await LikeModel.read_by_id(ctx.session, 1)
+    return functools.partial(in_savepoint, ctx.session, LikeModel.delete, like)
+
+
+@benchmark("DislikeModel.count_dislikes_for_post")
+async def bench_dislike_count(ctx: Context):
+    return functools.partial(
+        DislikeModel.count_dislikes_for_post, ctx.session, 1
+    )
+
+
+@benchmark("DislikeModel.existing_dislike")
+async def bench_dislike_existing(ctx: Context):
+    return functools.partial(DislikeModel.existing_dislike, ctx.session, 1, 1)
+
+
+async def seed(reactions: int, reseed: bool) -> Context:
+    users = REACTIONS_PER_POST
+    posts = max(math.ceil(reactions / users), 1)
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+        counts = {
+            table: (
+                await conn.execute(text(f"SELECT count(*) FROM {table}"))
+            ).scalar()
+            for table in SEEDED_TABLES
+        }
+        if counts["reactions"] != reactions or counts["users"] != users:
+            if any(counts.values()) and not reseed:
+                raise SystemExit(
+                    f"The database holds other data {counts}, pass "
+                    "--reseed to empty it"
+                )
+
+            params = {
+                "users": users,
+                "posts": posts,
+                "reactions": reactions,
+                "password": hashers["hmac"].hash("password"),
+            }
+            for statement in SEED_STATEMENTS:
+                await conn.execute(text(statement), params)
+
+    return Context(session=AsyncSessionLocal(), users=users, posts=posts)
+
+
+async def measure(op: Callable[[], Any], min_time: float, repeat: int):
+    """Best seconds per call over `repeat` rounds of enough calls to take
+    at least `min_time`, like timeit's autorange."""
+    result = op()
+    is_async = asyncio.iscoroutine(result)
+    if is_async:
+        await result
+
+    async def run(number: int) -> float:
+        started_at = time.perf_counter()
+        if is_async:
+            for _ in range(number):
+                await op()
+        else:
+            for _ in range(number):
+                op()
+        return time.perf_counter() - started_at
+
+    number = 1
+    while (elapsed := await run(number)) < min_time:
+        number *= 2
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        timings.append(await run(number) / number)
+    return min(timings)
+
+
+def load_baselines() -> dict:
+    if not BASELINES.exists():
+        return {}
+    return json.loads(BASELINES.read_text())
+
+
+def compare(
+    results: Dict[str, float], baselines: Dict[str, float], threshold: float
+) -> List[str]:
+    return [
+        name
+        for name, seconds in results.items()
+        if name in baselines and seconds > baselines[name] * (1 + threshold)
+    ]
+
+
+async def run(args: argparse.Namespace) -> Dict[str, float]:
+    ctx = await seed(args.reactions, args.reseed)
+    names = [name for name in BENCHMARKS if args.filter in name]
+
+    results = {}
+    try:
+        await ctx.session.begin()
+        for name in names:
+            op = await BENCHMARKS[name](ctx)
+            results[name] = await measure(op, args.min_time, args.repeat)
+            print(f"{name:45} {results[name] * 1e6:12.1f} us", flush=True)
+    finally:
+        await ctx.session.rollback()
+        await ctx.session.close()
+        await redis.redis.delete(*REDIS_KEYS)
+        await redis.forget_trending(-1)
+        await redis.close()
+        await async_engine.dispose()
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.micro", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument(
+        "--reactions",
+        type=int,
+        default=10_000,
+        help="seeded reactions, from 10k to 10M",
+    )
+    parser.add_argument(
+        "--reseed",
+        action="store_true",
+        help="empty and seed a database holding other data",
+    )
+    parser.add_argument(
+        "-k", dest="filter", default="", help="only names containing it"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="seconds each round takes at least",
+    )
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument(
+        "--update-baselines",
+        action="store_true",
+        help="store the results as the baselines of this size",
+    )
+    parser.add_argument("--output", help="write the results there as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    baselines = load_baselines()
+    size = str(args.reactions)
+    if args.update_baselines:
+        baselines[size] = {
+            **baselines.get(size, {}),
+            **{name: round(seconds, 9) for name, seconds in results.items()},
+        }
+        BASELINES.write_text(json.dumps(baselines, indent=2) + "\n")
+        return 0
+
+    regressions = compare(results, baselines.get(size, {}), args.threshold)
+    for name in regressions:
+        print(
+            f"REGRESSION: {name} {results[name] * 1e6:.1f} us, baseline "
+            f"{baselines[size][name] * 1e6:.1f} us",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,15 @@
+from datetime import timedelta
+
 import pytest
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.db.cache import token_cache, user_cache
 from app.selectors.user import get_user_by_username
-from app.utils.password import get_password_hash
+from app.services.user import invalidate_user
+from app.utils.email_verifier import email_verifier
+from app.utils.jwt import create_access_token, decode_token
+from app.utils.password import hashers, verify_password
 
 
 # @pytest.mark.xfail
@@ -16,10 +22,8 @@ async def test_signup_success(ac: AsyncClient):
     }
     response = await ac.post("auth/signup", json=data)
 
-    assert response.status_code == 400
-
-    token = response.json()
-    assert "detail" in token
+    assert response.status_code == 200
+    assert response.json() == {"message": "Successfully created user"}
 
 
 @pytest.mark.asyncio
@@ -75,7 +79,64 @@ async def test_signup_creates_user(ac: AsyncClient, session: AsyncSession):
 
     assert user.username == data["username"]
     assert user.email == data["email"]
-    assert user.password == get_password_hash(data["password"])
+    assert await verify_password(data["password"], user.password)
+
+
+@pytest.mark.asyncio
+async def test_signup_verification_is_cached(
+    ac: AsyncClient, session: AsyncSession, email_verifier_stub,
+    redis_connection,
+):
+    data = {
+        "username": "testuser",
+        "password": "password",
+        "email": "user@test.com",
+    }
+
+    response = await ac.post("auth/signup", json=data)
+    assert response.status_code == 200
+
+    response = await ac.post("auth/signup", json=data)
+    assert response.json() == {"detail": "Username already registered"}
+
+    # only the first signup reached the verifier
+    assert email_verifier_stub.emails == ["user@test.com"]
+
+
+@pytest.mark.asyncio
+async def test_signup_rejected_email(
+    ac: AsyncClient, email_verifier_stub, redis_connection
+):
+    email_verifier_stub.status = 400
+    data = {
+        "username": "testuser",
+        "password": "password",
+        "email": "user@test.com",
+    }
+    response = await ac.post("auth/signup", json=data)
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Error verifying email address"}
+
+
+@pytest.mark.asyncio
+async def test_signup_verifier_failures_open_circuit(
+    ac: AsyncClient, email_verifier_stub, redis_connection
+):
+    email_verifier_stub.status = 503
+    threshold = email_verifier.breaker.failure_threshold
+
+    for i in range(threshold + 1):
+        data = {
+            "username": f"user{i}",
+            "password": "password",
+            "email": f"user{i}@test.com",
+        }
+        response = await ac.post("auth/signup", json=data)
+        assert response.status_code == 503
+
+    # the last attempt did not reach the verifier
+    assert len(email_verifier_stub.emails) == threshold
 
 
 @pytest.mark.asyncio
@@ -88,6 +149,34 @@ async def test_signin_success(ac: AsyncClient, test_user):
     assert "access_token" in response.json()
 
 
+@pytest.mark.asyncio
+async def test_signin_upgrades_legacy_hash(
+    ac: AsyncClient, session: AsyncSession, test_user
+):
+    legacy_hash = hashers["hmac"].hash("password")
+    await test_user.update(
+        session, username=test_user.username, password=legacy_hash
+    )
+    await invalidate_user(test_user.id)
+
+    user_cache.set(test_user.id, test_user)
+
+    data = {"username": "test", "password": "password"}
+    response = await ac.post("auth/signin", json=data)
+    assert response.status_code == 200
+    # evicted once the new hash committed
+    assert user_cache.get(test_user.id) is None
+
+    user = await get_user_by_username("test", session)
+    await session.refresh(user)
+    assert user.password.startswith(hashers["bcrypt"].prefix)
+    assert await verify_password("password", user.password)
+
+    # the upgraded hash keeps working
+    response = await ac.post("auth/signin", json=data)
+    assert response.status_code == 200
+
+
 @pytest.mark.asyncio
 async def test_signin_error_incorrect_password(ac: AsyncClient, test_user):
     # Test an error if the password is incorrect
@@ -98,6 +187,22 @@ async def test_signin_error_incorrect_password(ac: AsyncClient, test_user):
     assert response.json() == {'detail': 'Incorrect username or password'}
 
 
+@pytest.mark.asyncio
+async def test_signin_error_unknown_hash_scheme(
+    ac: AsyncClient, session: AsyncSession, test_user
+):
+    await test_user.update(
+        session, username=test_user.username, password="corrupt"
+    )
+    await invalidate_user(test_user.id)
+
+    data = {"username": "test", "password": "password"}
+    response = await ac.post("auth/signin", json=data)
+
+    assert response.status_code == 400
+    assert response.json() == {'detail': 'Incorrect username or password'}
+
+
 @pytest.mark.asyncio
 @pytest.mark.xfail
 async def test_signin_error_username_not_found(ac: AsyncClient):
@@ -130,3 +235,32 @@ async def test_signin_error_password_required(ac: AsyncClient):
     assert "password" in response.json()["detail"][0]["loc"]
     assert "field required" in response.json()["detail"][0]["msg"]
 
+
+
+@pytest.mark.asyncio
+async def test_invalid_token_is_rejected(ac: AsyncClient):
+    headers = {"Authorization": "Bearer not-a-token"}
+    response = await ac.post("post", json={"content": "x"}, headers=headers)
+
+    assert response.status_code == 403
+    assert response.json() == {"detail": "Invalid token or expired token."}
+
+
+@pytest.mark.asyncio
+async def test_expired_token_is_rejected(ac: AsyncClient, test_user):
+    token = create_access_token(
+        data={"user_id": test_user.id}, expires_delta=timedelta(seconds=-1)
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await ac.post("post", json={"content": "x"}, headers=headers)
+
+    assert response.status_code == 403
+
+
+def test_decoded_token_is_cached():
+    token = create_access_token(data={"user_id": 1})
+    claims = decode_token(token)
+
+    hits = token_cache.hits
+    assert decode_token(token) is claims
+    assert token_cache.hits == hits + 1
@@ -0,0 +1,443 @@
+from time import time
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.cache import post_cache, post_local_cache
+from app.db.redis import DISLIKE, LIKE
+from app.db_models.post import PostModel
+from app.models.user import User
+from app.services.user import UserService
+from app.utils.jwt import create_access_token
+from app.utils.password import get_password_hash
+
+
+@pytest.fixture
+async def posts(session: AsyncSession, test_user):
+    return [
+        await PostModel.create(session, test_user.id, f"post {i}")
+        for i in range(5)
+    ]
+
+
+@pytest.fixture
+async def other_user(session: AsyncSession):
+    user = User(
+        email="other@mail.com",
+        username="other",
+        password=await get_password_hash("password"),
+    )
+    return await UserService.create(user=user, session=session)
+
+
+@pytest.fixture
+def other_user_headers(other_user):
+    token = create_access_token(data={"user_id": other_user.id})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.mark.asyncio
+async def test_create_and_update_post(
+    ac: AsyncClient, session: AsyncSession, other_user, other_user_headers
+):
+    response = await ac.post(
+        "post", json={"content": "hello"}, headers=other_user_headers
+    )
+    assert response.status_code == 200
+
+    post = response.json()
+    assert post["content"] == "hello"
+    assert post["user_id"] == other_user.id
+
+    response = await ac.put(
+        "post",
+        json={"post_id": post["id"], "content": "edited"},
+        headers=other_user_headers,
+    )
+    assert response.json() == {**post, "content": "edited"}
+
+    stored = await session.get(PostModel, post["id"], populate_existing=True)
+    assert stored.content == "edited"
+
+
+@pytest.mark.asyncio
+async def test_get_post_reads_through_cache(
+    ac: AsyncClient, posts, redis_connection
+):
+    post = posts[0]
+    misses = post_cache.misses
+
+    response = await ac.get(f"post/{post.id}")
+    assert response.status_code == 200
+    assert response.json()["post"]["content"] == post.content
+    assert post_cache.misses == misses + 1
+
+    # dropped from worker memory, Redis still has the body
+    post_local_cache.clear()
+    hits = post_cache.hits
+    response = await ac.get(f"post/{post.id}")
+    assert response.json()["post"]["content"] == post.content
+    assert post_cache.hits == hits + 1
+
+    local_hits = post_local_cache.hits
+    response = await ac.get(f"post/{post.id}")
+    assert response.json()["post"]["content"] == post.content
+    assert post_local_cache.hits == local_hits + 1
+    assert post_cache.hits == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_update_invalidates_cached_post(
+    ac: AsyncClient, test_user, posts, redis_connection
+):
+    post = posts[0]
+    token = create_access_token(data={"user_id": test_user.id})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    await ac.get(f"post/{post.id}")
+    await ac.put(
+        "post", json={"post_id": post.id, "content": "edited"}, headers=headers
+    )
+
+    response = await ac.get(f"post/{post.id}")
+    assert response.json()["post"]["content"] == "edited"
+
+    await ac.delete("post", params={"post_id": post.id}, headers=headers)
+
+    response = await ac.get(f"post/{post.id}")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_create_evicts_cached_missing_post(
+    ac: AsyncClient, test_user, posts, redis_connection
+):
+    token = create_access_token(data={"user_id": test_user.id})
+    next_id = posts[-1].id + 1
+
+    response = await ac.get(f"post/{next_id}")
+    assert response.status_code == 404
+
+    response = await ac.post(
+        "post",
+        json={"content": "new"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.json()["id"] == next_id
+
+    response = await ac.get(f"post/{next_id}")
+    assert response.status_code == 200
+    assert response.json()["post"]["content"] == "new"
+
+
+@pytest.mark.asyncio
+async def test_list_posts_paginates_with_cursor(ac: AsyncClient, posts):
+    expected = [post.id for post in reversed(posts)]
+
+    response = await ac.get("post", params={"limit": 3})
+    assert response.status_code == 200
+
+    page = response.json()
+    assert [item["post"]["id"] for item in page["posts"]] == expected[:3]
+    assert page["next_cursor"] == expected[2]
+
+    response = await ac.get(
+        "post", params={"limit": 3, "cursor": page["next_cursor"]}
+    )
+    page = response.json()
+    assert [item["post"]["id"] for item in page["posts"]] == expected[3:]
+    assert page["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_list_posts_filters_by_user(ac: AsyncClient, posts):
+    response = await ac.get("post", params={"user_id": posts[0].user_id})
+    assert len(response.json()["posts"]) == len(posts)
+
+    response = await ac.get("post", params={"user_id": posts[0].user_id + 1})
+    assert response.json() == {"posts": [], "next_cursor": None}
+
+
+@pytest.mark.asyncio
+async def test_list_posts_bounds_page_size(ac: AsyncClient):
+    response = await ac.get("post", params={"limit": 0})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_batch_get_posts_keeps_request_order(ac: AsyncClient, posts):
+    missing_id = posts[-1].id + 100
+    ids = [posts[2].id, missing_id, posts[0].id, posts[2].id]
+
+    response = await ac.get("post/batch", params={"ids": ids})
+    assert response.status_code == 200
+
+    batch = response.json()
+    assert batch["posts"][1] is None
+    assert [item["post"]["id"] for item in batch["posts"] if item] == [
+        posts[2].id,
+        posts[0].id,
+        posts[2].id,
+    ]
+    assert batch["missing"] == [missing_id]
+
+
+@pytest.mark.asyncio
+async def test_batch_get_posts_requires_ids(ac: AsyncClient):
+    response = await ac.get("post/batch")
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_reaction_transitions_update_counters(
+    ac: AsyncClient, posts, other_user_headers, redis_connection
+):
+    post_id = posts[0].id
+
+    response = await ac.post(
+        f"post/{post_id}/like", headers=other_user_headers
+    )
+    assert response.status_code == 200
+
+    response = await ac.get(f"post/{post_id}")
+    assert (response.json()["likes"], response.json()["dislikes"]) == (1, 0)
+
+    response = await ac.post(
+        f"post/{post_id}/dislike", headers=other_user_headers
+    )
+    assert response.status_code == 200
+
+    response = await ac.get(f"post/{post_id}")
+    assert (response.json()["likes"], response.json()["dislikes"]) == (0, 1)
+
+    response = await ac.delete(
+        f"post/{post_id}/undislike", headers=other_user_headers
+    )
+    assert response.status_code == 200
+
+    response = await ac.get(f"post/{post_id}")
+    assert (response.json()["likes"], response.json()["dislikes"]) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_search_posts(
+    ac: AsyncClient, session: AsyncSession, test_user, other_user
+):
+    contents = [
+        (test_user, "cats and dogs"),
+        (other_user, "cats, cats and more cats"),
+        (test_user, "only dogs"),
+        (test_user, "a cat"),
+        (other_user, "the cat sat"),
+    ]
+    posts = [
+        await PostModel.create(session, user.id, content)
+        for user, content in contents
+    ]
+
+    async def search(**params):
+        response = await ac.get("post/search", params=params)
+        body = response.json()
+        ids = [post["post"]["id"] for post in body["posts"]]
+        return ids, body["next_cursor"]
+
+    # stemmed, best match first, ties newest first
+    ids, cursor = await search(q="cat", limit=2)
+    assert ids == [posts[1].id, posts[4].id]
+    page, cursor = await search(q="cat", limit=2, cursor=cursor)
+    assert (page, cursor) == ([posts[3].id, posts[0].id], None)
+
+    ids, _ = await search(q="cats -dogs")
+    assert sorted(ids) == [posts[1].id, posts[3].id, posts[4].id]
+    assert await search(q="cat", user_id=other_user.id) == (
+        [posts[1].id, posts[4].id],
+        None,
+    )
+
+    # the trigger follows edits
+    await posts[2].update(session, test_user.id, "dogs chasing a cat")
+    assert posts[2].id in (await search(q="chase"))[0]
+
+    response = await ac.get("post/search", params={"q": "cat", "cursor": "x"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_trending_posts_by_window(
+    ac: AsyncClient, test_user, posts, other_user, redis_connection
+):
+    old, recent, disliked = posts[:3]
+    now = time()
+    # two likes two hours ago, one like now
+    await redis_connection.react(old.id, other_user.id, LIKE, now=now - 7200)
+    await redis_connection.react(old.id, test_user.id, LIKE, now=now - 7200)
+    await redis_connection.react(recent.id, other_user.id, LIKE, now=now)
+    await redis_connection.react(disliked.id, other_user.id, DISLIKE)
+
+    def ids(response):
+        return [post["post"]["id"] for post in response.json()["posts"]]
+
+    # an hour window halves the old likes twice, a day window barely
+    response = await ac.get("post/trending", params={"window": "hour"})
+    assert ids(response) == [recent.id, old.id, disliked.id]
+    response = await ac.get("post/trending")
+    assert response.json()["window"] == "day"
+    assert ids(response) == [old.id, recent.id, disliked.id]
+
+    token = create_access_token(data={"user_id": test_user.id})
+    await ac.delete(
+        "post",
+        params={"post_id": old.id},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    response = await ac.get("post/trending", params={"limit": 1})
+    assert ids(response) == [recent.id]
+
+    response = await ac.get("post/trending", params={"window": "year"})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_counts_survive_a_redis_flush(
+    ac: AsyncClient, posts, other_user_headers, redis_connection
+):
+    post_id = posts[0].id
+    await ac.post(f"post/{post_id}/like", headers=other_user_headers)
+
+    await redis_connection.redis.flushdb()
+    post_local_cache.clear()
+
+    response = await ac.get(f"post/{post_id}")
+    assert (response.json()["likes"], response.json()["dislikes"]) == (1, 0)
+
+    response = await ac.get("post/batch", params={"ids": [post_id]})
+    assert response.json()["posts"][0]["likes"] == 1
+
+    response = await ac.get("post", params={"limit": len(posts)})
+    assert response.json()["posts"][-1]["likes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reaction_after_a_redis_flush_keeps_exact_counts(
+    ac: AsyncClient,
+    session: AsyncSession,
+    posts,
+    other_user_headers,
+    redis_connection,
+):
+    post_id = posts[0].id
+    await ac.post(f"post/{post_id}/like", headers=other_user_headers)
+    await redis_connection.redis.flushdb()
+
+    third_user = await UserService.create(
+        user=User(
+            email="third@mail.com",
+            username="third",
+            password=await get_password_hash("password"),
+        ),
+        session=session,
+    )
+    token = create_access_token(data={"user_id": third_user.id})
+    response = await ac.post(
+        f"post/{post_id}/like",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+
+    response = await ac.get(f"post/{post_id}")
+    assert response.json()["likes"] == 2
+    response = await ac.get("post", params={"limit": len(posts)})
+    assert response.json()["posts"][-1]["likes"] == 2
+
+
+@pytest.mark.asyncio
+async def test_reaction_upgrades_string_member_keys(
+    ac: AsyncClient, posts, other_user, other_user_headers, redis_connection
+):
+    post_id = posts[0].id
+    # written by the versions that stored members with SET
+    await redis_connection.redis.set(f"post:{post_id}:likes", 1)
+    await redis_connection.redis.set(
+        f"post:{post_id}:likes:users", other_user.id
+    )
+
+    response = await ac.post(
+        f"post/{post_id}/dislike", headers=other_user_headers
+    )
+    assert response.status_code == 200
+
+    response = await ac.get(f"post/{post_id}")
+    assert (response.json()["likes"], response.json()["dislikes"]) == (0, 1)
+
+
+@pytest.mark.asyncio
+async def test_reaction_transitions_maintain_post_counters(
+    ac: AsyncClient,
+    session: AsyncSession,
+    posts,
+    other_user_headers,
+    redis_connection,
+):
+    post_id = posts[0].id
+    counters = select(PostModel.like_count, PostModel.dislike_count).where(
+        PostModel.id == post_id
+    )
+
+    await ac.post(f"post/{post_id}/like", headers=other_user_headers)
+    assert tuple((await session.execute(counters)).one()) == (1, 0)
+
+    await ac.post(f"post/{post_id}/dislike", headers=other_user_headers)
+    assert tuple((await session.execute(counters)).one()) == (0, 1)
+
+    # a failed transition rolls back the test transaction, keep it last
+    response = await ac.post(
+        f"post/{post_id}/dislike", headers=other_user_headers
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "You have already disliked this post"
+
+
+@pytest.mark.asyncio
+async def test_like_post_query_budget(
+    ac: AsyncClient,
+    posts,
+    other_user_headers,
+    redis_connection,
+    assert_max_queries,
+):
+    # loading the user and one statement for the reaction and counters
+    with assert_max_queries(2):
+        response = await ac.post(
+            f"post/{posts[0].id}/like", headers=other_user_headers
+        )
+    assert response.status_code == 200
+
+    # the user is cached now
+    with assert_max_queries(1):
+        response = await ac.delete(
+            f"post/{posts[0].id}/unlike", headers=other_user_headers
+        )
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_reaction_on_missing_post(
+    ac: AsyncClient, posts, other_user_headers
+):
+    response = await ac.post(
+        f"post/{posts[-1].id + 1}/like", headers=other_user_headers
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_reaction_on_own_post(ac: AsyncClient, test_user, posts):
+    token = create_access_token(data={"user_id": test_user.id})
+    response = await ac.post(
+        f"post/{posts[0].id}/like",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "User can not like his own post"
@@ -0,0 +1,176 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.redis import timeline_key
+from app.db_models.post import PostModel
+from app.db_models.user import UserModel
+from app.models.user import User
+from app.services.user import UserService
+from app.utils.jwt import create_access_token
+from app.utils.password import get_password_hash
+
+
+@pytest.fixture
+async def author(session: AsyncSession):
+    user = User(
+        email="author@mail.com",
+        username="author",
+        password=await get_password_hash("password"),
+    )
+    return await UserService.create(user=user, session=session)
+
+
+def headers(user):
+    token = create_access_token(data={"user_id": user.id})
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def timeline(ac: AsyncClient, user, **params):
+    response = await ac.get(
+        "post/timeline", params=params, headers=headers(user)
+    )
+    assert response.status_code == 200
+    body = response.json()
+    return [post["post"]["id"] for post in body["posts"]], body["next_cursor"]
+
+
+async def create_post(ac: AsyncClient, user, content="hello") -> int:
+    response = await ac.post(
+        "post", json={"content": content}, headers=headers(user)
+    )
+    return response.json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_follow_and_unfollow(
+    ac: AsyncClient, session: AsyncSession, test_user, author
+):
+    async def follower_count():
+        user = await session.get(UserModel, author.id, populate_existing=True)
+        return user.follower_count
+
+    response = await ac.post(
+        f"user/{author.id}/follow", headers=headers(test_user)
+    )
+    assert response.json() == {"message": "User followed successfully"}
+    assert await follower_count() == 1
+
+    response = await ac.delete(
+        f"user/{author.id}/unfollow", headers=headers(test_user)
+    )
+    assert response.json() == {"message": "User unfollowed successfully"}
+    assert await follower_count() == 0
+
+    # failed requests roll back the test data, check them last
+    for method, path, status_code in (
+        ("DELETE", f"user/{author.id}/unfollow", 400),
+        ("POST", f"user/{test_user.id}/follow", 400),
+        ("POST", "user/999/follow", 404),
+    ):
+        response = await ac.request(method, path, headers=headers(test_user))
+        assert response.status_code == status_code
+
+
+@pytest.mark.asyncio
+async def test_timeline_fans_out_on_write(
+    ac: AsyncClient, test_user, author, redis_connection
+):
+    own = await create_post(ac, test_user)
+    unfollowed = await create_post(ac, author)
+    await ac.post(f"user/{author.id}/follow", headers=headers(test_user))
+
+    # the first read rebuilds the timeline from Postgres
+    assert await timeline(ac, test_user) == ([unfollowed, own], None)
+
+    followed = await create_post(ac, author)
+    assert str(followed) in await redis_connection.redis.zrange(
+        timeline_key(test_user.id), 0, -1
+    )
+    assert await timeline(ac, test_user, limit=2) == (
+        [followed, unfollowed],
+        unfollowed,
+    )
+    assert await timeline(ac, test_user, limit=2, cursor=unfollowed) == (
+        [own],
+        None,
+    )
+
+    token = create_access_token(data={"user_id": author.id})
+    await ac.delete(
+        "post",
+        params={"post_id": followed},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert await timeline(ac, test_user) == ([unfollowed, own], None)
+
+    await ac.delete(f"user/{author.id}/unfollow", headers=headers(test_user))
+    assert await timeline(ac, test_user) == ([own], None)
+
+
+@pytest.mark.asyncio
+async def test_timeline_merges_celebrities_on_read(
+    ac: AsyncClient, monkeypatch, test_user, author, redis_connection
+):
+    monkeypatch.setattr(settings, "TIMELINE_CELEBRITY_THRESHOLD", 1)
+    await ac.post(f"user/{author.id}/follow", headers=headers(test_user))
+    own = await create_post(ac, test_user)
+    assert await timeline(ac, test_user) == ([own], None)
+
+    celebrity_posts = [await create_post(ac, author) for _ in range(2)]
+    # not fanned out, read from the recent posts of the author
+    assert await redis_connection.redis.zrange(
+        timeline_key(test_user.id), 0, -1
+    ) == ["0", str(own)]
+    assert await timeline(ac, test_user) == (
+        [*reversed(celebrity_posts), own],
+        None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_timeline_pages_past_redis_from_postgres(
+    ac: AsyncClient,
+    monkeypatch,
+    session: AsyncSession,
+    test_user,
+    redis_connection,
+):
+    monkeypatch.setattr(settings, "TIMELINE_MAX_POSTS", 2)
+    posts = [
+        (await PostModel.create(session, test_user.id, f"post {i}")).id
+        for i in range(5)
+    ]
+
+    post_ids, cursor = await timeline(ac, test_user, limit=2)
+    while cursor is not None:
+        page, cursor = await timeline(ac, test_user, limit=2, cursor=cursor)
+        post_ids.extend(page)
+    assert post_ids == posts[::-1]
+    assert await redis_connection.redis.zcard(timeline_key(test_user.id)) == 3
+
+
+@pytest.mark.asyncio
+async def test_timeline_pages_past_full_lists_from_postgres(
+    ac: AsyncClient,
+    monkeypatch,
+    session: AsyncSession,
+    test_user,
+    author,
+    redis_connection,
+):
+    monkeypatch.setattr(settings, "TIMELINE_MAX_POSTS", 3)
+    monkeypatch.setattr(settings, "TIMELINE_CELEBRITY_THRESHOLD", 1)
+    await ac.post(f"user/{author.id}/follow", headers=headers(test_user))
+    # older celebrity posts, then more own posts than the timeline holds
+    posts = [
+        (await PostModel.create(session, user.id, "hello")).id
+        for user in [author] * 2 + [test_user] * 6
+    ]
+
+    post_ids, cursor = await timeline(ac, test_user, limit=2)
+    while cursor is not None:
+        page, cursor = await timeline(ac, test_user, limit=2, cursor=cursor)
+        post_ids.extend(page)
+    assert post_ids == posts[::-1]
@@ -1,5 +1,8 @@
 import asyncio
-from typing import Generator
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import AsyncIterator, Generator
+from urllib.parse import parse_qs, urlparse
 
 import pytest
 from httpx import AsyncClient
@@ -11,11 +14,15 @@ from sqlalchemy.pool import NullPool
 
 from app.core.config import Settings, test_settings
 from app.db.base import Base
-from app.db.session import get_session
+from app.db.cache import cache_bus
+from app.db.query_counter import assert_max_queries as max_queries
+from app.db.redis import redis
+from app.db.session import RequestSession, get_session
 from app.main import app
 from app.models.user import User
 from app.services.user import UserService
-from app.utils.password import get_password_hash
+from app.utils.email_verifier import email_verifier
+from app.utils.password import get_password_hash, hashers
 
 settings = Settings()
 
@@ -84,6 +91,22 @@ def setup_db() -> Generator:
         print("closed connection after test")
 
 
+@pytest.fixture(scope="session", autouse=True)
+def fast_password_hashing() -> Generator:
+    # the cheapest cost bcrypt accepts, tests create many users
+    bcrypt_hasher = hashers["bcrypt"]
+    rounds, bcrypt_hasher.rounds = bcrypt_hasher.rounds, 4
+    yield
+    bcrypt_hasher.rounds = rounds
+
+
+@pytest.fixture(scope="function", autouse=True)
+def clear_caches():
+    # ids restart with every test database, cached rows would leak
+    for cache, _ in cache_bus.caches.values():
+        cache.clear()
+
+
 @pytest.fixture(scope="function", autouse=True)
 def setup_test_db(setup_db):
     engine = create_engine(f"{test_settings.DB_URI.replace('+asyncpg', '')}")
@@ -110,6 +133,7 @@ async def session():
         AsyncSessionLocal = sessionmaker(
             autocommit=False,
             autoflush=False,
+            expire_on_commit=False,
             bind=conn,
             future=True,
             class_=AsyncSession,
@@ -124,11 +148,17 @@ async def session():
             if not conn.in_nested_transaction:
                 conn.sync_connection.begin_nested()
 
-        def test_get_session() -> Generator:
+        async def test_get_session() -> AsyncIterator[RequestSession]:
+            # reads share the test connection and its transaction too
+            request_session = RequestSession(
+                AsyncSessionLocal, AsyncSessionLocal
+            )
             try:
-                yield AsyncSessionLocal
+                yield request_session
             except SQLAlchemyError:
                 pass
+            finally:
+                await request_session.close()
 
         app.dependency_overrides[get_session] = test_get_session
 
@@ -137,6 +167,7 @@ async def session():
         # await async_session.rollback()
         await async_session.close()
         await conn.rollback()
+        app.dependency_overrides.pop(get_session, None)
 
 
 @pytest.fixture(scope="function")
@@ -144,6 +175,63 @@ async def test_user(session: AsyncSession):
     user = User(
         email="test@mail.com",
         username="test",
-        password=get_password_hash("password"),
+        password=await get_password_hash("password"),
     )
     return await UserService.create(user=user, session=session)
+
+
+@pytest.fixture
+def assert_max_queries():
+    """`with assert_max_queries(n):` or as a decorator, fails the test when
+    the requests in the block run more than n SQL statements."""
+    return max_queries
+
+
+@pytest.fixture(scope="function")
+async def redis_connection():
+    # post ids restart with every test database
+    await redis.redis.flushdb()
+    yield redis
+    # nor may the keys of a test outlive it, benchmarks share the database
+    await redis.redis.flushdb()
+
+
+class EmailVerifierStub(BaseHTTPRequestHandler):
+    """Stands in for Email-hunter, answers every request with `status`."""
+
+    status = 200
+    emails = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        type(self).emails.append(query["email"][0])
+
+        self.send_response(self.status)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"data": {}}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def email_verifier_server() -> Generator:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EmailVerifierStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_port}/v2/email-verifier"
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="function", autouse=True)
+def email_verifier_stub(email_verifier_server) -> Generator:
+    EmailVerifierStub.status = 200
+    EmailVerifierStub.emails = []
+    email_verifier.url = email_verifier_server
+    email_verifier.breaker.reset()
+
+    yield EmailVerifierStub
@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models.post import (
+    DislikeModel,
+    LikeModel,
+    PostModel,
+    ReactionModel,
+)
+from app.db_models.user import FollowModel, UserModel
+
+HOT_QUERIES = [
+    (
+        select(LikeModel).where(
+            LikeModel.post_id == 1, LikeModel.user_id == 1
+        ),
+        "ix_likes_post_id_user_id",
+    ),
+    (
+        select(DislikeModel).where(
+            DislikeModel.post_id == 1, DislikeModel.user_id == 1
+        ),
+        "ix_dislikes_post_id_user_id",
+    ),
+    (
+        select(ReactionModel).where(
+            ReactionModel.post_id == 1, ReactionModel.user_id == 1
+        ),
+        "reactions_pkey",
+    ),
+    (
+        select(UserModel).where(UserModel.username == "test"),
+        "ix_users_username",
+    ),
+    (
+        select(UserModel).where(UserModel.email == "test@mail.com"),
+        "ix_users_email",
+    ),
+    (
+        select(PostModel)
+        .where(PostModel.user_id == 1)
+        .order_by(PostModel.id.desc())
+        .limit(20),
+        "ix_posts_user_id_id",
+    ),
+    (
+        select(FollowModel.follower_id).where(FollowModel.followee_id == 1),
+        "ix_follows_followee_id_follower_id",
+    ),
+    (
+        select(PostModel.id).where(
+            PostModel.search_vector.op("@@")(
+                func.websearch_to_tsquery(
+                    text("'english'::regconfig"), "cats"
+                )
+            )
+        ),
+        "ix_posts_search_vector",
+    ),
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query, index", HOT_QUERIES)
+async def test_hot_queries_use_index(session: AsyncSession, query, index):
+    # empty test tables are cheaper to scan, make the planner show the
+    # index it would pick on a real table
+    await session.execute(text("SET LOCAL enable_seqscan = off"))
+
+    compiled = query.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    plan = "\n".join(
+        (await session.execute(text(f"EXPLAIN {compiled}"))).scalars()
+    )
+
+    assert index in plan
+    assert "Seq Scan" not in plan
@@ -0,0 +1,80 @@
+import aioredis
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import settings, test_settings
+from app.db.pool import (
+    InstrumentedBlockingConnectionPool,
+    InstrumentedQueuePool,
+    engine_pool_stats,
+)
+
+
+@pytest.mark.asyncio
+async def test_db_pool_reports_exhaustion():
+    engine = create_async_engine(
+        f"{test_settings.DB_URI}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+
+    try:
+        async with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                async with engine.connect():
+                    pass
+
+            stats = engine_pool_stats(engine)
+    finally:
+        await engine.dispose()
+
+    assert stats["checked_out"] == 1
+    assert stats["waiters"] == 0
+    assert (stats["checkouts"], stats["timeouts"]) == (2, 1)
+    assert stats["max_wait_time"] >= 0.1
+
+
+@pytest.mark.asyncio
+async def test_redis_pool_reports_exhaustion():
+    pool = InstrumentedBlockingConnectionPool.from_url(
+        f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}",
+        max_connections=1,
+        timeout=0.1,
+    )
+
+    try:
+        connection = await pool.get_connection("GET")
+        with pytest.raises(aioredis.ConnectionError):
+            await pool.get_connection("GET")
+
+        stats = pool.stats()
+        await pool.release(connection)
+    finally:
+        await pool.disconnect()
+
+    assert (stats["connections"], stats["checked_out"]) == (1, 1)
+    assert (stats["checkouts"], stats["timeouts"]) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_endpoint(
+    ac: AsyncClient, redis_connection, monkeypatch
+):
+    monkeypatch.setattr(settings, "INTERNAL_API_TOKEN", "secret")
+
+    response = await ac.get("internal/pools")
+    assert response.status_code == 403
+
+    response = await ac.get(
+        "internal/pools", headers={"X-Internal-Token": "secret"}
+    )
+
+    assert response.status_code == 200
+    assert set(response.json()) == {"db", "redis"}
+    assert response.json()["redis"]["max_connections"] == (
+        settings.REDIS_MAX_CONNECTIONS
+    )
@@ -0,0 +1,74 @@
+import logging
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.query_counter import assert_max_queries, count_queries
+
+SELECT_NUMBER = text("SELECT CAST(:i AS integer)")
+
+
+@pytest.mark.asyncio
+async def test_repeated_statements_are_logged(
+    session: AsyncSession, caplog
+):
+    with caplog.at_level(logging.WARNING, logger="app.db.query_counter"):
+        with count_queries() as log:
+            for i in range(settings.QUERY_N_PLUS_ONE_THRESHOLD):
+                await session.execute(SELECT_NUMBER, {"i": i})
+            await session.execute(text("SELECT 1"))
+
+    assert len(log) == settings.QUERY_N_PLUS_ONE_THRESHOLD + 1
+    [repeated] = log.repeated(settings.QUERY_N_PLUS_ONE_THRESHOLD).values()
+    assert len(repeated) == settings.QUERY_N_PLUS_ONE_THRESHOLD
+    assert not caplog.records
+
+    with caplog.at_level(logging.WARNING, logger="app.db.query_counter"):
+        with assert_max_queries(5):
+            for i in range(settings.QUERY_N_PLUS_ONE_THRESHOLD):
+                await session.execute(SELECT_NUMBER, {"i": i})
+
+    [record] = caplog.records
+    assert "Possible N+1" in record.getMessage()
+    # the stack points at the code that ran the statement
+    assert "test_query_counter.py" in record.getMessage()
+
+
+@pytest.mark.asyncio
+async def test_query_budget_exceeded(session: AsyncSession):
+    @assert_max_queries(1)
+    async def two_queries():
+        await session.execute(text("SELECT 1"))
+        await session.execute(text("SELECT 2"))
+
+    with pytest.raises(AssertionError, match="2 statements ran"):
+        await two_queries()
+
+
+@pytest.mark.asyncio
+async def test_query_count_header(
+    ac: AsyncClient, session: AsyncSession, monkeypatch
+):
+    response = await ac.get("post?limit=1")
+    assert settings.QUERY_COUNTER_HEADER not in response.headers
+
+    # only for operators
+    response = await ac.get(
+        "post?limit=1", headers={settings.QUERY_COUNTER_HEADER: "1"}
+    )
+    assert settings.QUERY_COUNTER_HEADER not in response.headers
+
+    monkeypatch.setattr(settings, "INTERNAL_API_TOKEN", "secret")
+    response = await ac.get(
+        "post?limit=1", headers={settings.QUERY_COUNTER_HEADER: "wrong"}
+    )
+    assert settings.QUERY_COUNTER_HEADER not in response.headers
+
+    response = await ac.get(
+        "post?limit=1", headers={settings.QUERY_COUNTER_HEADER: "secret"}
+    )
+    assert response.status_code == 200
+    assert response.headers[settings.QUERY_COUNTER_HEADER] == "1"
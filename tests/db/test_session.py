@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import test_settings
+from app.db.cache import user_cache
+from app.db.session import RequestSession
+from app.utils.user import get_current_user
+
+
+@pytest.fixture
+async def engine():
+    engine = create_async_engine(f"{test_settings.DB_URI}", future=True)
+    yield engine
+    await engine.dispose()
+
+
+def make_sessionmaker(bind) -> sessionmaker:
+    return sessionmaker(
+        bind, class_=AsyncSession, expire_on_commit=False, future=True
+    )
+
+
+@pytest.mark.asyncio
+async def test_request_shares_one_connection_and_transaction(engine):
+    checkouts = []
+    event.listen(
+        engine.sync_engine, "checkout", lambda *args: checkouts.append(1)
+    )
+    request_session = RequestSession(make_sessionmaker(engine))
+    txid = text("SELECT txid_current()")
+
+    try:
+        # as the auth dependency does before the service runs
+        first = (await request_session.session.execute(txid)).scalar()
+
+        async with request_session.begin() as session:
+            second = (await session.execute(txid)).scalar()
+    finally:
+        await request_session.close()
+
+    assert first == second
+    assert len(checkouts) == 1
+
+
+@pytest.mark.asyncio
+async def test_reads_run_outside_of_a_transaction(engine):
+    request_session = RequestSession(
+        read_session_factory=make_sessionmaker(
+            engine.execution_options(isolation_level="AUTOCOMMIT")
+        )
+    )
+    txid = text("SELECT txid_current()")
+
+    try:
+        async with request_session.read() as session:
+            first = (await session.execute(txid)).scalar()
+            second = (await session.execute(txid)).scalar()
+    finally:
+        await request_session.close()
+
+    assert first != second
+
+
+@pytest.mark.asyncio
+async def test_authentication_holds_no_connection(engine):
+    async with engine.begin() as connection:
+        user_id = (
+            await connection.execute(
+                text(
+                    "INSERT INTO users (username, follower_count) "
+                    "VALUES ('test', 0) RETURNING id"
+                )
+            )
+        ).scalar()
+    request_session = RequestSession(
+        make_sessionmaker(engine),
+        make_sessionmaker(
+            engine.execution_options(isolation_level="AUTOCOMMIT")
+        ),
+    )
+
+    try:
+        user = await get_current_user({"user_id": user_id}, request_session)
+        # loaded on a cache miss, the connection is back in the pool
+        assert user.id == user_id
+        assert user_cache.get(user_id) is user
+        assert engine.sync_engine.pool.checkedout() == 0
+    finally:
+        await request_session.close()
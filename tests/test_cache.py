@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from app.db.cache import cache_bus, user_cache
+from app.utils.cache import TieredCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=0)
+
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_ttl_cache_bounds_memory():
+    cache = TTLCache(maxsize=10, ttl=60, max_bytes=100)
+    cache.set("a", 1, size=60)
+    cache.set("b", 2, size=30)
+    cache.set("c", 3, size=30)
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 60
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_shares_concurrent_loads():
+    cache = TieredCache(maxsize=10, ttl=60)
+    loads = []
+
+    async def load(key):
+        loads.append(key)
+        await asyncio.sleep(0.01)
+        return f"value {key}"
+
+    values = await asyncio.gather(
+        *(cache.get_or_load(1, load) for _ in range(10))
+    )
+
+    assert values == ["value 1"] * 10
+    assert loads == [1]
+    assert await cache.get_or_load(1, load) == "value 1"
+    assert cache.bytes == cache.sizeof("value 1")
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_drops_loads_raced_by_invalidation():
+    cache = TieredCache(maxsize=10, ttl=60)
+
+    async def load(key):
+        cache.invalidate(key)  # a write lands while loading
+        return "stale"
+
+    assert await cache.get_or_load(1, load) == "stale"
+    assert len(cache) == 0
+
+
+async def eventually(predicate, timeout: float = 1.0) -> bool:
+    for _ in range(int(timeout / 0.01)):
+        if await predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+@pytest.mark.asyncio
+async def test_invalidation_is_broadcast(redis_connection):
+    async def subscribed():
+        channels = await redis_connection.redis.pubsub_numsub(
+            cache_bus.channel
+        )
+        return channels[0][1] > 0
+
+    await cache_bus.start()
+    try:
+        assert await eventually(subscribed)
+        # let the listener clear the caches after subscribing
+        await asyncio.sleep(0.05)
+        user_cache.set(1, "user")
+        assert user_cache.get(1) == "user"
+
+        # as published by another worker
+        await redis_connection.redis.publish(cache_bus.channel, "user:1")
+
+        async def evicted():
+            return user_cache.get(1) is None
+
+        assert await eventually(evicted)
+    finally:
+        await cache_bus.stop()
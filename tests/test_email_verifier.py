@@ -0,0 +1,57 @@
+import asyncio
+from time import monotonic
+
+import pytest
+
+from app.utils.email_verifier import (
+    CircuitBreaker,
+    EmailVerifier,
+    VerifierUnavailable,
+)
+
+
+@pytest.fixture
+def verifier() -> EmailVerifier:
+    # a single slot, held by the tests, so no call reaches the network
+    return EmailVerifier(
+        url="http://127.0.0.1:1/v2/email-verifier",
+        api_key="",
+        timeout=0.05,
+        max_connections=1,
+        max_concurrency=1,
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30),
+        cache_ttl=60,
+        invalid_cache_ttl=60,
+    )
+
+
+def open_for_trial(breaker: CircuitBreaker) -> None:
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = monotonic() - breaker.reset_timeout
+
+
+@pytest.mark.asyncio
+async def test_saturation_does_not_trip_the_breaker(verifier):
+    await verifier.semaphore.acquire()
+
+    with pytest.raises(VerifierUnavailable):
+        await verifier.request("user@test.com")
+
+    assert verifier.breaker.failures == 0
+    assert verifier.breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_trial_lets_the_next_call_try(verifier):
+    await verifier.semaphore.acquire()
+    open_for_trial(verifier.breaker)
+
+    trial = asyncio.create_task(verifier.request("user@test.com"))
+    await asyncio.sleep(0)
+    assert verifier.breaker.trial
+
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+
+    assert verifier.breaker.allow()
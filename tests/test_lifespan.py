@@ -0,0 +1,32 @@
+import pytest
+from httpx import AsyncClient
+
+from app.core.config import settings
+from app.db.pool import engine_pool_stats
+from app.db.redis import redis
+from app.db.session import async_engine
+from app.main import app
+
+
+@pytest.mark.asyncio
+async def test_ready_once_pools_are_warm(ac: AsyncClient):
+    response = await ac.get("internal/ready")
+    assert response.status_code == 503
+
+    await app.router.startup()
+    try:
+        response = await ac.get("internal/ready")
+        assert response.json() == {"ready": True}
+
+        db_pool = engine_pool_stats(async_engine)
+        redis_pool = redis.redis.connection_pool.stats()
+        assert db_pool["checked_in"] == min(
+            settings.DB_POOL_PREWARM, settings.DB_POOL_SIZE
+        )
+        assert redis_pool["connections"] >= settings.REDIS_POOL_PREWARM
+    finally:
+        await app.router.shutdown()
+
+    response = await ac.get("internal/ready")
+    assert response.status_code == 503
+    assert engine_pool_stats(async_engine)["checked_in"] == 0
@@ -0,0 +1,35 @@
+import random
+
+from benchmarks.load import Zipf, compare, percentile
+
+
+def test_zipf_favours_low_ranks():
+    zipf = Zipf(100, 1.1)
+    rng = random.Random(0)
+    picks = [zipf.sample(rng) for _ in range(10000)]
+
+    assert min(picks) == 0 and max(picks) < 100
+    assert picks.count(0) > picks.count(1) > picks.count(10)
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.99) == 0.0
+
+
+def test_compare_reports_regressions():
+    def report(throughput, p95, error_rate=0.0):
+        return {
+            "total": {"throughput": throughput},
+            "operations": {
+                "get_post": {"p95": p95, "error_rate": error_rate}
+            },
+        }
+
+    baseline = report(100, 10.0)
+
+    assert compare(report(95, 10.5), baseline, 0.1) == []
+    assert len(compare(report(80, 12.0, 0.05), baseline, 0.1)) == 3
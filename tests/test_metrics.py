@@ -0,0 +1,73 @@
+import pytest
+from httpx import AsyncClient
+
+from app.core.metrics import Counter, Histogram, render
+from app.db_models.post import PostModel
+from app.db_models.user import UserModel
+from app.utils.jwt import create_access_token
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency", "Latency.", ("handler",), (0.1, 1.0))
+    histogram.observe(("get_post",), 0.05)
+    histogram.observe(("get_post",), 0.5)
+    histogram.observe(("get_post",), 5)
+
+    assert histogram.render()[2:] == [
+        'latency_bucket{handler="get_post",le="0.1"} 1',
+        'latency_bucket{handler="get_post",le="1.0"} 2',
+        'latency_bucket{handler="get_post",le="+Inf"} 3',
+        'latency_sum{handler="get_post"} 5.55',
+        'latency_count{handler="get_post"} 3',
+    ]
+
+
+def test_counter_escapes_labels():
+    counter = Counter("hits", "Hits.", ("handler",))
+    counter.inc(('say "hi"',), 2)
+
+    assert counter.render()[2:] == ['hits{handler="say \\"hi\\""} 2']
+
+
+def sample(text: str, line_start: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+@pytest.mark.asyncio
+async def test_requests_record_db_and_redis_work(
+    ac: AsyncClient, session, test_user, redis_connection
+):
+    author = await UserModel.create(
+        session, username="author", password="", email="author@mail.com"
+    )
+    post = await PostModel.create(session, author.id, "hello")
+    token = create_access_token(data={"user_id": test_user.id})
+    before = render()
+
+    response = await ac.post(
+        f"post/{post.id}/like", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+
+    response = await ac.get("http://127.0.0.1:8000/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    labels = '{handler="like_post"}'
+    for name in (
+        "http_request_db_statements_total",
+        "http_request_redis_commands_total",
+    ):
+        assert sample(response.text, name + labels) > sample(
+            before, name + labels
+        )
+    assert sample(
+        response.text,
+        'http_requests_total{handler="like_post",method="POST",status="200"}',
+    ) == sample(
+        before,
+        'http_requests_total{handler="like_post",method="POST",status="200"}',
+    ) + 1
@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+from benchmarks.micro import compare, measure
+
+
+@pytest.mark.asyncio
+async def test_measure_times_sync_and_async_calls():
+    calls = []
+
+    async def op():
+        calls.append(1)
+        await asyncio.sleep(0)
+
+    seconds = await measure(op, min_time=0.01, repeat=3)
+
+    assert 0 < seconds < 0.01
+    assert len(calls) > 3
+    assert await measure(lambda: None, min_time=0.01, repeat=2) < 0.001
+
+
+def test_compare_flags_slower_calls_only():
+    baselines = {"fast": 1.0, "slow": 1.0}
+    results = {"fast": 1.2, "slow": 1.3, "new": 5.0}
+
+    assert compare(results, baselines, 0.25) == ["slow"]
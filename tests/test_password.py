@@ -0,0 +1,52 @@
+import pytest
+
+from app.utils.password import (
+    get_hasher,
+    get_password_hash,
+    hashers,
+    needs_rehash,
+    verify_password,
+)
+
+
+@pytest.mark.asyncio
+async def test_hashes_are_verified_by_their_scheme():
+    legacy_hash = hashers["hmac"].hash("password")
+    current_hash = await get_password_hash("password")
+
+    assert get_hasher(legacy_hash) is hashers["hmac"]
+    assert get_hasher(current_hash) is hashers["bcrypt"]
+
+    for hashed_password in (legacy_hash, current_hash):
+        assert await verify_password("password", hashed_password)
+        assert not await verify_password("wrong", hashed_password)
+
+
+def test_weaker_hashes_need_rehash():
+    bcrypt_hasher = hashers["bcrypt"]
+
+    hashed_password = bcrypt_hasher.hash("password")
+
+    assert needs_rehash(hashers["hmac"].hash("password"))
+    assert not needs_rehash(hashed_password)
+
+    bcrypt_hasher.rounds += 1
+    try:
+        assert needs_rehash(hashed_password)
+    finally:
+        bcrypt_hasher.rounds -= 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_and_foreign_hashes():
+    current_hash = await get_password_hash("password")
+
+    # $2a$ and $2y$ hashes of other bcrypt implementations
+    for prefix in ("$2a$", "$2y$"):
+        foreign_hash = current_hash.replace("$2b$", prefix, 1)
+        assert get_hasher(foreign_hash) is hashers["bcrypt"]
+        assert await verify_password("password", foreign_hash)
+
+    for hashed_password in ("", "$argon2id$v=19$...", "$2b$xx$corrupt"):
+        assert not await verify_password("password", hashed_password)
+        assert needs_rehash(hashed_password)
@@ -0,0 +1,124 @@
+import pytest
+
+from app.core.config import settings
+from app.db.redis import (
+    dislike_users_key,
+    dislikes_key,
+    like_users_key,
+    likes_key,
+    redis,
+)
+from app.db.session import AsyncSessionLocal
+from app.db_models.post import PostModel, ReactionModel
+from app.db_models.user import UserModel
+from app.workers.counters import (
+    CounterAuditor,
+    read_redis_counts,
+    rebuild_counters,
+)
+
+
+@pytest.fixture
+async def posts_and_users(redis_connection):
+    # committed, the rebuild and the auditor use sessions of their own
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            users = [
+                await UserModel.create(
+                    session,
+                    username=f"user{i}",
+                    password="",
+                    email=f"user{i}@mail.com",
+                )
+                for i in range(3)
+            ]
+            posts = [
+                await PostModel.create(session, users[0].id, f"post {i}")
+                for i in range(3)
+            ]
+            await ReactionModel.apply_batch(
+                session,
+                {
+                    (posts[0].id, users[1].id): ReactionModel.LIKE,
+                    (posts[0].id, users[2].id): ReactionModel.LIKE,
+                    (posts[1].id, users[1].id): ReactionModel.DISLIKE,
+                },
+            )
+    return posts, users
+
+
+@pytest.mark.asyncio
+async def test_rebuild_counters(posts_and_users):
+    (liked, disliked, untouched), (_, first, second) = posts_and_users
+    # drifted counters, and leftovers of a post without reactions
+    await redis.redis.set(likes_key(liked.id), 5)
+    await redis.redis.set(dislikes_key(disliked.id), -1)
+    await redis.redis.set(likes_key(untouched.id), 1)
+    await redis.redis.sadd(like_users_key(untouched.id), first.id)
+
+    async with AsyncSessionLocal() as session:
+        assert await rebuild_counters(session, batch_size=2) == 3
+
+    assert await read_redis_counts([liked.id, disliked.id, untouched.id]) == {
+        liked.id: (2, 0, 2, 0),
+        disliked.id: (0, 1, 0, 1),
+        untouched.id: (0, 0, 0, 0),
+    }
+    assert await redis.redis.smembers(like_users_key(liked.id)) == {
+        str(first.id),
+        str(second.id),
+    }
+    assert await redis.redis.smembers(dislike_users_key(disliked.id)) == {
+        str(first.id)
+    }
+
+
+@pytest.mark.asyncio
+async def test_auditor_repairs_drifted_counters(posts_and_users):
+    (liked, disliked, untouched), _ = posts_and_users
+    async with AsyncSessionLocal() as session:
+        await rebuild_counters(session, batch_size=100)
+    await redis.redis.incr(likes_key(liked.id))
+
+    auditor = CounterAuditor(sample_size=3, interval=60)
+    assert await auditor.audit(start=liked.id) == [liked.id]
+    assert (await read_redis_counts([liked.id]))[liked.id] == (2, 0, 2, 0)
+
+    assert await auditor.audit(start=liked.id) == []
+    assert auditor.stats()["drift_rate"] == 1 / 6
+
+
+@pytest.mark.asyncio
+async def test_one_auditor_holds_the_lease(redis_connection):
+    first = CounterAuditor(sample_size=10, interval=60)
+    second = CounterAuditor(sample_size=10, interval=60)
+
+    assert await first.acquire()
+    assert not await second.acquire()
+    await first.release()
+    assert await second.acquire()
+
+
+@pytest.mark.asyncio
+async def test_auditor_repairs_string_member_keys(posts_and_users):
+    (liked, _, _), (_, first, _) = posts_and_users
+    async with AsyncSessionLocal() as session:
+        await rebuild_counters(session, batch_size=100)
+    # as stored by the versions before the reaction script
+    await redis.redis.delete(like_users_key(liked.id))
+    await redis.redis.set(like_users_key(liked.id), first.id)
+
+    auditor = CounterAuditor(sample_size=1, interval=60)
+    assert await auditor.audit(start=liked.id) == [liked.id]
+    assert (await read_redis_counts([liked.id]))[liked.id] == (2, 0, 2, 0)
+
+
+@pytest.mark.asyncio
+async def test_auditor_skips_while_write_behind_lags(posts_and_users):
+    await redis.redis.xadd(
+        settings.REACTIONS_STREAM, {"post_id": 1, "user_id": 1, "value": 1}
+    )
+
+    auditor = CounterAuditor(sample_size=10, interval=60)
+    assert await auditor.audit() is None
+    assert auditor.stats()["skipped"] == 1
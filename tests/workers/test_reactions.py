@@ -0,0 +1,157 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.redis import redis
+from app.db.session import AsyncSessionLocal
+from app.db_models.post import PostModel, ReactionModel
+from app.db_models.user import UserModel
+from app.utils.jwt import create_access_token
+from app.workers.reactions import GROUP, LeaseLost, ReactionFlusher
+
+
+@pytest.fixture
+def write_behind(monkeypatch, redis_connection):
+    monkeypatch.setattr(settings, "REACTIONS_WRITE_BEHIND", True)
+
+
+@pytest.fixture
+async def flusher(write_behind):
+    flusher = ReactionFlusher(
+        settings.REACTIONS_STREAM, batch_size=100, interval=0.05, lease=5
+    )
+    await flusher.create_group()
+    return flusher
+
+
+@pytest.fixture
+async def post_and_users():
+    # committed, the flusher works on its own sessions
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            users = [
+                await UserModel.create(
+                    session,
+                    username=f"user{i}",
+                    password="",
+                    email=f"user{i}@mail.com",
+                )
+                for i in range(4)
+            ]
+            post = await PostModel.create(session, users[0].id, "hello")
+    return post, users
+
+
+def auth(user) -> dict:
+    token = create_access_token(data={"user_id": user.id})
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def stored(post_id: int):
+    async with AsyncSessionLocal() as session:
+        post = await session.get(PostModel, post_id)
+        reactions = (
+            await session.execute(
+                select(ReactionModel.user_id, ReactionModel.value).where(
+                    ReactionModel.post_id == post_id
+                )
+            )
+        ).all()
+    return (post.like_count, post.dislike_count), set(map(tuple, reactions))
+
+
+@pytest.mark.asyncio
+async def test_reactions_are_flushed_in_batches(
+    ac: AsyncClient, flusher, post_and_users
+):
+    post, (owner, liker, disliker, fickle) = post_and_users
+
+    for path, user in (
+        ("like", liker),
+        ("dislike", disliker),
+        ("like", fickle),
+        ("unlike", fickle),
+    ):
+        method = ac.delete if path.startswith("un") else ac.post
+        response = await method(f"post/{post.id}/{path}", headers=auth(user))
+        assert response.status_code == 200
+
+    response = await ac.post(f"post/{post.id}/like", headers=auth(liker))
+    assert response.json()["detail"] == "You have already liked this post"
+    response = await ac.post(f"post/{post.id}/like", headers=auth(owner))
+    assert response.json()["detail"] == "User can not like his own post"
+    response = await ac.post(f"post/{post.id + 1}/like", headers=auth(liker))
+    assert response.status_code == 404
+
+    # served from Redis right away, Postgres catches up with the flusher
+    response = await ac.get(f"post/{post.id}")
+    assert (response.json()["likes"], response.json()["dislikes"]) == (1, 1)
+    assert await stored(post.id) == ((0, 0), set())
+    assert (await flusher.lag())["entries"] == 4
+
+    assert await flusher.run_once() == 4
+
+    expected = ((1, 1), {(liker.id, 1), (disliker.id, -1)})
+    assert await stored(post.id) == expected
+    assert await flusher.lag() == {"entries": 0, "seconds": 0.0}
+    assert await flusher.run_once() == 0
+
+    # replaying a batch changes nothing
+    await flusher.flush(
+        [
+            ("0-1", {"post_id": post.id, "user_id": liker.id, "value": 1}),
+            ("0-2", {"post_id": post.id, "user_id": fickle.id, "value": 0}),
+        ]
+    )
+    assert await stored(post.id) == expected
+
+
+@pytest.mark.asyncio
+async def test_entries_of_a_dead_flusher_are_claimed(
+    ac: AsyncClient, flusher, post_and_users
+):
+    post, (_, liker, *_) = post_and_users
+    response = await ac.post(f"post/{post.id}/like", headers=auth(liker))
+    assert response.status_code == 200
+
+    # read by the lease holder, which died before acknowledging
+    assert await flusher.acquire()
+    await redis.redis.xreadgroup(
+        GROUP, "dead", {settings.REACTIONS_STREAM: ">"}, count=10
+    )
+    other = ReactionFlusher(
+        settings.REACTIONS_STREAM, batch_size=100, interval=0.05, lease=5
+    )
+    assert await other.run_once() is None
+
+    # the lease expired
+    await redis.redis.delete(flusher.lease_key)
+    assert await other.run_once() == 1
+    assert await stored(post.id) == ((1, 0), {(liker.id, 1)})
+    assert (await redis.redis.xpending(settings.REACTIONS_STREAM, GROUP))[
+        "pending"
+    ] == 0
+
+
+@pytest.mark.asyncio
+async def test_stalled_flusher_can_not_overwrite_newer_batches(
+    ac: AsyncClient, flusher, post_and_users
+):
+    post, (_, liker, *_) = post_and_users
+    assert await flusher.acquire()
+    # an unlike the flusher read, then it stalled past its lease
+    stale = [("0-1", {"post_id": post.id, "user_id": liker.id, "value": 0})]
+    await redis.redis.delete(flusher.lease_key)
+
+    response = await ac.post(f"post/{post.id}/like", headers=auth(liker))
+    assert response.status_code == 200
+    other = ReactionFlusher(
+        settings.REACTIONS_STREAM, batch_size=100, interval=0.05, lease=5
+    )
+    assert await other.run_once() == 1
+
+    with pytest.raises(LeaseLost):
+        await flusher.flush(stale)
+    assert await stored(post.id) == ((1, 0), {(liker.id, 1)})
+    assert await flusher.run_once() is None
@@ -0,0 +1,74 @@
+import pytest
+
+from app.core.config import settings
+from app.db.redis import (
+    LIKE,
+    UNLIKE,
+    redis,
+    trending_epoch_key,
+    trending_key,
+)
+from app.workers.trending import TrendingMaintainer
+
+HOUR = 60 * 60
+
+
+@pytest.fixture
+def maintainer(redis_connection):
+    return TrendingMaintainer({"hour": HOUR}, max_posts=2, interval=60)
+
+
+async def scores():
+    return dict(
+        await redis.redis.zrevrange(
+            trending_key("hour"), 0, -1, withscores=True
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_maintenance_rebases_and_trims(maintainer):
+    await redis.redis.set(trending_epoch_key("hour"), 1000)
+    await redis.redis.zadd(
+        trending_key("hour"), {"1": 8, "2": 4, "3": 2, "4": -1}
+    )
+
+    assert await maintainer.maintain(now=1000 + 2 * HOUR) == {"hour": 2}
+
+    # two half-lives later, the best two posts count a quarter
+    assert await scores() == {"1": 2, "2": 1}
+    assert await redis.redis.get(trending_epoch_key("hour")) == str(
+        1000 + 2 * HOUR
+    )
+
+
+@pytest.mark.asyncio
+async def test_maintenance_drops_decayed_posts(maintainer):
+    await redis.redis.set(trending_epoch_key("hour"), 1000)
+    await redis.redis.zadd(trending_key("hour"), {"1": 0.015, "2": 0.012})
+
+    # half a half-life on, 0.012 as of the epoch is less than 0.01 now
+    assert await maintainer.maintain(now=1000 + HOUR / 2) == {"hour": 1}
+    assert list(await scores()) == ["1"]
+
+
+@pytest.mark.asyncio
+async def test_stale_epoch_keeps_scores_finite(maintainer, monkeypatch):
+    monkeypatch.setattr(settings, "TRENDING_HALF_LIVES", {"hour": HOUR})
+    # the worker stopped for days, an unbounded weight stored inf
+    await redis.redis.set(trending_epoch_key("hour"), 1000)
+    await redis.redis.zadd(trending_key("hour"), {"1": float("inf")})
+
+    now = 1000 + 1000 * HOUR
+    for transition in (LIKE, UNLIKE, LIKE):
+        changed, _, _ = await redis.react(2, 7, transition, now=now)
+        assert changed
+
+    # rebased by the reaction, the stale inf dropped
+    assert await scores() == {"2": 1}
+    assert await redis.redis.get(trending_epoch_key("hour")) == str(now)
+
+    await redis.redis.set(trending_epoch_key("hour"), 1000)
+    await redis.redis.zadd(trending_key("hour"), {"1": float("inf")})
+    assert await maintainer.maintain(now=now) == {"hour": 0}
+    assert await redis.redis.get(trending_epoch_key("hour")) == str(now)